@@ -5,16 +5,15 @@
 
 
 # Imports
+import argparse
 import sys
 
-# Local modules and packages
-from backend import appWindow as gui
-
 
 
 def main():
-   # A quick print environment test
-   print("Does anything even work?")
+
+   # Imported here, so that the worker processes of the compute pool, which import this module, don't load the GUI
+   from backend import appWindow as gui
 
    app = gui.QApplication(sys.argv)
 
@@ -27,5 +26,50 @@ def main():
    # that ceases the application when We exit the loop
    sys.exit(app.exec())
 
+
+# Analyses directories of recordings without the GUI, e.g. app.py batch recordings/ --output results/
+def batch(arguments):
+
+   from backend.logic import batchAnalysis
+   from backend.logic.spectrogramEngine import WINDOW_FUNCTIONS, SPECTROGRAM_BANDS, PRECISIONS, DEFAULT_WINDOW_OVERLAP_PERCENTAGE, DEFAULT_DYNAMIC_RANGE, getRequestedPrecision
+
+   parser = argparse.ArgumentParser(prog="app.py batch", description="Calculates the waveform envelope, spectrogram and spectral distribution of many files")
+   parser.add_argument("paths", nargs="+", help="directories, files or glob patterns of the WAV files")
+   parser.add_argument("--output", required=True, help="directory of the results, the directories of the inputs are kept below it")
+   parser.add_argument("--format", nargs="+", choices=batchAnalysis.OUTPUT_FORMATS, default=batchAnalysis.DEFAULT_OUTPUT_FORMATS, help="npy writes the power of every frame, also of files over the frame budget, without holding them in memory")
+   parser.add_argument("--window-function", choices=WINDOW_FUNCTIONS, default=WINDOW_FUNCTIONS[0])
+   parser.add_argument("--band", choices=SPECTROGRAM_BANDS, default=SPECTROGRAM_BANDS[0])
+   parser.add_argument("--overlap", type=int, default=DEFAULT_WINDOW_OVERLAP_PERCENTAGE, help="window overlap in percent, as the slider of the GUI")
+   parser.add_argument("--precision", choices=PRECISIONS, default=getRequestedPrecision(), help="floating point type of the frames")
+   parser.add_argument("--dynamic-range", type=float, default=DEFAULT_DYNAMIC_RANGE, help="decibels below the loudest bin the spectrogram reaches")
+   parser.add_argument("--frame-budget", type=float, help="MB the frames of one spectrogram may take, longer files get a spectrogram of fewer frames")
+   parser.add_argument("--envelope-bins", type=int, default=batchAnalysis.DEFAULT_ENVELOPE_BINS)
+   parser.add_argument("--workers", type=int, help="worker processes, the amount of cores by default")
+   parser.add_argument("--skip-existing", action="store_true", help="skips the files whose outputs exist, e.g. to resume an interrupted batch")
+   parser.add_argument("--report", help="JSON file of the per file timings")
+
+   options = parser.parse_args(arguments)
+
+   if options.overlap <= 0 or options.overlap > 100:
+      parser.error("the overlap has to be above 0 and at most 100 percent")
+   if options.frame_budget != None and options.frame_budget <= 0:
+      parser.error("the frame budget has to be positive")
+
+   files = batchAnalysis.findFiles(options.paths)
+   if not files:
+      parser.error("no WAV files found")
+
+   parameters = batchAnalysis.createParameters(options.window_function, options.band, options.overlap, options.precision, options.dynamic_range, options.frame_budget)
+   results = batchAnalysis.runBatch(files, options.output, parameters, options.format, options.workers, options.envelope_bins, options.skip_existing)
+
+   if options.report:
+      batchAnalysis.writeReport(options.report, results, parameters, options.format)
+
+   return 1 if any("error" in result for result in results) else 0
+
+
 if __name__ == "__main__":
-    main()
+   if sys.argv[1:2] == ["batch"]:
+      sys.exit(batch(sys.argv[2:]))
+   else:
+      main()
@@ -1,2 +1,11 @@
-from .window import appWindow
-from .logic import appLogic
+from .logic import spectrogramEngine
+
+# The Qt modules are loaded on first use, so that the engine can run headless
+def __getattr__(name):
+   if name == "appWindow":
+      from .window import appWindow
+      return appWindow
+   elif name == "appLogic":
+      from .logic import appLogic
+      return appLogic
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
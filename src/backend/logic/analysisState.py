@@ -0,0 +1,99 @@
+
+#############################################################################
+# Immutable records of the analysed data and of the analysis parameters.    #
+# A change creates a new record and swaps the reference, so a reader that   #
+# took the current one keeps a consistent set of values without any lock    #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import collections
+
+import numpy as np
+
+
+
+# The loaded samples and what is known about them, None fields until something is loaded
+FileState = collections.namedtuple("FileState", [
+   # Identifies the data in the caches, changes when the file does
+   "identity",
+   # Name of the file, None for recorded or passed in data
+   "name",
+   # Either (samples,) or (samples, channels), in the native dtype of the file
+   "data",
+   # Whether data is a memory map of the file instead of a copy in RAM
+   "memoryMapped",
+   "samplingFrequency",
+   # Length of the file in samples
+   "sampleCount",
+   # Per channel views of the data
+   "channels"
+])
+
+
+# Everything the calculations depend on besides the samples. The window lengths, the
+# overlap in samples and the FFT length are derived from the other fields, see spectrogramEngine.deriveState
+AnalysisState = collections.namedtuple("AnalysisState", [
+   "file",
+   "windowFunction",
+   "spectrogramBand",
+   "overlapPercentage",
+   # Whether the frames are zero padded to an FFT length that is fast to calculate
+   "fftPadding",
+   # Floating point type of the frames, one of spectrogramEngine.PRECISIONS
+   "precision",
+   # Decibels below the loudest bin the spectrogram reaches, None for no limit
+   "dynamicRange",
+   # [first sample, last sample) of the segment
+   "firstSample",
+   "lastSample",
+   # Window lengths (in samples) of both bands
+   "narrowWindow",
+   "wideWindow",
+   # Window length and overlap actually used for the calculations
+   "windowLength",
+   "windowOverlap",
+   # Length of the FFT of a frame, the window length unless it is padded
+   "fftLength"
+])
+
+
+
+# Fraction of a sample period below which a time counts as the time of the sample
+SAMPLE_TOLERANCE = 1e-6
+
+
+# Time of every sample without an array of them, sample i lies at offset + i / samplingFrequency seconds
+TimeAxis = collections.namedtuple("TimeAxis", ["samplingFrequency", "sampleCount", "offset"])
+
+
+
+# Record of nothing loaded
+def createEmptyFileState():
+   return FileState(None, None, None, False, None, None, ())
+
+
+def isLoaded(state):
+   return state.file.data is not None
+
+
+# Time axis of the samples of a file, starting at 0
+def createTimeAxis(file):
+   return TimeAxis(file.samplingFrequency, file.sampleCount, 0.0)
+
+
+# Index of the first sample at or after every given time, clipped to [0, sample count],
+# the same as searchsorted over the times of the samples gives, in constant time
+def getSampleIndex(timeAxis, time):
+   # The time of a sample converted back may land a rounding error past it
+   index = np.ceil((np.asarray(time, dtype=np.float64) - timeAxis.offset) * timeAxis.samplingFrequency - SAMPLE_TOLERANCE)
+   return np.clip(index, 0, timeAxis.sampleCount).astype(np.int64)
+
+
+# Time of the samples of the given indexes
+def getSampleTime(timeAxis, index):
+   return timeAxis.offset + np.asarray(index) / timeAxis.samplingFrequency
@@ -1,7 +1,7 @@
 
 #############################################################################
-# The backend of the spectrogram app, containing all of the needed maths    #
-# and modules that are neccessary to give the signal analysis functionality #
+# The backend of the spectrogram app, adapts the headless spectrogram       #
+# engine to Qt signals so that the GUI can use it from its backend thread   #
 #############################################################################
 
 
@@ -10,26 +10,62 @@
 ###########
 
 
-# For plot data creation and storage
-import scipy.io.wavfile as wavfile
-from scipy import signal
+# For the signal payloads
 import numpy as np
 
-# Audio playback and recording
-import simpleaudio as sa
+# Audio recording
 import sounddevice as sd
 
 # Threading support
-from PyQt5.QtCore import pyqtSignal, QObject, QMutex
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QTimer, Qt
 
-# For the sleep timer
-import time
+# The Qt independent maths
+from .spectrogramEngine import SpectrogramEngine, CalculationCancelled, FrameBudgetExceeded, convertToDecibels, DEFAULT_DYNAMIC_RANGE, calculateWindowParameters, calculateFftLength, getWindowBank, WINDOW_FUNCTIONS, SPECTROGRAM_BANDS, DEFAULT_WINDOW_OVERLAP_PERCENTAGE
+
+# Optional worker processes for the FFT
+from .processPool import ProcessPool, getRequestedWorkers
+
+# Frames and envelopes kept between the runs
+from .diskCache import createDiskCache
+from .analysisState import isLoaded
+
+# Live recording
+from .ringBuffer import RingBuffer
+from .liveSpectrogram import LiveSpectrogram
+
+# Streaming playback
+from .playbackEngine import PlaybackEngine
+
+# Immutable results handed to the GUI
+from .dataSnapshot import DataSnapshot
+
+# Timing of the stages
+from .stageTracer import TRACER
 
 # Miscelanous
 import math
 
 
 
+#######################
+# Recording constants #
+#######################
+
+
+# Samples delivered by one call of the input stream callback, 10 ms
+RECORDING_BLOCK_SIZE = 441
+
+# How often the recorded samples are taken from the ring buffer, in ms
+RECORDING_POLL_INTERVAL = 30
+
+# How much audio the ring buffer holds, in seconds
+RECORDING_BUFFER_DURATION = 10
+
+# Samples per point of the live waveform
+LIVE_WAVEFORM_BLOCK = 441
+
+
+
 ################################################################
 # Main logic object class, created as a singleton just in case #
 ################################################################
@@ -37,9 +73,6 @@ import math
 
 class appLogic(QObject):
 
-   # self.mutex object for securing the critical data
-   mutex = QMutex()
-
    # Those are signals to be emitted from the main section. Here they will be captured
    set_filename = pyqtSignal(str)
    set_window_function = pyqtSignal(int)
@@ -62,6 +95,7 @@ class appLogic(QObject):
    get_file_saved_status = pyqtSignal()
    get_mono_status = pyqtSignal()
    get_stereo_status = pyqtSignal()
+   get_channel_count = pyqtSignal()
 
    send_window_function_list = pyqtSignal(list)
    send_spectrogram_bands_list = pyqtSignal(list)
@@ -70,24 +104,37 @@ class appLogic(QObject):
    send_file_name = pyqtSignal(str)
    send_file_segment = pyqtSignal(list)
    send_overlap_percentage = pyqtSignal(int)
-   send_file_data = pyqtSignal(np.ndarray)
-   send_time_data = pyqtSignal(np.ndarray)
-   send_channel_data = pyqtSignal(list)
+   send_file_data = pyqtSignal(object)
+   send_time_data = pyqtSignal(object)
+   send_channel_data = pyqtSignal(object)
    send_file_status = pyqtSignal(bool)
    send_file_saved_status = pyqtSignal(bool)
    send_mono_status = pyqtSignal(bool)
    send_stereo_status = pyqtSignal(bool)
+   send_channel_count = pyqtSignal(int)
    send_playback_status = pyqtSignal(bool)
 
-   send_freq_response_data = pyqtSignal(list)
-   send_spectrogram_data = pyqtSignal(list)
-   send_spectral_distribution_data = pyqtSignal(list)
+   # The results are sent as DataSnapshot objects
+   send_freq_response_data = pyqtSignal(object)
+   send_spectrogram_data = pyqtSignal(object)
+   send_spectral_distribution_data = pyqtSignal(object)
+
+   # Messages for the status bar, e.g. a calculation reduced or refused by the frame budget
+   send_status_message = pyqtSignal(str)
+
+   # Live recording, the layout of the data when it starts, then [frames in dB, envelope] of the new samples
+   send_live_recording_started = pyqtSignal(list)
+   send_live_data = pyqtSignal(list)
+   send_recording_finished = pyqtSignal()
 
    play_audio = pyqtSignal()
    pause_audio = pyqtSignal()
    stop_audio = pyqtSignal()
    playback_status = pyqtSignal()
+   seek_audio = pyqtSignal(float)
+   skip_audio = pyqtSignal(float)
    record_file = pyqtSignal()
+   stop_recording = pyqtSignal()
    recording_length_dialog = pyqtSignal()
    recording_length = pyqtSignal(int)
 
@@ -102,6 +149,10 @@ class appLogic(QObject):
    prepare_spectrogram_data = pyqtSignal()
    prepare_spectral_dist_data = pyqtSignal()
 
+   # Coalesced jobs of the compute scheduler, finishing passes back the abandoned calculations
+   run_job = pyqtSignal(dict)
+   job_finished = pyqtSignal(list)
+
    # Creates a new instance of the class
    def __new__(object):
       if not hasattr(object, 'instance'):
@@ -136,31 +187,48 @@ class appLogic(QObject):
       self.get_file_saved_status.connect(self.getFileSavedStatus)
       self.get_mono_status.connect(self.getMonoStatus)
       self.get_stereo_status.connect(self.getStereoStatus)
+      self.get_channel_count.connect(self.getChannelCount)
 
       self.create_file.connect(self.createFile)
-      self.open_file.connect(self.openFile)
       self.save_file.connect(self.saveFile)
-      self.close_file.connect(self.closeFile)
+
+      # Opening and closing run in the backend thread between the jobs, never next to one. The GUI waits for them,
+      # it continues with the opened file right after the emit
+      self.open_file.connect(self.openFile, Qt.BlockingQueuedConnection)
+      self.close_file.connect(self.closeFile, Qt.BlockingQueuedConnection)
 
       self.play_audio.connect(self.playAudio)
       self.pause_audio.connect(self.pauseAudio)
       self.stop_audio.connect(self.stopAudio)
       self.playback_status.connect(self.playbackStatus)
+      self.seek_audio.connect(self.seekAudio)
+      self.skip_audio.connect(self.skipAudio)
       self.record_file.connect(self.recordFile)
+      self.stop_recording.connect(self.stopRecording)
       self.recording_length.connect(self.setRecordingLength)
 
       self.prepare_freq_response_data.connect(self.calculateFrequencyResponse)
       self.prepare_spectrogram_data.connect(self.calculateSpectrogram)
       self.prepare_spectral_dist_data.connect(self.calculateSpectralDistribution)
 
+      self.run_job.connect(self.runJob)
+
       ######################################
       # Defining needed runtime variables  #
       ######################################
 
       # Lists of selectable options
-      self.m_ListOfWindowFunctions = ["tukey", "triang", "flattop", "exponential"]
+      self.m_ListOfWindowFunctions = WINDOW_FUNCTIONS.copy()
       self.m_ListOfFilters = []
-      self.m_SpectrogramBand = ["narrow", "wide"]
+      self.m_SpectrogramBand = SPECTROGRAM_BANDS.copy()
+
+      # Headless engine doing all of the calculations, this object only adapts it to Qt.
+      # The file and the analysis parameters live in its immutable state record, which is swapped as a whole
+      # by every change, so nothing here needs a lock: readers take the current record and keep using it.
+      # With SPECTROAPP_COMPUTE_WORKERS above 1 the frames are calculated by that many worker processes.
+      # Reopened files reuse the frames and envelopes of earlier runs from the disk cache, SPECTROAPP_CACHE_MB=0 turns it off
+      computeWorkers = getRequestedWorkers()
+      self.m_Engine = SpectrogramEngine(computePool=ProcessPool(computeWorkers) if computeWorkers > 1 else None, diskCache=createDiskCache())
 
       ##################
       # File variables #
@@ -176,87 +244,49 @@ class appLogic(QObject):
       # Passed filename
       self.m_FileName = None
 
-      # File data
-      self.m_Data = None
-
-      # Sampling frequency of the file
-      self.m_SamplingFrequency = None
+      # Opened files are memory mapped instead of being read into RAM
+      self.mb_MemoryMapFiles = True
 
-      # Time segments array
-      self.m_TimeSegments = None
+      # Visible part of the waveform plot, (start in seconds, end in seconds, width in pixels)
+      # None shows the whole file
+      self.m_WaveformView = None
 
-      # Divided into first channel
-      self.m_Channel_1_Data = None
+      # Visible part of the spectrogram plot, (start in seconds, end in seconds, lowest frequency, highest frequency,
+      # width in pixels, height in pixels), the range relative to the segment and None where it covers the whole of it.
+      # Only the frames and bins the plot can show are calculated, None calculates every frame of the segment
+      self.m_SpectrogramView = None
 
-      # And the second channel if exists
-      self.m_Channel_2_Data = None
+      # Whether a spectrogram over the frame budget is calculated with fewer frames instead of being refused
+      self.mb_AdaptToFrameBudget = True
 
-      # Contains the length of the file in samples
-      self.m_FileSampleCount = None
-
-      # Contains the first sample of the segment, default = 0
-      self.m_FirstSelectedSample = None
-
-      # Contains the last sapmple of the segment, default = m_FileSampleCount
-      self.m_LastSelectedSample = None
-
-      ############################
-      # FFT properties variables #
-      ############################
-
-      # How wide is the window used by window function (in samples)
-      self.m_WindowLength = None
-
-      # The value of the narrowband spectrogram window length
-      self.m_NarrowWindow = None
-
-      # The value of the wideband spectrogram window length
-      self.m_WideWindow = None
-
-      # How much samples do the windows overlap 
-      self.m_WindowOverlap = None
+      # Width of the waveform plot used until the GUI passes its own
+      self.m_DefaultWaveformWidth = 2048
 
       # Default value equal to 10%
-      self.m_DefaultWindowOverlapPercentage = 10
-      self.m_CurrentWindowOverlapPercentage = None
+      self.m_DefaultWindowOverlapPercentage = DEFAULT_WINDOW_OVERLAP_PERCENTAGE
 
       #########################
       # Spectrogram variables #
       #########################
 
-      # Default window is set as the first item from the list
-      self.m_CurrentWindowFunction = self.m_ListOfWindowFunctions[0]
-
-      # Default spectrogram band
-      self.m_CurrentSpectrogramBand = self.m_SpectrogramBand[0]
-
-      # Numpy arrays containing sample frequency values
-      self.m_Freq_1 = None
-      self.m_Freq_2 = None
-
-      # Numpy arrays containing time segments for the spectrogram
-      self.m_Time_1 = None
-      self.m_Time_2 = None
-
-      # Numpy arrays containing spectrogram values
-      self.m_Spectrogram_1 = None
-      self.m_Spectrogram_2 = None
+      # [freq, time, spectrogram] of every channel of the latest spectrogram, replaced as a whole
+      self.m_ChannelSpectrograms = []
 
       #####################
       # For file creation #
       #####################
 
-      # I dont know what it means
-      self.m_Chunk = None
+      # Samples per block delivered by the input stream
+      self.m_Chunk = RECORDING_BLOCK_SIZE
 
       # The pyaudio module backend stuff
       self.m_SampleFormat = None
 
       # The amount of channels to record, either mono, or stereo
-      self.m_ChannelsToRecord = None
+      self.m_ChannelsToRecord = 2
 
       # Contains the sampling rate
-      self.m_RecordSamplingFrequency = None
+      self.m_RecordSamplingFrequency = 44100
 
       # Also dont know what it means
       self.m_SecondsStored = None
@@ -264,33 +294,45 @@ class appLogic(QObject):
       # Contains the audio interface that will be used for recording
       self.m_AudioInterface = None
 
+      # Callback driven input stream and the ring buffer it writes into
+      self.m_InputStream = None
+      self.m_RecordBuffer = None
+
+      # Drains the ring buffer while recording
+      self.m_RecordingTimer = None
+
+      # Incremental spectrogram of the recorded samples
+      self.m_LiveSpectrogram = None
+
+      # Samples taken out of the ring buffer so far
+      self.m_RecordedChunks = []
+      self.m_RecordedSampleCount = 0
+
       #################
       # File playback #
       #################
 
-      # Contains the audio playing object
-      self.m_PlayObject = None
+      # Streams the samples of the current file to the output device
+      self.m_Playback = PlaybackEngine()
+
+      ##############
+      # Scheduling #
+      ##############
+
+      # Generation of the newest job requested by the scheduler, a running job older than it is stale
+      self.m_RequestedGeneration = 0
+
+      # Generation of the job currently running
+      self.m_RunningGeneration = None
 
       #################
       # Boolean flags #
       #################
 
       # State of the file flags
-      self.mb_FileOpened = False
       self.mb_FileCreated = False
-      self.mb_SegmentSelected = False
       self.mb_FileSaved = False
-
-      # Opened file channel count flags
-      self.mb_MonoChannelHandled = False
-      self.mb_StereoChannelsHandled  = False
-
-      # FFT(Fast Fourier Transform) parameters flags
-      self.mb_WindowFunctionSelected = False
-      self.mb_OverlapSelected = False
-      self.mb_OverlapCalculated = False
-      self.mb_WindowLengthsCalculated = False
-      self.mb_SpectrogramBandSelected = False
+      self.mb_Recording = False
 
 
 ######################################################################################
@@ -306,9 +348,7 @@ class appLogic(QObject):
 
 
    def setRecordingLength(self, lenght=int):
-      self.mutex.lock()
       self.m_RecordingLength = lenght
-      self.mutex.unlock()
 
 
    # Changes the currently set window function
@@ -320,14 +360,7 @@ class appLogic(QObject):
       elif index > len(self.m_ListOfWindowFunctions):
          raise ValueError("The index is out of range of the window functions list")
       else:
-         self.mutex.lock()
-
-         self.m_CurrentWindowFunction = self.m_ListOfWindowFunctions[index]
-
-         # Activating the flag
-         self.mb_WindowFunctionSelected = True
-
-         self.mutex.unlock()
+         self.m_Engine.setWindowFunction(index)
 
 
    # Changes the currently set sepctrogram band mode
@@ -338,68 +371,58 @@ class appLogic(QObject):
       elif index != 0 and index !=1:
          raise ValueError("Index out of list range")
       else:
-         self.mutex.lock()
+         self.m_Engine.setSpectrogramBand(index)
 
-         self.m_CurrentSpectrogramBand = self.m_SpectrogramBand[index]
 
-         # Activating the flag
-         self.mb_SpectrogramBandSelected = True
+   # Resets the segment indexes to default values according to the file data
+   def setDefaultFileSegment(self):
+      if self.isFileOpened():
+         self.m_Engine.setDefaultFileSegment()
 
-         self.mutex.unlock()
 
+   # Sets the file segment after checking the safety statements
+   def setFileSegment(self, time):
 
-   # Resets the segment indexes to default values according to the file data
-   def setDefaultFileSegment(self):
+      if not self.isFileOpened():
+         raise RuntimeError("File hasn't been opened yet")
 
-      if self.mb_FileOpened:
+      # Falls back to the whole file if the segment is empty or shorter than the window
+      self.m_Engine.setFileSegment(time)
 
-         # Activating the flag
-         self.mb_SegmentSelected = True
 
-         # If the file has been opened - sets the range to the whole file
-         self.m_FirstSelectedSample = 0
-         self.m_LastSelectedSample = self.m_FileSampleCount
+   # Sets the visible part of the waveform plot, None resets it to the whole file
+   def setWaveformView(self, view=None):
 
+      if view != None and (len(view) != 3 or view[0] >= view[1] or view[2] <= 0):
+         raise ValueError("Incorrect waveform view")
 
-   # Sets the file segment after checking the safety statements
-   def setFileSegment(self, time):
+      self.m_WaveformView = None if view == None else tuple(view)
 
-      if type(time[0])!=int and type(time[1])!=int:
-         raise TypeError("Incorrect parameters")
-      elif time[0] > time[1] or (time[0] == 0 and time[1] == 0):
-         self.mutex.lock()
 
-         # Resets to default values
-         if self.mb_FileOpened:
-            self.setDefaultFileSegment()
-         else:
-            raise RuntimeError("File hasn't been opened yet")
+   # Sets the visible part and the pixel size of the spectrogram plot, None calculates every frame of the segment
+   def setSpectrogramView(self, view=None):
+
+      if view != None and (len(view) != 6 or view[4] <= 0 or view[5] <= 0):
+         raise ValueError("Incorrect spectrogram view")
+
+      self.m_SpectrogramView = None if view == None else tuple(view)
 
-         self.mutex.unlock()
-      else:
-         self.mutex.lock()
-         
-         # Activating the flag
-         self.mb_SegmentSelected = True
 
-         # Settting the values 
-         self.m_FirstSelectedSample = time[0]
-         self.m_LastSelectedSample = time[1]
+   # Sets the memory the frames of one calculation may take, in MB, and whether a spectrogram over it is reduced or refused
+   def setFrameBudget(self, megabytes, adapt=True):
 
-         # If the segment happens to be shorter than the window
-         if self.mb_WindowLengthsCalculated:
-            if (time[1] - time[0]) < self.m_WindowLength:
-               self.setDefaultFileSegment()
-         
-         self.mutex.unlock()
+      if type(megabytes) not in [int, float]:
+         raise TypeError("Incorrect type")
+      elif megabytes <= 0:
+         raise ValueError("The frame budget has to be positive")
+
+      self.m_Engine.setFrameBudget(int(megabytes * 2**20))
+      self.mb_AdaptToFrameBudget = adapt
 
 
    # Sets the default overlap value
    def setDefaulWindowOverlapPercentage(self):
-      self.mutex.lock()
-      self.m_CurrentWindowOverlapPercentage = self.m_DefaultWindowOverlapPercentage
-      self.mb_OverlapSelected = True
-      self.mutex.unlock()
+      self.m_Engine.setWindowOverlapPercentage(self.m_DefaultWindowOverlapPercentage)
 
 
    # Sets the overlap of the windows for the FFT calculations
@@ -411,19 +434,24 @@ class appLogic(QObject):
       elif type(percent)!=int:
          raise TypeError("Incorrect type")
       elif percent > 0 and percent <= 100:
-         self.mutex.lock()
-         self.m_CurrentWindowOverlapPercentage = percent
-         self.mb_OverlapSelected = True
-         self.mutex.unlock()
+         self.m_Engine.setWindowOverlapPercentage(percent)
       else:
          self.setDefaulWindowOverlapPercentage()
 
 
+   # Current file and analysis parameters, an immutable record
+   def getState(self):
+      return self.m_Engine.getState()
+
+
+   def isFileOpened(self):
+      return isLoaded(self.m_Engine.getState())
+
+
    # Returns the list of windows used in here
    def getWindowFunctionsList(self):
       
       # Emititng the signal with data
-      print("jezech")
       self.send_window_function_list.emit(self.m_ListOfWindowFunctions.copy())
 
       #return self.m_ListOfWindowFunctions
@@ -441,19 +469,23 @@ class appLogic(QObject):
    # Return currently used window function
    def getWindowFunction(self):
 
+      windowFunction = self.getState().windowFunction
+
       # Emititng the signal with data
-      self.send_window_function.emit(self.m_CurrentWindowFunction)
+      self.send_window_function.emit(windowFunction)
 
-      return self.m_CurrentWindowFunction
+      return windowFunction
 
    
    # Return currently used spectrogram type
    def getSpectrogramBand(self):
 
+      spectrogramBand = self.getState().spectrogramBand
+
       # Emititng the signal with data
-      self.send_spectrogram_band.emit(self.m_CurrentSpectrogramBand)
+      self.send_spectrogram_band.emit(spectrogramBand)
 
-      return self.m_CurrentSpectrogramBand
+      return spectrogramBand
 
    def getFileName(self):
 
@@ -466,16 +498,18 @@ class appLogic(QObject):
 
    # Returns a tuple of default range
    def getDefaultFileSegment(self):
-      return [0, self.m_FileSampleCount]
+      return [0, self.getState().file.sampleCount]
 
 
    # Return a tuple of currently selected range
    def getFileSegment(self):
 
+      state = self.getState()
+
       # Emititng the signal with data
-      self.send_file_segment.emit([self.m_FirstSelectedSample, self.m_LastSelectedSample])
+      self.send_file_segment.emit([state.firstSample, state.lastSample])
 
-      return [self.m_FirstSelectedSample, self.m_LastSelectedSample]
+      return [state.firstSample, state.lastSample]
 
 
    # Returns the default overlap value
@@ -488,70 +522,79 @@ class appLogic(QObject):
       # Emititng the signal with data
       self.send_overlap_percentage.emit(self.m_DefaultWindowOverlapPercentage)
       
-      return self.m_CurrentWindowOverlapPercentage
+      return self.getState().overlapPercentage
 
 
    def getFileData(self):
 
+      data = self.getState().file.data
+
       # Emititng the signal with data
-      self.send_file_data.emit(self.m_Data)
+      self.send_file_data.emit(self.createSnapshot("file", data))
 
-      return self.m_Data
+      return data
 
 
    def getFileTimeData(self):
 
+      timeAxis = self.getTimeAxis()
+
       # Emititng the signal with data
-      self.send_time_data.emit(self.m_TimeSegments)
+      self.send_time_data.emit(self.createSnapshot("time", timeAxis))
 
-      return self.m_TimeSegments
+      return timeAxis
 
    def getChannelData(self):
 
-      # Emititng the signal with data
-      self.send_channel_data.emit([[self.m_Freq_1, self.m_Time_1, self.m_Spectrogram_1], [self.m_Freq_2, self.m_Time_2, self.m_Spectrogram_2]])
+      channels = self.m_ChannelSpectrograms
+
+      # Emititng the signal with data, [freq, time, spectrogram] of every channel
+      self.send_channel_data.emit(self.createSnapshot("spectrogram", channels))
 
-      return [[self.m_Freq_1, self.m_Time_1, self.m_Spectrogram_1], [self.m_Freq_2, self.m_Time_2, self.m_Spectrogram_2]]
+      return channels
 
 
    def getFirstChannelData(self):
-      return self.m_Channel_1_Data
+      return self.getState().file.channels[0]
 
    
    def getFirstChannelTimeSegments(self):
-      return self.m_Time_1
+      return self.m_ChannelSpectrograms[0][1]
 
    
    def getFirstChannelFrequencySamples(self):
-      return self.m_Freq_1
+      return self.m_ChannelSpectrograms[0][0]
 
 
    def getFirstChannelSpectrogramData(self):
-      return self.m_Spectrogram_1
+      return self.m_ChannelSpectrograms[0][2]
 
 
    def getSecondChannelTimeSegments(self):
-      return self.m_Time_2
+      return self.m_ChannelSpectrograms[1][1]
 
    
    def getSecondChannelFrequencySamples(self):
-      return self.m_Freq_2
+      return self.m_ChannelSpectrograms[1][0]
 
 
    def getSecondChannelSpectrogramData(self):
-      return self.m_Spectrogram_2
+      return self.m_ChannelSpectrograms[1][2]
 
 
    def getSecondChannelData(self):
-      return self.m_Channel_2_Data
+      channels = self.getState().file.channels
+      return channels[1] if len(channels) > 1 else None
 
 
    def getFileStatus(self):
 
+      opened = self.isFileOpened()
+
       # Emititng the signal with data
-      self.send_file_status.emit(self.mb_FileOpened)
+      self.send_file_status.emit(opened)
 
-      return self.mb_FileOpened
+      return opened
 
 
    def getFileSavedStatus(self):
@@ -562,17 +605,34 @@ class appLogic(QObject):
 
    def getMonoStatus(self):
 
+      mono = self.isFileOpened() and self.getChannelCount(False) == 1
+
       # Emititng the signal with data
-      self.send_mono_status.emit(self.mb_MonoChannelHandled)
+      self.send_mono_status.emit(mono)
 
-      return self.mb_MonoChannelHandled
+      return mono
 
 
+   # Stereo stands for any file with more than one channel
    def getStereoStatus(self):
+
+      stereo = self.getChannelCount(False) > 1
+
       # Emititng the signal with data
-      self.send_stereo_status.emit(self.mb_StereoChannelsHandled)
+      self.send_stereo_status.emit(stereo)
+
+      return stereo
+
 
-      return self.mb_StereoChannelsHandled
+   def getChannelCount(self, emit=True):
+
+      channelCount = len(self.getState().file.channels)
+
+      # Emititng the signal with data
+      if emit:
+         self.send_channel_count.emit(channelCount)
+
+      return channelCount
 
    
 ##################################################################
@@ -589,6 +649,7 @@ class appLogic(QObject):
 
 
    # Opens and reads the file
+   @pyqtSlot(str)
    def openFile(self, filename=None):
 
       # Checking if the filename is correct
@@ -596,78 +657,28 @@ class appLogic(QObject):
          raise SyntaxError("Incorrect parameters")
       elif type(filename)!=str:
          raise TypeError("Incorrect parameters")
-      else:
-         self.mutex.lock()
-         # Setting the name of the currently active file
-         self.m_FileName = filename
-         self.mutex.unlock()
-         
-      try:
-         self.mutex.lock()
-         self.m_SamplingFrequency, self.m_Data = wavfile.read(self.m_FileName)
-         self.m_Data = self.m_Data.astype(np.int16)
-         self.mutex.unlock()
-      except:
-         raise RuntimeError("Could't open the file")
-      else:
-         self.mutex.lock()
-
-         # Getting the length of the file
-         self.m_FileSampleCount = len(self.m_Data)
 
-         # Setting the default file segment
-         self.setDefaultFileSegment()
+      # Reading and dividing the data is done by the engine, the file is memory mapped.
+      # The new state replaces the old one at once, with the segment set to the whole file
+      with TRACER.span("open_file"):
+         self.m_Engine.loadFile(filename, memoryMap=self.mb_MemoryMapFiles)
 
-         # Checking if the number of dimmensions of the array corresponds to stereo or mono audio data
-         if np.ndim(self.m_Data) > 1:
-            # Setting flags accordingly
-            self.mb_StereoChannelsHandled  = True
-            self.mb_MonoChannelHandled = False
-
-            # Dividing the data into channels
-            self.m_Channel_1_Data = self.m_Data[:,0]
-            self.m_Channel_2_Data = self.m_Data[:,1]
-         else:
-            # Setting flags accordingly
-            self.mb_MonoChannelHandled = True
-            self.mb_StereoChannelsHandled  = False
-
-            # Division of the data not needed
-            self.m_Channel_1_Data = self.m_Data
-
-         self.m_TimeSegments = np.linspace(0, len(self.m_Channel_1_Data)/self.m_SamplingFrequency, num=len(self.m_Channel_1_Data))
-
-         self.mutex.unlock()
-
-         # Activating the flag that informs about the opened file
-         self.mb_FileOpened = True
-
-         ###########################
-         # Calling setup functions #
-         ###########################
-
-         self.setSpectrogramBand()
-         self.setWindowFunction()
-         self.setDefaulWindowOverlapPercentage()
-
-         #####################################
-         # Calling the calculating functions #
-         #####################################
+      # Setting the name of the currently active file
+      self.m_FileName = filename
 
-         self.calculateSpectrogramParameters()
+      self.fileLoaded()
 
-         self.send_file_name.emit(self.m_FileName)
+      self.send_file_name.emit(self.m_FileName)
 
 
    # Writes to the current name if no name is present in the logic, raises an exception
    def saveFile(self):
       if self.m_FileName == None:
          raise RuntimeError("No filename selected")
-      elif self.mb_FileOpened == False:
+      elif not self.isFileOpened():
          raise RuntimeError("File not opened")
       
       self.mb_FileSaved = True
-      print("Dotarlo?")
       
 
 
@@ -678,202 +689,334 @@ class appLogic(QObject):
 
 
    # Imitates the closage of the file by deactivating the flags
+   @pyqtSlot()
    def closeFile(self):
-      self.mutex.lock()
-      self.mb_FileOpened = False
-      self.mb_MonoChannelHandled = False
-      self.mb_StereoChannelsHandled = False
-      self.mb_SegmentSelected = False
-      self.mb_SpectrogramBandSelected = False
-      self.mb_WindowFunctionSelected = False
-      self.mb_OverlapSelected = False
       self.mb_FileCreated = False
-      self.mutex.unlock()
 
+      # Dropping the references to the data releases the memory map of the file
+      self.m_WaveformView = None
+      self.m_SpectrogramView = None
+      self.m_ChannelSpectrograms = []
+
+      self.m_Playback.clear()
+      self.m_Engine.closeFile()
 
+
+   # Stops the worker processes of the compute pool and frees their shared memory, when the app is closed
+   def closeComputePool(self):
+      self.m_Engine.setComputePool(None)
+
+
+   # Plays the selected segment, a paused playback of the same segment continues from its position
    def playAudio(self):
-      if self.m_PlayObject == None or not self.m_PlayObject.is_playing():
-         self.m_PlayObject = sa.play_buffer(self.m_Data[self.m_FirstSelectedSample:self.m_LastSelectedSample], 1, 2, self.m_SamplingFrequency)
+      state = self.getState()
+
+      if not isLoaded(state):
+         return
+
+      if self.m_Playback.isPlayingRange(state.firstSample, state.lastSample):
+         self.m_Playback.resume()
+      else:
+         self.m_Playback.play(state.firstSample, state.lastSample)
 
 
    def pauseAudio(self):
-      if(self.m_PlayObject.is_playing()):
-         self.m_PlayObject.stop()
+      self.m_Playback.pause()
 
 
    def stopAudio(self):
-      sa.stop_all()
+      self.m_Playback.stop()
+
+
+   # Moves the playback to the given second of the file
+   def seekAudio(self, seconds=float()):
+      if self.isFileOpened():
+         self.m_Playback.seek(int(seconds * self.getState().file.samplingFrequency))
+
+
+   # Moves the playback by the given amount of seconds, negative values rewind
+   def skipAudio(self, seconds=float()):
+      if self.isFileOpened():
+         self.m_Playback.skip(seconds)
 
 
    def playbackStatus(self):
-      self.send_playback_status.emit(self.m_PlayObject.is_playing())
+      self.send_playback_status.emit(self.m_Playback.isPlaying())
 
 
+   # Starts recording through a callback driven input stream. The callback only fills the ring buffer,
+   # the timer drains it and sends the new spectrogram frames and waveform envelope to the GUI
    def recordFile(self):
-      sd.default.samplerate = 44100
-      sd.default.channels = 2
-      self.m_SamplingFrequency = 44100
 
-      self.mb_StereoChannelsHandled = True
-      self.mb_MonoChannelHandled = False
+      if self.mb_Recording:
+         return
 
       if self.mb_FileCreated:
          self.recording_length_dialog.emit()
-      
-      self.m_Data = sd.rec(int(self.m_RecordingLength * 44100))
 
-      while sd.wait():
+      state = self.getState()
+
+      _, _, windowLength, windowOverlap = calculateWindowParameters(self.m_RecordSamplingFrequency, state.spectrogramBand, state.overlapPercentage)
+
+      self.m_RecordBuffer = RingBuffer(int(RECORDING_BUFFER_DURATION * self.m_RecordSamplingFrequency), self.m_ChannelsToRecord)
+      window = getWindowBank(self.m_RecordSamplingFrequency)[(state.windowFunction, windowLength)]
+      self.m_LiveSpectrogram = LiveSpectrogram(self.m_RecordSamplingFrequency, window, windowLength, windowOverlap, self.m_ChannelsToRecord, calculateFftLength(windowLength, state.fftPadding))
+      self.m_RecordedChunks = []
+      self.m_RecordedSampleCount = 0
+
+      self.m_InputStream = sd.InputStream(samplerate=self.m_RecordSamplingFrequency, channels=self.m_ChannelsToRecord, blocksize=self.m_Chunk, dtype="float32", callback=self.recordingCallback)
+
+      # Created here, so that it runs in the same thread as the recording methods
+      self.m_RecordingTimer = QTimer()
+      self.m_RecordingTimer.setInterval(RECORDING_POLL_INTERVAL)
+      self.m_RecordingTimer.timeout.connect(self.drainRecording)
+
+      self.mb_Recording = True
+
+      # Informing the GUI about the layout of the live data, [freq, channels, frames per second, waveform points per second, dynamic range].
+      # The colours of the live spectrogram need a range, also when the one of a file is unlimited
+      self.send_live_recording_started.emit([self.m_LiveSpectrogram.m_Frequencies, self.m_ChannelsToRecord, self.m_LiveSpectrogram.getFrameRate(), self.m_RecordSamplingFrequency / LIVE_WAVEFORM_BLOCK, state.dynamicRange or DEFAULT_DYNAMIC_RANGE])
+
+      self.m_InputStream.start()
+      self.m_RecordingTimer.start()
+
+
+   # Called by the audio driver from its own thread, must not block
+   def recordingCallback(self, indata, frames, time, status):
+      self.m_RecordBuffer.write(indata)
+
+
+   # Takes everything recorded since the last call and sends the new frames to the GUI
+   def drainRecording(self):
+
+      samples = self.m_RecordBuffer.read()
+
+      # The part past the requested length isn't kept
+      if self.m_RecordingLength != int and self.m_RecordingLength > 0:
+         samples = samples[:max(0, int(self.m_RecordingLength * self.m_RecordSamplingFrequency) - self.m_RecordedSampleCount)]
+
+      if len(samples) > 0:
+         self.m_RecordedChunks.append(samples)
+         self.m_RecordedSampleCount += len(samples)
+
+         frames = self.m_LiveSpectrogram.process(samples)
+
+         # In dB like the spectrogram of a file, the GUI clips them by the loudest bin seen so far
+         if frames is not None:
+            convertToDecibels(frames[2], None)
+
+         # Min/max of short blocks of the new samples, (channels, points) each
+         starts = np.arange(0, len(samples), LIVE_WAVEFORM_BLOCK)
+         envelope = [np.minimum.reduceat(samples, starts).T, np.maximum.reduceat(samples, starts).T]
+
+         self.send_live_data.emit([frames, envelope])
+
+      if self.m_RecordingLength != int and self.m_RecordingLength > 0:
+         if self.m_RecordedSampleCount >= int(self.m_RecordingLength * self.m_RecordSamplingFrequency):
+            self.stopRecording()
+
+
+   # Stops the stream and turns the recorded samples into the current file
+   def stopRecording(self):
 
-         # Waiting for a while
-         time.sleep(3)
+      if not self.mb_Recording:
+         return
 
-         print('asdsd')
+      self.m_RecordingTimer.stop()
+      self.m_InputStream.stop()
+      self.m_InputStream.close()
+      self.mb_Recording = False
 
-         # Emitting the signal to update the frequency response graph
-         self.calculateFrequencyResponse()
+      # The samples recorded after the last timer tick
+      self.drainRecording()
+
+      if self.m_RecordedSampleCount == 0:
+         self.send_recording_finished.emit()
+         return
+
+      data = np.concatenate(self.m_RecordedChunks)
+      self.m_RecordedChunks = []
 
       self.mb_FileCreated = True
-      
-      self.mutex.lock()
 
-      # Getting the length of the file
-      self.m_FileSampleCount = len(self.m_Data)
+      # Dividing the recorded data is done by the engine
+      self.m_Engine.loadData(data, self.m_RecordSamplingFrequency)
 
-      # Setting the default file segment
-      self.setDefaultFileSegment()
+      self.fileLoaded()
 
-      # Checking if the number of dimmensions of the array corresponds to stereo or mono audio data
-      if np.ndim(self.m_Data) > 1:
-         # Setting flags accordingly
-         self.mb_StereoChannelsHandled  = True
-         self.mb_MonoChannelHandled = False
+      self.send_recording_finished.emit()
+
+
+   # Resets what belonged to the previous file, once the engine holds the new one
+   def fileLoaded(self):
+
+      # A new file starts with the default parameters
+      self.m_Engine.updateState(windowFunction=self.m_ListOfWindowFunctions[0], spectrogramBand=self.m_SpectrogramBand[0], overlapPercentage=self.m_DefaultWindowOverlapPercentage)
+
+      # A new file is shown as a whole
+      self.m_WaveformView = None
+      self.m_SpectrogramView = None
+
+      self.m_ChannelSpectrograms = []
+
+      # The playback reads the same (memory mapped) samples, nothing is copied
+      state = self.getState()
+      self.m_Playback.load(self.m_Engine.getChannelMatrix(state), state.file.samplingFrequency)
 
-         # Dividing the data into channels
-         self.m_Channel_1_Data = self.m_Data[:,0]
-         self.m_Channel_2_Data = self.m_Data[:,1]
-      else:
-         #Setting flags accordingly
-         self.mb_MonoChannelHandled = True
-         self.mb_StereoChannelsHandled  = False
-
-         # Division of the data not needed
-         self.m_Channel_1_Data = self.m_Data
-
-      self.m_TimeSegments = np.linspace(0, len(self.m_Channel_1_Data)/self.m_SamplingFrequency, num=len(self.m_Channel_1_Data))
-
-      self.mutex.unlock()
-
-      # Activating the flag that informs about the opened file
-      self.mb_FileOpened = True
-
-      ###########################
-      # Calling setup functions #
-      ###########################
-
-      self.setSpectrogramBand()
-      self.setWindowFunction()
-      self.setDefaulWindowOverlapPercentage()
-
-      #####################################
-      # Calling the calculating functions #
-      #####################################
-
-      self.calculateSpectrogramParameters()
-
-
-   # Calculates the window length 
-   def calculateWindowLength(self):
-
-      # If the window lengths haven't been calculated before
-      if self.mb_WindowLengthsCalculated == False:
-         self.mutex.lock()
-         # Calculating the narrowband window length > 2 * n-samples/sampling frequency
-         self.m_NarrowWindow = int(0.04 * self.m_SamplingFrequency)
-         # Calculating the wideband window length < n-samples/sampling frequency
-         self.m_WideWindow = int(0.012 * self.m_SamplingFrequency)
-
-         # Activating the flag
-         self.mb_WindowLengthsCalculated = True
-         self.mutex.unlock()
-
-      # Checks if the spectrogram band type has been selected
-      if self.mb_SpectrogramBandSelected:
-         self.mutex.lock()
-         if self.m_CurrentSpectrogramBand == self.m_SpectrogramBand[0]:
-            # Calculating the narrowband window length > 2 * n-samples/sampling frequency
-            self.m_WindowLength = self.m_NarrowWindow 
-            
-         elif self.m_CurrentSpectrogramBand == self.m_SpectrogramBand[1]:
-            # Calculating the wideband window length < n-samples/sampling frequency
-            self.m_WindowLength = self.m_WideWindow
-         self.mutex.unlock()
-
-
-   # Calculates window overlap
-   def calculateWindowOverlap(self):
-
-      if self.mb_WindowLengthsCalculated and self.mb_SpectrogramBandSelected:
-         # Calculates the overlap with a safety rounding to prevent the overlap from reaching 0
-         #temp = int(math.ceil(self.m_WindowLength * self.m_CurrentWindowOverlapPercentage / 100))
-         self.mutex.lock()
-         self.m_WindowOverlap = int((self.m_WindowLength * self.m_CurrentWindowOverlapPercentage / 100))
-         
-         if self.m_WindowLength <= self.m_WindowOverlap:
-            self.m_WindowOverlap = self.m_WindowLength - 1
-         self.mutex.unlock()
-
-         print(f"Overlap = {self.m_WindowOverlap}")
-         print(f"Length = {self.m_WindowLength}")
-      else:
-         raise RuntimeError("Cannot set overlap")
 
+   # Returns the time axis of the samples, see analysisState.TimeAxis. Nothing is allocated per sample,
+   # so it can be called on every selection
+   def getTimeAxis(self):
 
+      state = self.getState()
+
+      if not isLoaded(state):
+         return None
+
+      return self.m_Engine.getTimeAxis(state)
+
+
+   # Sends the envelope of the visible part of the waveform, [time, [[minimum, maximum, rms], ...], [start, end]]
+   # Its resolution follows the width of the plot, so the cost doesn't depend on the file length
    def calculateFrequencyResponse(self):
-      
-      self.send_freq_response_data.emit([self.m_Data, self.m_TimeSegments])
+
+      state = self.getState()
+      view = self.m_WaveformView
+
+      if not isLoaded(state):
+         raise RuntimeError("File not read")
+
+      samplingFrequency = state.file.samplingFrequency
+
+      if view == None:
+         firstSample = 0
+         lastSample = state.file.sampleCount
+         bins = self.m_DefaultWaveformWidth
+      else:
+         firstSample = max(int(view[0] * samplingFrequency), 0)
+         lastSample = min(int(math.ceil(view[1] * samplingFrequency)), state.file.sampleCount)
+         bins = int(view[2])
+
+      time, envelope = self.m_Engine.calculateWaveformEnvelope(bins, firstSample, lastSample, state)
+
+      with TRACER.span("emit_freq_response"):
+         self.send_freq_response_data.emit(self.createSnapshot("freq_response", [time, envelope, [firstSample / samplingFrequency, lastSample / samplingFrequency]]))
 
    
-   # Calculates a spectrogram using all the data that is stored in this object
+   # Wraps a result for the GUI, tagged with the generation of the request being answered
+   def createSnapshot(self, kind, data):
+      generation = self.m_RunningGeneration if self.m_RunningGeneration is not None else self.m_RequestedGeneration
+      return DataSnapshot(kind, generation, data)
+
+
+   # Written by the scheduler from the GUI thread, the assignment of an int is atomic
+   def setRequestedGeneration(self, generation):
+      self.m_RequestedGeneration = generation
+
+
+   # Abandons the running job if the scheduler has a newer one
+   def checkCancelled(self):
+      if self.m_RunningGeneration is not None and self.m_RunningGeneration != self.m_RequestedGeneration:
+         raise CalculationCancelled()
+
+
+   # Runs a job of the scheduler, applying its parameters and then its calculations.
+   # Declared as a slot, so that the queued job runs in the thread this object was moved to.
+   # A calculation that fails is reported on the status bar and the others still run
+   @pyqtSlot(dict)
+   def runJob(self, job):
+
+      self.m_RunningGeneration = job["generation"]
+      abandoned = []
+
+      try:
+         for name, value in job["parameters"]:
+            if name == "window_function":
+               self.setWindowFunction(value)
+            elif name == "spectrogram_band":
+               self.setSpectrogramBand(value)
+            elif name == "overlap":
+               self.setWindowOverlapPercentage(value)
+            elif name == "segment":
+               self.setFileSegment(value)
+            elif name == "waveform_view":
+               self.setWaveformView(value)
+            elif name == "spectrogram_view":
+               self.setSpectrogramView(value)
+
+         for index, calculation in enumerate(job["calculations"]):
+            try:
+               with TRACER.span(calculation, generation=job["generation"]):
+                  if calculation == "freq_response":
+                     self.calculateFrequencyResponse()
+                  elif calculation == "spectrogram":
+                     self.calculateSpectrogram()
+                  elif calculation == "spectral_distribution":
+                     self.calculateSpectralDistribution()
+            except CalculationCancelled:
+               abandoned = job["calculations"][index:]
+               break
+            except Exception as exception:
+               # An exception leaving a slot aborts the whole app, a failed calculation is only reported
+               self.send_status_message.emit(f"Calculating the {calculation.replace('_', ' ')} failed: {exception}")
+      except Exception as exception:
+         self.send_status_message.emit(f"Applying the parameters failed: {exception}")
+      finally:
+         self.m_RunningGeneration = None
+         self.job_finished.emit(abandoned)
+
+
+   # Calculates the spectrogram of every channel, on the state current at the start of the calculation
    def calculateSpectrogram(self):
 
-      # Calculating needed data
-      self.calculateSpectrogramParameters()
+      state = self.getState()
 
       # Checking if the conditions are met
-      if not self.mb_FileOpened:
+      if not isLoaded(state):
          raise RuntimeError("File not read")
-      elif not self.mb_SpectrogramBandSelected:
-         raise RuntimeError("Spectrogram band not selected")
-      elif not self.mb_WindowFunctionSelected:
-         raise RuntimeError("Window function not selected")
-      elif not self.mb_WindowLengthsCalculated:
-         raise RuntimeError("Window lenghts not calculated")
 
-      # Calculating the spectrogram
-      self.mutex.lock()
-      if self.mb_MonoChannelHandled:
-         self.m_Freq_1, self.m_Time_1, self.m_Spectrogram_1 = signal.spectrogram(self.m_Channel_1_Data[self.m_FirstSelectedSample:self.m_LastSelectedSample], self.m_SamplingFrequency, window=signal.get_window(self.m_CurrentWindowFunction, self.m_WindowLength), nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap)
-         self.m_Spectrogram_1 = np.log(self.m_Spectrogram_1)
+      view = self.m_SpectrogramView
 
-      elif self.mb_StereoChannelsHandled :
-         self.m_Freq_1, self.m_Time_1, self.m_Spectrogram_1 = signal.spectrogram(self.m_Channel_1_Data[self.m_FirstSelectedSample:self.m_LastSelectedSample], self.m_SamplingFrequency, window=signal.get_window(self.m_CurrentWindowFunction, self.m_WindowLength), nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap)
-         self.m_Freq_2, self.m_Time_2, self.m_Spectrogram_2 = signal.spectrogram(self.m_Channel_2_Data[self.m_FirstSelectedSample:self.m_LastSelectedSample], self.m_SamplingFrequency, window=signal.get_window(self.m_CurrentWindowFunction, self.m_WindowLength), nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap)
-         self.m_Spectrogram_1 = np.log(self.m_Spectrogram_1)
-         self.m_Spectrogram_2 = np.log(self.m_Spectrogram_2)
-      self.mutex.unlock()
+      # Calculating the spectrogram of all channels in one batch, at the resolution of the plot if its size is known
+      try:
+         if view == None:
+            channels = self.m_Engine.calculateSpectrogram(self.checkCancelled, state)
+         else:
+            channels = self.m_Engine.calculateViewSpectrogram(view[4], view[5], view[0], view[1], view[2], view[3], self.checkCancelled, state)
+
+      # The frames of the segment or of the view don't fit into the memory budget
+      except FrameBudgetExceeded as exceeded:
+         if not self.mb_AdaptToFrameBudget:
+            self.send_status_message.emit(str(exceeded))
+            return
+
+         # As many frames as the budget allows, spread evenly over the segment or the view
+         if view == None:
+            channels = self.m_Engine.calculateReducedSpectrogram(checkCancelled=self.checkCancelled, state=state)
+         else:
+            channels = self.m_Engine.calculateReducedSpectrogram(view[4], view[5], view[0], view[1], view[2], view[3], self.checkCancelled, state)
+         self.send_status_message.emit(f"Spectrogram reduced to {channels[0][2].shape[1]} of {exceeded.m_Frames} frames, the whole one would take {exceeded.m_RequiredBytes / 2**20:.0f} MB, more than the {exceeded.m_BudgetBytes / 2**20:.0f} MB budget")
 
-      self.send_spectrogram_data.emit([[self.m_Freq_1, self.m_Time_1, self.m_Spectrogram_1], [self.m_Freq_2, self.m_Time_2, self.m_Spectrogram_2]])
+      self.m_ChannelSpectrograms = channels
 
+      # [freq, time, spectrogram] of every channel
+      with TRACER.span("emit_spectrogram"):
+         self.send_spectrogram_data.emit(self.createSnapshot("spectrogram", channels))
 
+
+   # Calculates the power spectral density of the segment from the frames of its spectrogram
    def calculateSpectralDistribution(self):
-      
-      self.send_spectral_distribution_data.emit([])
 
+      state = self.getState()
+
+      if not isLoaded(state):
+         raise RuntimeError("File not read")
+
+      # [freq, psd] of every channel
+      distribution = self.m_Engine.calculatePowerSpectralDensity(self.checkCancelled, state)
 
-   def calculateSpectrogramParameters(self):
-      #
-      self.calculateWindowLength()
-      self.calculateWindowOverlap()
+      with TRACER.span("emit_spectral_distribution"):
+         self.send_spectral_distribution_data.emit(self.createSnapshot("spectral_distribution", distribution))
 
 
 ####################################################################################
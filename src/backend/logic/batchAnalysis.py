@@ -0,0 +1,335 @@
+
+#############################################################################
+# Headless analysis of many files. Every file gets the waveform envelope,   #
+# the spectrogram and the power spectral density the GUI would show, saved  #
+# as arrays and/or as a picture, the files spread over worker processes     #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import numpy as np
+
+# Finding the files and the worker processes
+import concurrent.futures
+import fnmatch
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .spectrogramEngine import SpectrogramEngine, FrameBudgetExceeded, WINDOW_FUNCTIONS, SPECTROGRAM_BANDS, PRECISIONS, DEFAULT_WINDOW_OVERLAP_PERCENTAGE, DEFAULT_DYNAMIC_RANGE
+from . import frameCache
+
+
+
+# Formats the results can be written in. npy holds the power of every frame of the whole file, written chunk by chunk,
+# so it takes as little memory as the other formats even for files whose frames exceed the frame budget
+OUTPUT_FORMATS = ["png", "npz", "npy"]
+
+# Formats written if none are given
+DEFAULT_OUTPUT_FORMATS = ["png", "npz"]
+
+# Files picked up from the directories
+AUDIO_FILE_PATTERN = "*.wav"
+
+# Points of the waveform envelope, the default width of the waveform plot of the GUI
+DEFAULT_ENVELOPE_BINS = 2048
+
+# Size of the pictures, the size of the window of the GUI
+FIGURE_SIZE = (12.8, 7.2)
+FIGURE_DPI = 100
+
+# Same colormap as the spectrograms of the GUI
+SPECTROGRAM_COLORMAP = "plasma"
+
+# Power given to silent bins of the spectral distribution, keeps the decibels finite
+SPECTRAL_DISTRIBUTION_FLOOR = 1e-20
+
+# Stages timed for every file, in the order they run
+BATCH_STAGES = ["open", "envelope", "spectrogram", "spectral_distribution", "npz", "npy", "png"]
+
+
+
+# Returns the audio files of the given directories, files and glob patterns, sorted and without duplicates
+def findFiles(paths):
+
+   files = set()
+
+   for path in paths:
+      if os.path.isdir(path):
+         for directory, _, names in os.walk(path):
+            files.update(os.path.join(directory, name) for name in names if fnmatch.fnmatch(name.lower(), AUDIO_FILE_PATTERN))
+      else:
+         files.update(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+
+   return sorted(os.path.abspath(file) for file in files)
+
+
+# Path of the outputs of a file without the extension, the directories below the common root are kept,
+# so files of the same name in different directories don't overwrite each other
+def getOutputBase(filename, root, outputDirectory):
+   relative = os.path.relpath(filename, root) if root else os.path.basename(filename)
+   return os.path.join(outputDirectory, os.path.splitext(relative)[0])
+
+
+def getCommonRoot(files):
+   if not files:
+      return None
+   return os.path.commonpath([os.path.dirname(file) for file in files])
+
+
+# Keeps every worker process on one FFT thread, the processes already occupy the cores
+def initialiseWorker():
+   frameCache.FFT_WORKERS = 1
+
+
+
+############
+# One file #
+############
+
+
+# Spectrogram of the whole file, reduced to as many frames as the frame budget allows, as the GUI does, if all of them
+# don't fit. Returns the spectrogram and the amount of frames of the whole one, None if it wasn't reduced
+def calculateSpectrogram(engine, state):
+   try:
+      return engine.calculateSpectrogram(None, state), None
+   except FrameBudgetExceeded as exceeded:
+      return engine.calculateReducedSpectrogram(state=state), exceeded.m_Frames
+
+
+# Analyses one file with the given parameters and writes its outputs, returns the timings of the stages in seconds.
+# parameters holds the indexes of the window function and the band and the overlap percentage, as set in the GUI,
+# the precision of the frames, the dynamic range of the spectrogram and the frame budget in MB, None for the default
+def analyseFile(filename, outputBase, parameters, formats, envelopeBins=DEFAULT_ENVELOPE_BINS):
+
+   timings = {}
+   start = time.perf_counter()
+
+   def measure(stage, function, *args):
+      stageStart = time.perf_counter()
+      result = function(*args)
+      timings[stage] = time.perf_counter() - stageStart
+      return result
+
+   engine = SpectrogramEngine()
+
+   try:
+      measure("open", engine.loadFile, filename)
+
+      engine.setWindowFunction(parameters["window_function"])
+      engine.setSpectrogramBand(parameters["band"])
+      engine.setWindowOverlapPercentage(parameters["overlap"])
+      engine.setPrecision(parameters["precision"])
+      engine.setDynamicRange(parameters["dynamic_range"])
+
+      if parameters.get("frame_budget") != None:
+         engine.setFrameBudget(int(parameters["frame_budget"] * 2**20))
+
+      state = engine.getState()
+
+      envelope = measure("envelope", engine.calculateWaveformEnvelope, envelopeBins, 0, state.file.sampleCount, state)
+      spectrogram, wholeFrames = measure("spectrogram", calculateSpectrogram, engine, state)
+      distribution = measure("spectral_distribution", engine.calculatePowerSpectralDensity, None, state)
+
+      os.makedirs(os.path.dirname(outputBase) or ".", exist_ok=True)
+
+      if "npz" in formats:
+         measure("npz", saveArrays, outputBase + ".npz", state, envelope, spectrogram, distribution)
+      if "npy" in formats:
+         measure("npy", saveFrames, outputBase + ".npy", engine, state)
+      if "png" in formats:
+         measure("png", renderFigure, outputBase + ".png", state, envelope, spectrogram, distribution)
+
+      result = {"file": filename, "samples": state.file.sampleCount, "channels": len(state.file.channels), "sampling_frequency": state.file.samplingFrequency, "frames": len(spectrogram[0][1]), "timings": timings, "total": time.perf_counter() - start}
+
+      # Frames of the whole spectrogram, if it didn't fit into the frame budget
+      if wholeFrames != None:
+         result["reduced_from_frames"] = wholeFrames
+
+      return result
+
+   finally:
+      engine.closeFile()
+
+
+# Writes every result into one .npz file, replaced only once it is complete
+def saveArrays(filename, state, envelope, spectrogram, distribution):
+
+   envelopeTime, levels = envelope
+
+   arrays = {
+      "sampling_frequency": state.file.samplingFrequency,
+      "window_function": state.windowFunction,
+      "spectrogram_band": state.spectrogramBand,
+      "overlap_percentage": state.overlapPercentage,
+      "window_length": state.windowLength,
+      "window_overlap": state.windowOverlap,
+      "fft_length": state.fftLength,
+      "dynamic_range": state.dynamicRange,
+      # (channels, [minimum, maximum, rms], points)
+      "envelope_time": envelopeTime,
+      "envelope": np.array([np.stack(channel) for channel in levels]),
+      # Power in dB, (channels, frequencies, frames)
+      "freq": spectrogram[0][0],
+      "time": spectrogram[0][1],
+      "spectrogram": np.array([channel[2] for channel in spectrogram]),
+      # (channels, frequencies)
+      "psd_freq": distribution[0][0],
+      "psd": np.array([channel[1] for channel in distribution])
+   }
+
+   with open(filename + ".tmp", "wb") as file:
+      np.savez(file, **arrays)
+   os.replace(filename + ".tmp", filename)
+
+
+# Writes the power of every frame of the whole file, (channels, frequencies, frames), into a .npy file.
+# The frames are streamed into it chunk by chunk, it is replaced only once it is complete
+def saveFrames(filename, engine, state):
+
+   _, _, store = engine.calculateStreamingSpectrogram(filename + ".tmp", state=state)
+   del store
+
+   os.replace(filename + ".tmp", filename)
+
+
+# Draws the waveform, the spectrogram of every channel and the spectral distribution into a picture
+def renderFigure(filename, state, envelope, spectrogram, distribution):
+
+   # The figure is drawn by Agg directly, no GUI backend is involved
+   from matplotlib.figure import Figure
+   from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+   channels = len(spectrogram)
+
+   figure = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+   FigureCanvasAgg(figure)
+   grid = figure.add_gridspec(channels + 1, 2, width_ratios=[4, 1], hspace=0.2, wspace=0.1)
+
+   figure.suptitle(os.path.basename(state.file.name))
+
+   # Waveform envelope of every channel, as drawn by the GUI
+   waveform = figure.add_subplot(grid[0, 0])
+   envelopeTime, levels = envelope
+
+   for channel, (minimum, maximum, rms) in enumerate(levels):
+      color = f"C{channel}"
+      if minimum is maximum:
+         waveform.plot(envelopeTime, minimum, color=color, linewidth=0.8)
+      else:
+         waveform.fill_between(envelopeTime, minimum, maximum, color=color, alpha=0.5, linewidth=0)
+         waveform.fill_between(envelopeTime, -rms, rms, color=color, alpha=0.8, linewidth=0)
+
+   waveform.set_xlim(0, state.file.sampleCount / state.file.samplingFrequency)
+   waveform.set_yticks([])
+   waveform.tick_params(labelbottom=False)
+
+   # Spectrograms stacked below, the dynamic range keeps silent bins from stretching the colours
+   for channel, (freq, times, values) in enumerate(spectrogram):
+      axes = figure.add_subplot(grid[channel + 1, 0], sharex=waveform)
+
+      frequencyStep = freq[1] - freq[0] if len(freq) > 1 else 1.0
+      timeStep = times[1] - times[0] if len(times) > 1 else 1 / frequencyStep
+      extent = [times[0] - timeStep / 2, times[-1] + timeStep / 2, freq[0] - frequencyStep / 2, freq[-1] + frequencyStep / 2]
+
+      axes.imshow(values, origin="lower", extent=extent, aspect="auto", interpolation="nearest", cmap=SPECTROGRAM_COLORMAP)
+
+      if channel < channels - 1:
+         axes.tick_params(labelbottom=False)
+
+   # Spectral distribution of every channel, frequency runs upwards like on the spectrograms
+   spectralDistribution = figure.add_subplot(grid[1:, 1])
+
+   for channel, (freq, psd) in enumerate(distribution):
+      spectralDistribution.plot(10 * np.log10(np.maximum(psd, SPECTRAL_DISTRIBUTION_FLOOR)), freq, color=f"C{channel}", linewidth=0.8)
+
+   spectralDistribution.set_ylim(freq[0], freq[-1])
+   spectralDistribution.set_xlabel("dB/Hz")
+   spectralDistribution.tick_params(labelleft=False)
+
+   figure.savefig(filename + ".tmp", format="png")
+   os.replace(filename + ".tmp", filename)
+
+
+#############
+# The batch #
+#############
+
+
+# One line of the progress report
+def formatProgress(index, count, result):
+   stages = ", ".join(f"{stage} {result['timings'][stage] * 1000:.0f} ms" for stage in BATCH_STAGES if stage in result["timings"])
+   reduced = f", spectrogram reduced to {result['frames']} of {result['reduced_from_frames']} frames" if "reduced_from_frames" in result else ""
+   return f"[{index}/{count}] {result['file']}: {stages}, total {result['total'] * 1000:.0f} ms{reduced}"
+
+
+# Analyses every file, with the given amount of worker processes, and reports the progress into the stream.
+# Files whose outputs all exist are skipped if skipExisting is set. Returns the results of every file,
+# failed ones hold an "error" instead of the timings
+def runBatch(files, outputDirectory, parameters, formats, workers=None, envelopeBins=DEFAULT_ENVELOPE_BINS, skipExisting=False, stream=None):
+
+   # Taken at the call, the standard error may have been replaced since the import
+   stream = stream or sys.stderr
+
+   root = getCommonRoot(files)
+   workers = max(1, workers or os.cpu_count() or 1)
+
+   jobs = []
+   for filename in files:
+      outputBase = getOutputBase(filename, root, outputDirectory)
+      if skipExisting and all(os.path.exists(outputBase + "." + outputFormat) for outputFormat in formats):
+         continue
+      jobs.append([filename, outputBase])
+
+   if len(jobs) < len(files):
+      print(f"Skipping {len(files) - len(jobs)} file(s) with existing outputs", file=stream)
+
+   results = []
+   start = time.perf_counter()
+
+   def report(filename, future):
+      try:
+         result = future.result()
+         results.append(result)
+         print(formatProgress(len(results), len(jobs), result), file=stream, flush=True)
+      except Exception as exception:
+         results.append({"file": filename, "error": f"{type(exception).__name__}: {exception}"})
+         print(f"[{len(results)}/{len(jobs)}] {filename}: failed, {results[-1]['error']}", file=stream, flush=True)
+
+   if workers == 1:
+      for filename, outputBase in jobs:
+         future = concurrent.futures.Future()
+         try:
+            future.set_result(analyseFile(filename, outputBase, parameters, formats, envelopeBins))
+         except Exception as exception:
+            future.set_exception(exception)
+         report(filename, future)
+   else:
+      # Started with spawn, like the compute pool, so nothing of the calling process is copied
+      with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=initialiseWorker) as executor:
+         futures = {executor.submit(analyseFile, filename, outputBase, parameters, formats, envelopeBins): filename for filename, outputBase in jobs}
+         for future in concurrent.futures.as_completed(futures):
+            report(futures[future], future)
+
+   failures = sum("error" in result for result in results)
+   print(f"{len(results) - failures} file(s) analysed, {failures} failed, in {time.perf_counter() - start:.1f} s with {workers} worker(s)", file=stream)
+
+   return results
+
+
+# Writes the per file results and the parameters as JSON
+def writeReport(filename, results, parameters, formats):
+   with open(filename, "w") as file:
+      json.dump({"parameters": parameters, "formats": formats, "results": results}, file, indent=2)
+
+
+# Parameters of the batch in the form analyseFile takes them, from the names used on the command line
+def createParameters(windowFunction=WINDOW_FUNCTIONS[0], band=SPECTROGRAM_BANDS[0], overlap=DEFAULT_WINDOW_OVERLAP_PERCENTAGE, precision=PRECISIONS[0], dynamicRange=DEFAULT_DYNAMIC_RANGE, frameBudget=None):
+   return {"window_function": WINDOW_FUNCTIONS.index(windowFunction), "band": SPECTROGRAM_BANDS.index(band), "overlap": overlap, "precision": precision, "dynamic_range": dynamicRange, "frame_budget": frameBudget}
@@ -0,0 +1,110 @@
+
+#############################################################################
+# Scheduler sitting between the GUI and the backend thread. Collapses the   #
+# requests that pile up while the backend is busy into one job carrying the #
+# latest parameters, and marks the job in flight as stale so it stops early #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+# Threading support
+from PyQt5.QtCore import QObject
+
+
+
+# Parameters that can be passed with a job, in the order they are applied
+JOB_PARAMETERS = ["window_function", "spectrogram_band", "overlap", "segment", "waveform_view", "spectrogram_view"]
+
+# Calculations that can be requested, in the order they are run
+JOB_CALCULATIONS = ["freq_response", "spectrogram", "spectral_distribution"]
+
+
+
+class ComputeScheduler(QObject):
+
+   # Initialises the default values, lives in the GUI thread
+   def __init__(self, backend):
+      super().__init__()
+
+      # The appLogic object living in the backend thread
+      self.m_Backend = backend
+
+      # Parameters and calculations requested since the last dispatched job
+      self.m_PendingParameters = {}
+      self.m_PendingCalculations = set()
+
+      # Generation of the newest request, every request increments it
+      self.m_Generation = 0
+
+      # Whether a job is currently running in the backend thread
+      self.mb_Busy = False
+
+      self.m_Backend.job_finished.connect(self.jobFinished)
+
+
+   # Stores the latest value of a parameter, overriding the one that hasn't been dispatched yet
+   def setParameter(self, name, value):
+
+      if name not in JOB_PARAMETERS:
+         raise ValueError("Unknown job parameter")
+
+      self.m_PendingParameters[name] = value
+
+
+   # Requests a calculation with the latest parameters
+   def requestCalculation(self, *calculations):
+
+      for calculation in calculations:
+         if calculation not in JOB_CALCULATIONS:
+            raise ValueError("Unknown calculation")
+         self.m_PendingCalculations.add(calculation)
+
+      self.m_Generation += 1
+
+      # Written directly instead of by a signal, a queued signal would wait behind the running job
+      self.m_Backend.setRequestedGeneration(self.m_Generation)
+
+      if not self.mb_Busy:
+         self.dispatch()
+
+
+   # Drops the pending requests, e.g. after opening another file
+   def reset(self):
+      self.m_PendingParameters = {}
+      self.m_PendingCalculations = set()
+
+
+   # Abandons the running job and drops the pending requests, e.g. before the file is replaced
+   def cancel(self):
+      self.reset()
+      self.m_Generation += 1
+      self.m_Backend.setRequestedGeneration(self.m_Generation)
+
+
+   # Sends everything pending as one job
+   def dispatch(self):
+
+      if not self.m_PendingParameters and not self.m_PendingCalculations:
+         return
+
+      job = {
+         "generation": self.m_Generation,
+         "parameters": [[name, self.m_PendingParameters[name]] for name in JOB_PARAMETERS if name in self.m_PendingParameters],
+         "calculations": [calculation for calculation in JOB_CALCULATIONS if calculation in self.m_PendingCalculations]
+      }
+
+      self.reset()
+
+      self.mb_Busy = True
+      self.m_Backend.run_job.emit(job)
+
+
+   # Called once the backend finished a job, the calculations it abandoned as stale are requested again
+   def jobFinished(self, abandoned):
+      self.mb_Busy = False
+      self.m_PendingCalculations.update(abandoned)
+      self.dispatch()
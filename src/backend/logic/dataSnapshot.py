@@ -0,0 +1,79 @@
+
+#############################################################################
+# Immutable results handed from the backend to the GUI. The arrays inside   #
+# are read only views, so the GUI can keep them without copies or locks,    #
+# and the generation tells which request they answer, so late ones can be   #
+# dropped instead of being drawn                                            #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import itertools
+
+import numpy as np
+
+
+
+# Versions of the snapshots, a snapshot created later has a higher one
+SNAPSHOT_VERSIONS = itertools.count(1)
+
+
+
+# Returns the data with every array replaced by a read only view and every list by a tuple, nothing is copied.
+# An array found more than once gets one view, so the identity checks of the GUI keep working
+def freezeData(data, views=None):
+
+   if views is None:
+      views = {}
+
+   if isinstance(data, np.ndarray):
+      if id(data) not in views:
+         view = data.view()
+         view.flags.writeable = False
+         views[id(data)] = view
+      return views[id(data)]
+   elif isinstance(data, (list, tuple)):
+      return tuple(freezeData(item, views) for item in data)
+
+   return data
+
+
+
+class DataSnapshot():
+
+   __slots__ = ["m_Kind", "m_Generation", "m_Version", "m_Data"]
+
+   # kind names the result, e.g. "spectrogram", generation is the request it answers
+   def __init__(self, kind, generation, data):
+      object.__setattr__(self, "m_Kind", kind)
+      object.__setattr__(self, "m_Generation", generation)
+      object.__setattr__(self, "m_Version", next(SNAPSHOT_VERSIONS))
+      object.__setattr__(self, "m_Data", freezeData(data))
+
+
+   def __setattr__(self, name, value):
+      raise AttributeError("Snapshots are immutable")
+
+
+   def __delattr__(self, name):
+      raise AttributeError("Snapshots are immutable")
+
+
+   def getKind(self):
+      return self.m_Kind
+
+
+   def getGeneration(self):
+      return self.m_Generation
+
+
+   def getVersion(self):
+      return self.m_Version
+
+
+   def getData(self):
+      return self.m_Data
@@ -0,0 +1,219 @@
+
+#############################################################################
+# Persistent cache of calculated arrays, kept between the runs of the app.  #
+# An entry is addressed by the hash of its key, which holds the identity of #
+# the file and the parameters, and is a directory of .npy files that are    #
+# memory mapped when read. The least recently used entries are evicted      #
+# once the cache grows over its size                                        #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import numpy as np
+
+# Entries on the disk
+import hashlib
+import os
+import shutil
+import time
+
+
+
+# Default size of the cache, 2 GB
+DEFAULT_DISK_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+# Directory of the cache, the user's cache directory by default
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = "SPECTROAPP_CACHE_DIR"
+
+# Size of the cache in MB, 0 turns the cache off
+CACHE_SIZE_ENVIRONMENT_VARIABLE = "SPECTROAPP_CACHE_MB"
+
+# Part of every key, changing it makes the entries written by older versions unreachable
+DISK_CACHE_FORMAT = 1
+
+# Suffix of the entries being written
+TEMPORARY_SUFFIX = ".tmp"
+
+# Share of the size the eviction frees the cache down to, so a full cache isn't scanned on every write
+EVICTION_TARGET = 0.9
+
+# Age after which an entry being written is taken as left by an interrupted write, in seconds
+STALE_TEMPORARY_SECONDS = 3600
+
+
+
+# Directory of the cache when none is given
+def getDefaultDirectory():
+
+   if os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE):
+      return os.environ[CACHE_DIRECTORY_ENVIRONMENT_VARIABLE]
+
+   base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+   return os.path.join(base, "spectroapp")
+
+
+# Size of the cache requested through the environment, the default if none
+def getRequestedBytes():
+   try:
+      return int(float(os.environ[CACHE_SIZE_ENVIRONMENT_VARIABLE]) * 1024 * 1024)
+   except (KeyError, ValueError):
+      return DEFAULT_DISK_CACHE_BYTES
+
+
+# Creates the cache configured by the environment, None if it is turned off
+def createDiskCache():
+   maxBytes = getRequestedBytes()
+   if maxBytes <= 0:
+      return None
+   return DiskCache(getDefaultDirectory(), maxBytes)
+
+
+
+class DiskCache():
+
+   # Initialises the default values, the directory is created on the first write
+   def __init__(self, directory=None, maxBytes=DEFAULT_DISK_CACHE_BYTES):
+
+      self.m_Directory = directory or getDefaultDirectory()
+      self.m_MaxBytes = maxBytes
+
+      # Bytes taken by the entries, counted on the first write
+      self.m_UsedBytes = None
+
+      # Statistics
+      self.m_Hits = 0
+      self.m_Misses = 0
+
+
+   # Name of the entry of a key, the key has to have a stable repr, e.g. a tuple of strings and numbers
+   def getEntryName(self, key):
+      return hashlib.sha256(repr((DISK_CACHE_FORMAT,) + tuple(key)).encode()).hexdigest()
+
+
+   # Entries are spread over subdirectories, so none of them holds too many
+   def getEntryPath(self, name):
+      return os.path.join(self.m_Directory, name[:2], name)
+
+
+   # Returns the arrays stored under the key, memory mapped and read only, or None
+   def get(self, key):
+
+      path = self.getEntryPath(self.getEntryName(key))
+
+      try:
+         count = len(os.listdir(path))
+         arrays = [np.load(os.path.join(path, f"{index}.npy"), mmap_mode="r") for index in range(count)]
+      except (OSError, ValueError):
+         # A missing or damaged entry, the latter is rewritten by the next put
+         self.m_Misses += 1
+         return None
+
+      # Marks the entry as recently used
+      try:
+         os.utime(path)
+      except OSError:
+         pass
+
+      self.m_Hits += 1
+      return arrays
+
+
+   def contains(self, key):
+      return os.path.isdir(self.getEntryPath(self.getEntryName(key)))
+
+
+   # Stores a list of arrays under the key. The entry is written aside and renamed into place,
+   # so a reader never sees a partial one. Arrays bigger than the whole cache aren't stored at all
+   def put(self, key, arrays):
+
+      size = sum(np.asarray(array).nbytes for array in arrays)
+      if size > self.m_MaxBytes:
+         return
+
+      name = self.getEntryName(key)
+      path = self.getEntryPath(name)
+      temporary = f"{path}.{os.getpid()}{TEMPORARY_SUFFIX}"
+
+      try:
+         os.makedirs(temporary, exist_ok=True)
+         for index, array in enumerate(arrays):
+            np.save(os.path.join(temporary, f"{index}.npy"), np.asarray(array))
+
+         self.countUsedBytes()
+
+         if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+         else:
+            self.m_UsedBytes += size
+
+         os.rename(temporary, path)
+      except OSError:
+         # A full or read only disk only costs the reuse, the calculation itself succeeded
+         shutil.rmtree(temporary, ignore_errors=True)
+         return
+
+      self.evict()
+
+
+   # Every entry with its size and the time of its last use, [path, bytes, time]
+   def listEntries(self):
+
+      entries = []
+
+      if not os.path.isdir(self.m_Directory):
+         return entries
+
+      for group in os.scandir(self.m_Directory):
+         if not group.is_dir():
+            continue
+         for entry in os.scandir(group.path):
+            # Entries left by an interrupted write are removed once they are old enough not to be in progress
+            if entry.name.endswith(TEMPORARY_SUFFIX):
+               if time.time() - entry.stat().st_mtime > STALE_TEMPORARY_SECONDS:
+                  shutil.rmtree(entry.path, ignore_errors=True)
+               continue
+            try:
+               size = sum(file.stat().st_size for file in os.scandir(entry.path))
+               entries.append([entry.path, size, entry.stat().st_mtime])
+            except OSError:
+               pass
+
+      return entries
+
+
+   def countUsedBytes(self):
+      if self.m_UsedBytes == None:
+         self.m_UsedBytes = sum(entry[1] for entry in self.listEntries())
+      return self.m_UsedBytes
+
+
+   # Removes the least recently used entries once the cache grows over its size
+   def evict(self):
+
+      if self.countUsedBytes() <= self.m_MaxBytes:
+         return
+
+      entries = sorted(self.listEntries(), key=lambda entry: entry[2])
+      self.m_UsedBytes = sum(entry[1] for entry in entries)
+
+      for path, size, _ in entries:
+         if self.m_UsedBytes <= self.m_MaxBytes * EVICTION_TARGET:
+            break
+         shutil.rmtree(path, ignore_errors=True)
+         self.m_UsedBytes -= size
+
+
+   # Changes the size, evicting the entries that don't fit into the new one
+   def setMaxBytes(self, maxBytes):
+      self.m_MaxBytes = maxBytes
+      self.evict()
+
+
+   # Removes every entry
+   def clear(self):
+      shutil.rmtree(self.m_Directory, ignore_errors=True)
+      self.m_UsedBytes = 0
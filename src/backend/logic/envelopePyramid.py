@@ -0,0 +1,127 @@
+
+#############################################################################
+# Multi level min/max/RMS envelope of the waveform. Built once when a file  #
+# is loaded, so drawing the waveform costs the same for any file length:    #
+# the level whose blocks are closest to one pixel is picked for the view    #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import numpy as np
+
+
+
+# Samples per block of the finest level
+BASE_BLOCK = 256
+
+# How many blocks of a level are merged into one block of the next level
+LEVEL_FACTOR = 4
+
+# Blocks of the finest level calculated at once while building, bounds the memory used
+BUILD_CHUNK_BLOCKS = 4096
+
+
+
+class EnvelopePyramid():
+
+   # Builds every level from the per channel views of the data, unless the levels of the same data are passed in
+   def __init__(self, channels, samplingFrequency, baseBlock=BASE_BLOCK, levelFactor=LEVEL_FACTOR, levels=None):
+
+      self.m_SamplingFrequency = samplingFrequency
+      self.m_BaseBlock = baseBlock
+      self.m_LevelFactor = levelFactor
+
+      # Kept for the views shorter than one block per bin
+      self.m_Channels = channels
+      self.m_SampleCount = len(channels[0])
+
+      # Every level is [block size, minimum, maximum, sum of squares], arrays are (channels, blocks)
+      self.m_Levels = []
+
+      if levels == None:
+         self.build()
+      else:
+         self.m_Levels = [list(level) for level in levels]
+
+
+   # Calculates the finest level chunk by chunk, then merges it into the coarser ones
+   def build(self):
+
+      blockSize = self.m_BaseBlock
+      blockCount = -(-self.m_SampleCount // blockSize)
+
+      minimum = np.empty((len(self.m_Channels), blockCount), dtype=self.m_Channels[0].dtype)
+      maximum = np.empty((len(self.m_Channels), blockCount), dtype=self.m_Channels[0].dtype)
+      squares = np.empty((len(self.m_Channels), blockCount), dtype=np.float64)
+
+      chunkSamples = BUILD_CHUNK_BLOCKS * blockSize
+
+      for channel, data in enumerate(self.m_Channels):
+         for first in range(0, self.m_SampleCount, chunkSamples):
+            chunk = np.asarray(data[first:first + chunkSamples])
+            starts = np.arange(0, len(chunk), blockSize)
+            firstBlock = first // blockSize
+
+            minimum[channel, firstBlock:firstBlock + len(starts)] = np.minimum.reduceat(chunk, starts)
+            maximum[channel, firstBlock:firstBlock + len(starts)] = np.maximum.reduceat(chunk, starts)
+            squares[channel, firstBlock:firstBlock + len(starts)] = np.add.reduceat(np.square(chunk, dtype=np.float64), starts)
+
+      self.m_Levels.append([blockSize, minimum, maximum, squares])
+
+      # Coarser levels, until one block covers the whole file
+      while minimum.shape[1] > 1:
+         starts = np.arange(0, minimum.shape[1], self.m_LevelFactor)
+         blockSize *= self.m_LevelFactor
+
+         minimum = np.minimum.reduceat(minimum, starts, axis=1)
+         maximum = np.maximum.reduceat(maximum, starts, axis=1)
+         squares = np.add.reduceat(squares, starts, axis=1)
+
+         self.m_Levels.append([blockSize, minimum, maximum, squares])
+
+
+   # Returns [time, [[minimum, maximum, rms], ...]] of the samples [first sample, last sample),
+   # with at least the given amount of points, using the coarsest level that still provides them
+   def getEnvelope(self, firstSample, lastSample, bins):
+
+      firstSample = max(0, firstSample)
+      lastSample = min(self.m_SampleCount, lastSample)
+      samplesPerBin = (lastSample - firstSample) / max(1, bins)
+
+      level = None
+      for candidate in self.m_Levels:
+         if candidate[0] <= samplesPerBin:
+            level = candidate
+
+      # Fewer samples than pixels, the samples themselves are the envelope
+      if level is None:
+         time = np.arange(firstSample, lastSample) / self.m_SamplingFrequency
+         envelope = []
+
+         for data in self.m_Channels:
+            samples = np.asarray(data[firstSample:lastSample])
+            envelope.append([samples, samples, np.abs(samples.astype(np.float64))])
+
+         return [time, envelope]
+
+      blockSize, minimum, maximum, squares = level
+
+      firstBlock = firstSample // blockSize
+      lastBlock = -(-lastSample // blockSize)
+
+      # The last block of the file may be shorter than the others
+      blockStarts = np.arange(firstBlock, lastBlock) * blockSize
+      blockLengths = np.minimum(blockStarts + blockSize, self.m_SampleCount) - blockStarts
+
+      time = (blockStarts + blockLengths / 2) / self.m_SamplingFrequency
+      envelope = []
+
+      for channel in range(len(self.m_Channels)):
+         rms = np.sqrt(squares[channel, firstBlock:lastBlock] / blockLengths)
+         envelope.append([minimum[channel, firstBlock:lastBlock], maximum[channel, firstBlock:lastBlock], rms])
+
+      return [time, envelope]
@@ -0,0 +1,295 @@
+
+#############################################################################
+# Frame aligned cache of the short time fourier transform of a whole file.  #
+# Frames are placed on one grid for the file, so any segment is a slice of  #
+# already calculated frames and only the uncovered ones need an FFT         #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+from scipy import signal
+import scipy.fft
+import numpy as np
+
+# For the FFT worker count
+import os
+
+# Timing of the stages
+from .stageTracer import TRACER
+
+# Calculated blocks, the least recently used ones are dropped
+from .resultCache import ResultCache
+
+
+
+# How many frames are calculated together and stored as one block
+FRAMES_PER_BLOCK = 512
+
+# Threads used by one FFT call over the channels of a block
+FFT_WORKERS = os.cpu_count() or 1
+
+# Memory the calculated blocks may take by default, 256 MB
+DEFAULT_FRAME_CACHE_BYTES = 256 * 1024 * 1024
+
+
+
+class FrameCache():
+
+   # Initialises the default values, the blocks kept take at most maxBytes
+   def __init__(self, framesPerBlock=FRAMES_PER_BLOCK, maxBytes=DEFAULT_FRAME_CACHE_BYTES):
+
+      self.m_FramesPerBlock = framesPerBlock
+      self.m_MaxBytes = maxBytes
+
+      # Parameter set the stored frames were calculated with
+      self.m_Key = None
+
+      # FFT parameters of the current key
+      self.m_Window = None
+      self.m_WindowLength = None
+      self.m_WindowOverlap = None
+      self.m_Hop = None
+      self.m_SamplingFrequency = None
+      self.m_FftLength = None
+      self.m_Dtype = None
+
+      # Frequencies of the rows of every block
+      self.m_Frequencies = None
+
+      # block index -> power of the frames of every channel, (channels, frequencies, frames),
+      # the least recently used blocks are dropped once they take more than maxBytes
+      self.m_Blocks = ResultCache(maxBytes)
+
+      # Optional ProcessPool calculating the missing blocks, and the identity of the samples shared with it
+      self.m_ComputePool = None
+      self.m_SamplesIdentity = None
+
+      # Optional DiskCache keeping the blocks between the runs of the app
+      self.m_DiskCache = None
+
+
+   # Keeps the calculated blocks in the disk cache and reads the missing ones from there first.
+   # Only for data that comes from a file, the key has to identify it between the runs
+   def setDiskCache(self, diskCache):
+      self.m_DiskCache = diskCache
+
+
+   # Key of a block in the disk cache
+   def getDiskKey(self, block):
+      return ("frames",) + tuple(self.m_Key) + (self.m_FramesPerBlock, block)
+
+
+   # Lets the missing blocks be calculated by the worker processes of the pool, None calculates them here
+   def setComputePool(self, computePool, samplesIdentity):
+      self.m_ComputePool = computePool
+      self.m_SamplesIdentity = samplesIdentity
+
+
+   # Forgets every calculated frame
+   def clear(self):
+      self.m_Key = None
+      self.m_Frequencies = None
+      self.m_Blocks.clear()
+
+
+   # Changes the memory the blocks may take, dropping the least recently used ones that don't fit
+   def setMaxBytes(self, maxBytes):
+      self.m_MaxBytes = maxBytes
+      self.m_Blocks.setMaxBytes(maxBytes)
+
+
+   # Memory taken by the blocks kept
+   def getUsedBytes(self):
+      return self.m_Blocks.m_UsedBytes
+
+
+   # Selects the parameter set, the stored frames are kept only if it didn't change.
+   # The frames are zero padded to fftLength, if it is longer than the window, and calculated in the floating point type dtype
+   def configure(self, key, window, windowLength, windowOverlap, samplingFrequency, fftLength=None, dtype=np.float64):
+
+      if key == self.m_Key:
+         return
+
+      self.clear()
+
+      self.m_Key = key
+      self.m_Dtype = np.dtype(dtype)
+      self.m_Window = np.asarray(window, dtype=self.m_Dtype)
+      self.m_WindowLength = windowLength
+      self.m_WindowOverlap = windowOverlap
+      self.m_Hop = windowLength - windowOverlap
+      self.m_SamplingFrequency = samplingFrequency
+      self.m_FftLength = fftLength or windowLength
+      self.m_Frequencies = np.fft.rfftfreq(self.m_FftLength, 1 / samplingFrequency)
+
+
+   # Amount of whole frames that fit into the given amount of samples
+   def getFrameCount(self, sampleCount):
+      if sampleCount < self.m_WindowLength:
+         return 0
+      return (sampleCount - self.m_WindowLength) // self.m_Hop + 1
+
+
+   # Returns [first frame, last frame) of the frames that lie inside of the segment.
+   # At least one frame is returned, as long as the file itself is long enough
+   def getFrameRange(self, sampleCount, firstSample, lastSample):
+
+      frameCount = self.getFrameCount(sampleCount)
+
+      firstFrame = min(-(-firstSample // self.m_Hop), frameCount - 1)
+      lastFrame = min(self.getFrameCount(lastSample), frameCount)
+
+      return firstFrame, max(lastFrame, firstFrame + 1)
+
+
+   # Time of the centres of the frames, relative to the beginning of the file
+   def getFrameTimes(self, firstFrame, lastFrame):
+      return (np.arange(firstFrame, lastFrame) * self.m_Hop + self.m_WindowLength / 2) / self.m_SamplingFrequency
+
+
+   # Calculates every frame of one block of all channels at once, data is (samples, channels).
+   # The channels are one batch along the first axis, so a single FFT call runs over all of them
+   def calculateBlock(self, data, block):
+
+      firstFrame = block * self.m_FramesPerBlock
+      lastFrame = min(firstFrame + self.m_FramesPerBlock, self.getFrameCount(len(data)))
+
+      firstSample = firstFrame * self.m_Hop
+      lastSample = (lastFrame - 1) * self.m_Hop + self.m_WindowLength
+
+      with TRACER.span("fft", samples=lastSample - firstSample, nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap, channels=data.shape[1]), scipy.fft.set_workers(FFT_WORKERS):
+         _, _, power = signal.spectrogram(np.asarray(data[firstSample:lastSample], dtype=self.m_Dtype).T, self.m_SamplingFrequency, window=self.m_Window, nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap, nfft=self.m_FftLength, axis=-1)
+
+      return power
+
+
+   # Calculates the consecutive blocks [first block, last block] at once in the worker processes,
+   # split by channel and by chunks of frames, and stores them. Returns {block: power}
+   def calculatePooledBlocks(self, data, firstBlock, lastBlock, checkCancelled=None):
+
+      firstFrame = firstBlock * self.m_FramesPerBlock
+      lastFrame = min((lastBlock + 1) * self.m_FramesPerBlock, self.getFrameCount(len(data)))
+
+      power = self.m_ComputePool.calculateFrames(self.m_SamplesIdentity, data, self.m_Window, self.m_WindowLength, self.m_WindowOverlap, self.m_SamplingFrequency, firstFrame, lastFrame, checkCancelled, self.m_FftLength, self.m_Dtype)
+
+      blocks = {}
+
+      for block in range(firstBlock, lastBlock + 1):
+         # A copy, a view would keep the whole calculation alive after the block is evicted
+         blocks[block] = power[:, :, (block - firstBlock) * self.m_FramesPerBlock:(block - firstBlock + 1) * self.m_FramesPerBlock].copy()
+         self.storeBlock(block, blocks[block])
+
+      return blocks
+
+
+   # Keeps a calculated block, also in the disk cache if there is one
+   def storeBlock(self, block, power):
+      self.m_Blocks.put(block, power)
+      if self.m_DiskCache is not None:
+         self.m_DiskCache.put(self.getDiskKey(block), [power])
+
+
+   # Power of the given frames taken out of the stored blocks, None if any of the blocks isn't stored
+   def getStoredFrames(self, frames):
+
+      blocks = frames // self.m_FramesPerBlock
+      parts = []
+
+      for block in np.unique(blocks):
+         power = self.m_Blocks.get(block)
+         if power is None:
+            return None
+         parts.append(power[:, :, frames[blocks == block] - block * self.m_FramesPerBlock])
+
+      return np.concatenate(parts, axis=2)
+
+
+   # Returns the power of the given frames of the grid only, (channels, frequencies, frames), data being (samples, channels).
+   # Used when the frames are further apart than the hop, so the skipped ones aren't calculated at all, the ones
+   # in stored blocks are taken from them. The others are laid back to back, so signal.spectrogram without overlap
+   # calculates each of them as on the grid
+   def calculateSelectedFrames(self, data, frames, checkCancelled=None):
+
+      parts = []
+      offsets = np.arange(self.m_WindowLength)
+
+      for first in range(0, len(frames), self.m_FramesPerBlock):
+         if checkCancelled is not None:
+            checkCancelled()
+
+         chunk = frames[first:first + self.m_FramesPerBlock]
+
+         power = self.getStoredFrames(chunk)
+         if power is not None:
+            parts.append(power)
+            continue
+
+         indexes = (chunk[:, np.newaxis] * self.m_Hop + offsets).ravel()
+
+         with TRACER.span("fft", samples=len(indexes), nperseg=self.m_WindowLength, noverlap=0, channels=data.shape[1]), scipy.fft.set_workers(FFT_WORKERS):
+            _, _, power = signal.spectrogram(np.asarray(data[indexes], dtype=self.m_Dtype).T, self.m_SamplingFrequency, window=self.m_Window, nperseg=self.m_WindowLength, noverlap=0, nfft=self.m_FftLength, axis=-1)
+
+         parts.append(power)
+
+      return np.concatenate(parts, axis=2)
+
+
+   # Returns the power of the frames [first frame, last frame) of every channel, (channels, frequencies, frames),
+   # calculating only the blocks that haven't been calculated before. data is (samples, channels).
+   # checkCancelled is called before every calculated block and may raise to abandon the work
+   def getFrames(self, data, firstFrame, lastFrame, checkCancelled=None):
+
+      firstBlock = firstFrame // self.m_FramesPerBlock
+      lastBlock = (lastFrame - 1) // self.m_FramesPerBlock
+
+      # Blocks calculated by an earlier run of the app are memory mapped from the disk cache
+      if self.m_DiskCache is not None:
+         for block in range(firstBlock, lastBlock + 1):
+            if block not in self.m_Blocks:
+               stored = self.m_DiskCache.get(self.getDiskKey(block))
+               if stored is not None:
+                  self.m_Blocks.put(block, stored[0])
+
+      # Blocks of this call calculated by the pool, kept here as the cache may already have dropped them
+      pooled = {}
+
+      # Runs of missing blocks go to the pool as a whole, so every worker gets a share of them.
+      # A single block isn't worth the round trip to the workers, it is left for the loop below
+      if self.m_ComputePool is not None:
+         block = firstBlock
+         while block <= lastBlock:
+            if block in self.m_Blocks:
+               block += 1
+               continue
+
+            lastMissing = block
+            while lastMissing < lastBlock and lastMissing + 1 not in self.m_Blocks:
+               lastMissing += 1
+
+            if lastMissing > block:
+               if checkCancelled is not None:
+                  checkCancelled()
+               pooled.update(self.calculatePooledBlocks(data, block, lastMissing, checkCancelled))
+            block = lastMissing + 1
+
+      blocks = []
+
+      for block in range(firstBlock, lastBlock + 1):
+         power = pooled[block] if block in pooled else self.m_Blocks.get(block)
+         if power is None:
+            if checkCancelled is not None:
+               checkCancelled()
+            power = self.calculateBlock(data, block)
+            self.storeBlock(block, power)
+         blocks.append(power)
+
+      offset = firstBlock * self.m_FramesPerBlock
+
+      if len(blocks) == 1:
+         return blocks[0][:, :, firstFrame - offset:lastFrame - offset]
+
+      return np.concatenate(blocks, axis=2)[:, :, firstFrame - offset:lastFrame - offset]
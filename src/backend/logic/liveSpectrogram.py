@@ -0,0 +1,66 @@
+
+#############################################################################
+# Incremental short time fourier transform of a live input. Every call gets #
+# the newly recorded samples and returns only the frames they completed,    #
+# the samples of the unfinished frames are carried over to the next call   #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+from scipy import signal
+import numpy as np
+
+# Frame counting shared with the chunked calculations
+from .streamingStft import getFrameCount
+
+
+
+class LiveSpectrogram():
+
+   # Initialises the default values, the frames are zero padded to fftLength if given
+   def __init__(self, samplingFrequency, window, windowLength, windowOverlap, channels, fftLength=None):
+
+      self.m_SamplingFrequency = samplingFrequency
+      self.m_Window = window
+      self.m_WindowLength = windowLength
+      self.m_WindowOverlap = windowOverlap
+      self.m_Hop = windowLength - windowOverlap
+      self.m_FftLength = fftLength or windowLength
+
+      self.m_Frequencies = np.fft.rfftfreq(self.m_FftLength, 1 / samplingFrequency)
+
+      # Samples that don't complete a frame yet, (samples, channels)
+      self.m_Carry = np.zeros((0, channels), dtype=np.float32)
+
+      # Amount of frames returned so far
+      self.m_FrameCount = 0
+
+
+   # Frames per second of the output
+   def getFrameRate(self):
+      return self.m_SamplingFrequency / self.m_Hop
+
+
+   # Takes the new samples, (samples, channels), and returns [freq, time, power] of the frames
+   # they completed, power being (channels, frequencies, frames), or None if no frame was completed
+   def process(self, samples):
+
+      buffer = np.concatenate((self.m_Carry, samples)) if len(self.m_Carry) else samples
+      frames = getFrameCount(len(buffer), self.m_WindowLength, self.m_WindowOverlap)
+
+      if frames == 0:
+         self.m_Carry = buffer
+         return None
+
+      _, _, power = signal.spectrogram(buffer[:(frames - 1) * self.m_Hop + self.m_WindowLength].T, self.m_SamplingFrequency, window=self.m_Window, nperseg=self.m_WindowLength, noverlap=self.m_WindowOverlap, nfft=self.m_FftLength, axis=-1)
+
+      time = ((self.m_FrameCount + np.arange(frames)) * self.m_Hop + self.m_WindowLength / 2) / self.m_SamplingFrequency
+
+      self.m_Carry = buffer[frames * self.m_Hop:]
+      self.m_FrameCount += frames
+
+      return [self.m_Frequencies, time, power]
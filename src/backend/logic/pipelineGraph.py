@@ -0,0 +1,99 @@
+
+#############################################################################
+# Dependency graph of the analysis stages. A stage names its inputs, which  #
+# are fields of the analysis state or other stages, and keeps its latest    #
+# result together with the key of the inputs it was calculated from, so a   #
+# change recalculates only the stages downstream of the changed inputs      #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+# Stages are kept in the order they were added
+import collections
+
+
+
+class PipelineStage():
+
+   # function is called as function(inputs, checkCancelled), inputs being a dictionary of the input values
+   def __init__(self, name, inputs, function):
+      self.m_Name = name
+      self.m_Inputs = inputs
+      self.m_Function = function
+
+      # (key of the inputs, result) of the latest calculation, replaced as a whole,
+      # so evaluations from different threads never pair a key with another result
+      self.m_Memo = None
+
+
+
+class PipelineGraph():
+
+   # stateKeys maps the fields of the state that can't be compared directly to a function returning their key,
+   # e.g. the file, which is identified by its identity instead of its samples
+   def __init__(self, stateKeys=None):
+      self.m_Stages = collections.OrderedDict()
+      self.m_StateKeys = stateKeys or {}
+
+      # How many times every stage was calculated, shows what a change invalidated
+      self.m_Calculations = collections.Counter()
+
+
+   # Adds a stage, its inputs have to be fields of the state or stages added before
+   def addStage(self, name, inputs, function):
+
+      if name in self.m_Stages:
+         raise ValueError("The stage already exists")
+
+      self.m_Stages[name] = PipelineStage(name, list(inputs), function)
+
+
+   # Key of an input, for a stage it is built from the keys of its own inputs
+   def getKey(self, name, state):
+
+      if name in self.m_Stages:
+         return tuple(self.getKey(dependency, state) for dependency in self.m_Stages[name].m_Inputs)
+      elif name in self.m_StateKeys:
+         return self.m_StateKeys[name](getattr(state, name))
+
+      return getattr(state, name)
+
+
+   # Returns the result of a stage for the state, calculating it and the stages it depends on only if their inputs changed.
+   # checkCancelled is passed to the calculating functions and may raise to abandon the work
+   def evaluate(self, name, state, checkCancelled=None):
+
+      if name not in self.m_Stages:
+         return getattr(state, name)
+
+      stage = self.m_Stages[name]
+      key = self.getKey(name, state)
+
+      memo = stage.m_Memo
+      if memo is not None and memo[0] == key:
+         return memo[1]
+
+      inputs = {dependency: self.evaluate(dependency, state, checkCancelled) for dependency in stage.m_Inputs}
+
+      result = stage.m_Function(inputs, checkCancelled)
+      self.m_Calculations[name] += 1
+
+      stage.m_Memo = (key, result)
+
+      return result
+
+
+   # Latest result of a stage whatever its inputs were, None if it wasn't calculated since the last clear
+   def getStoredResult(self, name):
+      memo = self.m_Stages[name].m_Memo
+      return None if memo is None else memo[1]
+
+
+   # Drops every stored result, e.g. when the file is closed
+   def clear(self):
+      for stage in self.m_Stages.values():
+         stage.m_Memo = None
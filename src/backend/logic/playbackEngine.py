@@ -0,0 +1,180 @@
+
+#############################################################################
+# Streaming audio playback. The output stream callback copies only the next #
+# small block of the (possibly memory mapped) samples, so playback starts   #
+# at once for any file length and the position can be moved at any time    #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+# Audio output
+import sounddevice as sd
+
+
+
+# Sample formats the output stream can take directly, others are converted block by block
+STREAM_DTYPES = ["float32", "int32", "int16", "int8", "uint8"]
+
+# Samples requested by one call of the output stream callback
+PLAYBACK_BLOCK_SIZE = 1024
+
+
+
+class PlaybackEngine():
+
+   # Initialises the default values
+   def __init__(self, blockSize=PLAYBACK_BLOCK_SIZE):
+
+      self.m_BlockSize = blockSize
+
+      # Samples to play, (samples, channels), never copied as a whole
+      self.m_Data = None
+      self.m_SamplingFrequency = None
+
+      # Played range, [first sample, last sample)
+      self.m_FirstSample = 0
+      self.m_LastSample = 0
+
+      # Next sample to be played, moved by the callback and by seeking
+      self.m_Position = 0
+
+      self.m_Stream = None
+
+      self.mb_Playing = False
+
+
+   # Sets the samples to play, (samples, channels), stopping the current playback
+   def load(self, data, samplingFrequency):
+
+      self.close()
+
+      self.m_Data = data
+      self.m_SamplingFrequency = samplingFrequency
+      self.m_FirstSample = 0
+      self.m_LastSample = len(data)
+      self.m_Position = 0
+
+
+   # Stops the playback and releases the stream
+   def close(self):
+
+      if self.m_Stream is not None:
+         self.m_Stream.stop()
+         self.m_Stream.close()
+         self.m_Stream = None
+
+      self.mb_Playing = False
+
+
+   # Stops the playback and forgets the samples, e.g. when the file is closed
+   def clear(self):
+      self.close()
+      self.m_Data = None
+      self.m_SamplingFrequency = None
+      self.m_FirstSample = 0
+      self.m_LastSample = 0
+      self.m_Position = 0
+
+
+   # Whether [first sample, last sample) is the range played or paused at the moment
+   def isPlayingRange(self, firstSample, lastSample):
+      return self.m_Stream is not None and self.m_FirstSample == max(0, firstSample) and self.m_LastSample == min(len(self.m_Data), lastSample)
+
+
+   # Opens a stream matching the channel count and, if possible, the sample format of the data
+   def openStream(self):
+
+      dtype = self.m_Data.dtype.name if self.m_Data.dtype.name in STREAM_DTYPES else "float32"
+
+      self.m_Stream = sd.OutputStream(samplerate=self.m_SamplingFrequency, channels=self.m_Data.shape[1], dtype=dtype, blocksize=self.m_BlockSize, callback=self.playbackCallback, finished_callback=self.playbackFinished)
+
+
+   # Called by the audio driver from its own thread, copies the next block into the output
+   def playbackCallback(self, outdata, frames, time, status):
+
+      position = self.m_Position
+      block = self.m_Data[position:min(position + frames, self.m_LastSample)]
+
+      outdata[:len(block)] = block
+      outdata[len(block):] = 0
+
+      self.m_Position = position + len(block)
+
+      if self.m_Position >= self.m_LastSample:
+         raise sd.CallbackStop()
+
+
+   def playbackFinished(self):
+      self.mb_Playing = False
+
+
+   # Plays [first sample, last sample) from its beginning
+   def play(self, firstSample, lastSample):
+
+      if self.m_Data is None:
+         raise RuntimeError("Nothing to play")
+
+      self.close()
+
+      self.m_FirstSample = max(0, firstSample)
+      self.m_LastSample = min(len(self.m_Data), lastSample)
+      self.m_Position = self.m_FirstSample
+
+      self.resume()
+
+
+   # Continues from the current position
+   def resume(self):
+
+      if self.m_Data is None or self.mb_Playing:
+         return
+
+      if self.m_Position >= self.m_LastSample:
+         self.m_Position = self.m_FirstSample
+
+      if self.m_Stream is None:
+         self.openStream()
+
+      # A stream that reached the end has to be stopped before it can be started again
+      self.m_Stream.stop()
+
+      self.mb_Playing = True
+      self.m_Stream.start()
+
+
+   # Stops the output, keeping the position
+   def pause(self):
+
+      if self.m_Stream is not None and self.mb_Playing:
+         self.m_Stream.stop()
+
+      self.mb_Playing = False
+
+
+   # Stops the output and goes back to the beginning of the played range
+   def stop(self):
+      self.pause()
+      self.m_Position = self.m_FirstSample
+
+
+   # Moves the playback to a sample, inside of the played range
+   def seek(self, sample):
+      self.m_Position = int(min(max(sample, self.m_FirstSample), self.m_LastSample))
+
+
+   # Moves the playback by the given amount of seconds, negative values rewind
+   def skip(self, seconds):
+      self.seek(self.m_Position + seconds * self.m_SamplingFrequency)
+
+
+   # Current position in seconds, from the beginning of the data
+   def getPosition(self):
+      return self.m_Position / self.m_SamplingFrequency if self.m_SamplingFrequency else 0.0
+
+
+   def isPlaying(self):
+      return self.mb_Playing
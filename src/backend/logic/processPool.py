@@ -0,0 +1,244 @@
+
+#############################################################################
+# Optional compute backend spreading the FFT of the frames over processes.  #
+# The samples the frames cover are placed in shared memory, the workers     #
+# read them from there and write the power of their chunk straight into a   #
+# shared output, so no large array is pickled in either direction           #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+from scipy import signal
+import scipy.fft
+import numpy as np
+
+# Worker processes and the memory they share
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+
+# Worker count from the environment
+import os
+
+# Timing of the stages
+from .stageTracer import TRACER
+
+
+
+# Worker count of the pool created by the app, 0 or 1 keeps the calculations in the backend thread
+WORKERS_ENVIRONMENT_VARIABLE = "SPECTROAPP_COMPUTE_WORKERS"
+
+# Frames below which a chunk isn't worth sending to another process
+MIN_CHUNK_FRAMES = 256
+
+# Chunks created per worker, more of them even out the load of workers that finish early
+CHUNKS_PER_WORKER = 4
+
+# How often a cancellation is checked while the workers run, in seconds
+CANCEL_CHECK_INTERVAL = 0.05
+
+# Samples shared at once, 64 MB, longer ranges are calculated part by part.
+# Keeps a memory mapped file from being read into memory as a whole
+MAX_SHARED_SAMPLE_BYTES = 64 * 1024 * 1024
+
+
+
+# Worker count requested through the environment, 0 if none
+def getRequestedWorkers():
+   try:
+      return max(0, int(os.environ.get(WORKERS_ENVIRONMENT_VARIABLE, "0")))
+   except ValueError:
+      return 0
+
+
+
+###########################
+# Inside a worker process #
+###########################
+
+
+# Calculates the power of the frames [first frame, last frame) of one channel and writes them
+# into the shared output, (channels, frequencies, frames) with outputFrame being the column of the first frame.
+# samples describes the shared samples, [name, shape, dtype, the sample of the file they start at].
+# The shared blocks are attached for this chunk only, so a released block isn't kept alive by a worker
+def calculateChunk(samples, output, channel, firstFrame, lastFrame, outputFrame, window, windowLength, windowOverlap, samplingFrequency, fftLength=None):
+
+   name, shape, dtype, offset = samples
+
+   hop = windowLength - windowOverlap
+   firstSample = firstFrame * hop - offset
+   lastSample = (lastFrame - 1) * hop + windowLength - offset
+
+   samplesMemory = shared_memory.SharedMemory(name=name)
+   try:
+      data = np.ndarray(shape, dtype=dtype, buffer=samplesMemory.buf)
+
+      # Every process is one worker already, more FFT threads would only compete for the cores
+      with scipy.fft.set_workers(1):
+         _, _, power = signal.spectrogram(np.asarray(data[firstSample:lastSample, channel], dtype=output[2]), samplingFrequency, window=window, nperseg=windowLength, noverlap=windowOverlap, nfft=fftLength)
+
+      del data
+   finally:
+      samplesMemory.close()
+
+   outputMemory = shared_memory.SharedMemory(name=output[0])
+   try:
+      result = np.ndarray(output[1], dtype=output[2], buffer=outputMemory.buf)
+      result[channel, :, outputFrame:outputFrame + power.shape[1]] = power
+      del result
+   finally:
+      outputMemory.close()
+
+
+
+#######################
+# In the main process #
+#######################
+
+
+class ProcessPool():
+
+   # Initialises the default values, the processes are started on the first calculation
+   def __init__(self, workers=None):
+
+      self.m_Workers = workers or os.cpu_count() or 1
+      self.m_Executor = None
+
+      # (identity, first sample, last sample) of the shared samples and their [SharedMemory, shape, dtype]
+      self.m_SamplesIdentity = None
+      self.m_Samples = None
+
+
+   def getWorkerCount(self):
+      return self.m_Workers
+
+
+   # Started with spawn, a fork would copy the Qt threads of the app into the workers
+   def getExecutor(self):
+      if self.m_Executor == None:
+         self.m_Executor = concurrent.futures.ProcessPoolExecutor(self.m_Workers, mp_context=multiprocessing.get_context("spawn"))
+      return self.m_Executor
+
+
+   # Places the samples [first sample, last sample) in shared memory, data being (samples, channels).
+   # Samples already shared for the same identity are kept, only a range they don't cover is shared anew.
+   # Returns their description for the workers, see calculateChunk
+   def shareSamples(self, identity, data, firstSample=0, lastSample=None):
+
+      lastSample = len(data) if lastSample == None else lastSample
+
+      shared = self.m_SamplesIdentity
+      if self.m_Samples == None or shared[0] != identity or firstSample < shared[1] or lastSample > shared[2]:
+
+         self.releaseSamples()
+
+         part = data[firstSample:lastSample]
+
+         with TRACER.span("share_samples", samples=part.shape[0], channels=part.shape[1]):
+            memory = shared_memory.SharedMemory(create=True, size=max(1, part.nbytes))
+            np.ndarray(part.shape, dtype=part.dtype, buffer=memory.buf)[:] = part
+
+         self.m_SamplesIdentity = (identity, firstSample, lastSample)
+         self.m_Samples = [memory, part.shape, part.dtype.str]
+
+      return [self.m_Samples[0].name, self.m_Samples[1], self.m_Samples[2], self.m_SamplesIdentity[1]]
+
+
+   # Frees the shared samples, e.g. when the file is closed
+   def releaseSamples(self):
+
+      if self.m_Samples != None:
+         self.m_Samples[0].close()
+         self.m_Samples[0].unlink()
+
+      self.m_SamplesIdentity = None
+      self.m_Samples = None
+
+
+   # Stops the workers and frees the shared memory
+   def close(self):
+
+      if self.m_Executor != None:
+         self.m_Executor.shutdown(wait=True, cancel_futures=True)
+         self.m_Executor = None
+
+      self.releaseSamples()
+
+
+   # Raises once the pool was closed by another thread while a calculation was running on executor
+   def checkClosed(self, executor):
+      if self.m_Executor is not executor:
+         raise RuntimeError("The compute pool was closed")
+
+
+   # Returns the power of the frames [first frame, last frame) of every channel, (channels, frequencies, frames),
+   # the same as one signal.spectrogram over them. The work is split by channel and by chunks of frames.
+   # Only the samples of the frames are shared, a part of at most MAX_SHARED_SAMPLE_BYTES at a time.
+   # checkCancelled is called while waiting for the workers and may raise to abandon the work.
+   # The frames are zero padded to fftLength if given and calculated in the floating point type dtype
+   def calculateFrames(self, identity, data, window, windowLength, windowOverlap, samplingFrequency, firstFrame, lastFrame, checkCancelled=None, fftLength=None, dtype=np.float64):
+
+      fftLength = fftLength or windowLength
+      dtype = np.dtype(dtype)
+
+      channels = data.shape[1]
+      frameCount = lastFrame - firstFrame
+      hop = windowLength - windowOverlap
+
+      # Chunks of every channel, enough of them to keep all workers busy
+      chunkFrames = max(MIN_CHUNK_FRAMES, -(-frameCount * channels // (self.m_Workers * CHUNKS_PER_WORKER)))
+
+      # Frames whose samples fit into one shared part
+      partFrames = max(1, (MAX_SHARED_SAMPLE_BYTES // (channels * data.dtype.itemsize) - windowLength) // hop + 1)
+
+      shape = (channels, fftLength // 2 + 1, frameCount)
+      output = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+
+      futures = []
+      executor = self.getExecutor()
+
+      try:
+         with TRACER.span("fft_pool", frames=frameCount, channels=channels, nperseg=windowLength, noverlap=windowOverlap, workers=self.m_Workers):
+
+            outputDescription = [output.name, shape, dtype.str]
+
+            for partFirst in range(firstFrame, lastFrame, partFrames):
+               partLast = min(partFirst + partFrames, lastFrame)
+
+               self.checkClosed(executor)
+
+               samples = self.shareSamples(identity, data, partFirst * hop, (partLast - 1) * hop + windowLength)
+
+               futures = []
+               for channel in range(channels):
+                  for chunk in range(partFirst, partLast, chunkFrames):
+                     futures.append(executor.submit(calculateChunk, samples, outputDescription, channel, chunk, min(chunk + chunkFrames, partLast), chunk - firstFrame, window, windowLength, windowOverlap, samplingFrequency, fftLength))
+
+               pending = set(futures)
+               while pending:
+                  self.checkClosed(executor)
+                  if checkCancelled != None:
+                     checkCancelled()
+                  _, pending = concurrent.futures.wait(pending, timeout=CANCEL_CHECK_INTERVAL, return_when=concurrent.futures.FIRST_EXCEPTION)
+
+               # Raises the exception of a failed chunk
+               for future in futures:
+                  future.result()
+
+            return np.array(np.ndarray(shape, dtype=dtype, buffer=output.buf))
+
+      finally:
+         # An abandoned calculation leaves its queued chunks undone, the running ones finish writing first.
+         # A closed pool already waited for its workers, the chunks it dropped never finish
+         for future in futures:
+            future.cancel()
+         pending = set(futures)
+         while pending and self.m_Executor is executor:
+            _, pending = concurrent.futures.wait(pending, timeout=CANCEL_CHECK_INTERVAL)
+
+         output.close()
+         output.unlink()
@@ -0,0 +1,116 @@
+
+#############################################################################
+# Least recently used cache of finished results, bounded by a byte budget.  #
+# Lets the user flip between recently viewed parameter combinations         #
+# without recalculating them                                                #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+from collections import OrderedDict
+import numpy as np
+
+
+
+# Default budget of the cache, 256 MB
+DEFAULT_RESULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+
+class ResultCache():
+
+   # Initialises the default values
+   def __init__(self, maxBytes=DEFAULT_RESULT_CACHE_BYTES):
+
+      # Budget of the cache, in bytes
+      self.m_MaxBytes = maxBytes
+
+      # Bytes taken by the currently stored results
+      self.m_UsedBytes = 0
+
+      # key -> (result, size in bytes), the most recently used entries are at the end
+      self.m_Entries = OrderedDict()
+
+      # Statistics
+      self.m_Hits = 0
+      self.m_Misses = 0
+
+
+   # Size of a result, being an array or a (nested) list of arrays
+   def getSize(self, value):
+      if isinstance(value, np.ndarray):
+         return value.nbytes
+      elif isinstance(value, (list, tuple)):
+         return sum(self.getSize(item) for item in value)
+      return 0
+
+
+   # Makes the stored arrays read only, so that a user of a result can't change the cached one
+   def freeze(self, value):
+      if isinstance(value, np.ndarray):
+         value.setflags(write=False)
+      elif isinstance(value, (list, tuple)):
+         for item in value:
+            self.freeze(item)
+
+
+   # Changes the budget, evicting the entries that don't fit into the new one
+   def setMaxBytes(self, maxBytes):
+      self.m_MaxBytes = maxBytes
+      self.evict()
+
+
+   def clear(self):
+      self.m_Entries.clear()
+      self.m_UsedBytes = 0
+
+
+   # Returns the result stored under the key, or None
+   def get(self, key):
+
+      if key not in self.m_Entries:
+         self.m_Misses += 1
+         return None
+
+      self.m_Hits += 1
+      self.m_Entries.move_to_end(key)
+
+      return self.m_Entries[key][0]
+
+
+   # Stores a result, results bigger than the whole budget aren't stored at all
+   def put(self, key, value):
+
+      size = self.getSize(value)
+
+      if size > self.m_MaxBytes:
+         return
+
+      if key in self.m_Entries:
+         self.m_UsedBytes -= self.m_Entries.pop(key)[1]
+
+      self.freeze(value)
+      self.m_Entries[key] = (value, size)
+      self.m_UsedBytes += size
+
+      self.evict()
+
+
+   # Removes the least recently used entries until the cache fits into its budget
+   def evict(self):
+      while self.m_UsedBytes > self.m_MaxBytes and self.m_Entries:
+         _, (_, size) = self.m_Entries.popitem(last=False)
+         self.m_UsedBytes -= size
+
+
+   # Whether a result is stored under the key, without counting it as a use
+   def __contains__(self, key):
+      return key in self.m_Entries
+
+
+   def __len__(self):
+      return len(self.m_Entries)
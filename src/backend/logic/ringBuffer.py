@@ -0,0 +1,80 @@
+
+#############################################################################
+# Single producer, single consumer ring buffer of audio samples. The audio  #
+# callback writes and the backend reads without taking any lock, each side  #
+# only moves its own position, the other one only ever reads it             #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import numpy as np
+
+
+
+class RingBuffer():
+
+   # Initialises the default values
+   def __init__(self, capacity, channels, dtype=np.float32):
+
+      self.m_Capacity = capacity
+      self.m_Buffer = np.zeros((capacity, channels), dtype=dtype)
+
+      # Total amount of samples ever written, changed only by the producer
+      self.m_WritePosition = 0
+
+      # Total amount of samples ever read, changed only by the consumer
+      self.m_ReadPosition = 0
+
+      # Samples lost because the consumer fell behind by more than the capacity
+      self.m_Overruns = 0
+
+
+   # Producer side, copies the samples in and only then publishes them by moving the write position
+   def write(self, samples):
+
+      count = len(samples)
+
+      # Only the newest samples fit
+      if count > self.m_Capacity:
+         samples = samples[count - self.m_Capacity:]
+         self.m_WritePosition += count - self.m_Capacity
+         count = self.m_Capacity
+
+      start = self.m_WritePosition % self.m_Capacity
+      first = min(count, self.m_Capacity - start)
+
+      self.m_Buffer[start:start + first] = samples[:first]
+      self.m_Buffer[:count - first] = samples[first:]
+
+      self.m_WritePosition += count
+
+
+   # Amount of samples written but not read yet
+   def available(self):
+      return self.m_WritePosition - self.m_ReadPosition
+
+
+   # Consumer side, returns a copy of every sample written since the last read
+   def read(self):
+
+      writePosition = self.m_WritePosition
+      count = writePosition - self.m_ReadPosition
+
+      # The oldest samples have already been overwritten
+      if count > self.m_Capacity:
+         self.m_Overruns += count - self.m_Capacity
+         self.m_ReadPosition = writePosition - self.m_Capacity
+         count = self.m_Capacity
+
+      start = self.m_ReadPosition % self.m_Capacity
+      first = min(count, self.m_Capacity - start)
+
+      samples = np.concatenate((self.m_Buffer[start:start + first], self.m_Buffer[:count - first]))
+
+      self.m_ReadPosition += count
+
+      return samples
@@ -0,0 +1,893 @@
+
+#############################################################################
+# The headless part of the backend. Contains all of the signal maths of the #
+# spectrogram app without any Qt dependency, so that it can be used from    #
+# the GUI adapter, scripts, worker processes and benchmarks alike           #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+# For plot data creation and storage
+import scipy.io.wavfile as wavfile
+from scipy import signal
+import scipy.fft
+import numpy as np
+
+# File identity
+import itertools
+import os
+
+# Window bank
+import functools
+
+# Reuse of the frames between segments and of whole results between parameter changes
+from .frameCache import FrameCache
+from .pipelineGraph import PipelineGraph
+from .resultCache import ResultCache, DEFAULT_RESULT_CACHE_BYTES
+
+# Waveform drawing at screen resolution
+from .envelopePyramid import EnvelopePyramid, BASE_BLOCK, LEVEL_FACTOR
+
+# Immutable state swapped as a whole
+from .analysisState import FileState, AnalysisState, createEmptyFileState, createTimeAxis, isLoaded
+
+# Spectrograms of files that don't fit into memory
+from . import streamingStft
+
+# Timing of the stages
+from .stageTracer import TRACER
+
+
+
+##########################################
+# Selectable options shared with the GUI #
+##########################################
+
+
+WINDOW_FUNCTIONS = ["tukey", "triang", "flattop", "exponential"]
+SPECTROGRAM_BANDS = ["narrow", "wide"]
+
+# Floating point types the frames can be calculated in, float32 takes half of the memory
+PRECISIONS = ["float32", "float64"]
+
+# Default value equal to 10%
+DEFAULT_WINDOW_OVERLAP_PERCENTAGE = 10
+
+# Window lengths of the bands, in seconds
+NARROW_WINDOW_DURATION = 0.04
+WIDE_WINDOW_DURATION = 0.012
+
+# Identities of the data that didn't come from a file
+DATA_IDENTITIES = itertools.count()
+
+# Memory the frames of one calculation may take, 512 MB, above it the calculation is refused or reduced
+DEFAULT_FRAME_BUDGET_BYTES = 512 * 1024 * 1024
+
+# Frame budget in MB, overrides the default
+FRAME_BUDGET_ENVIRONMENT_VARIABLE = "SPECTROAPP_FRAME_BUDGET_MB"
+
+# Copies of the frames a spectrogram holds at once, the power and its logarithm
+FRAME_COPIES = 2
+
+# Blocks of the frame cache averaged at once by the power spectral density, missing ones go to the compute pool together
+DENSITY_CHUNK_BLOCKS = 8
+
+# Frames and frequency bins calculated per pixel of a view, the image needs no more than one of each
+VIEW_FRAMES_PER_PIXEL = 1
+VIEW_BINS_PER_PIXEL = 1
+
+# Zero padding of the frames to a fast FFT length, "0" turns it off
+FFT_PADDING_ENVIRONMENT_VARIABLE = "SPECTROAPP_FFT_PADDING"
+
+# Window lengths whose prime factors are all up to this one are transformed fast as they are,
+# padding them would only add work. Longer factors, e.g. 151 of 453 samples at 37800 Hz, are several times slower
+LARGEST_FAST_FACTOR = 23
+
+# Sampling frequencies whose windows are kept in the window bank
+WINDOW_BANK_RATES = 8
+
+# Precision of the frames, one of PRECISIONS, overrides the default
+PRECISION_ENVIRONMENT_VARIABLE = "SPECTROAPP_PRECISION"
+
+# Power given to silent bins before the conversion into decibels, keeps them finite
+POWER_FLOOR = 1e-30
+
+# Decibels below the loudest bin the spectrogram reaches by default, the range of the colours
+DEFAULT_DYNAMIC_RANGE = 120
+
+
+
+# Window lengths of both bands and the length and overlap of the selected one, in samples.
+# Given the sample count, the window is shortened to it, so a file shorter than the window is one frame
+# Returns [narrow window, wide window, window length, window overlap]
+def calculateWindowParameters(samplingFrequency, band, overlapPercentage, sampleCount=None):
+
+   # Narrowband window length > 2 * n-samples/sampling frequency
+   narrowWindow = int(NARROW_WINDOW_DURATION * samplingFrequency)
+   # Wideband window length < n-samples/sampling frequency
+   wideWindow = int(WIDE_WINDOW_DURATION * samplingFrequency)
+
+   windowLength = narrowWindow if band == SPECTROGRAM_BANDS[0] else wideWindow
+
+   if sampleCount != None:
+      windowLength = max(1, min(windowLength, sampleCount))
+
+   windowOverlap = int(windowLength * overlapPercentage / 100)
+
+   # The hop can't reach 0 samples
+   if windowLength <= windowOverlap:
+      windowOverlap = windowLength - 1
+
+   return [narrowWindow, wideWindow, windowLength, windowOverlap]
+
+
+
+# Largest prime factor of a window length
+def getLargestPrimeFactor(number):
+
+   factor = 2
+   largest = 1
+
+   while factor * factor <= number:
+      while number % factor == 0:
+         largest = factor
+         number //= factor
+      factor += 1
+
+   return max(largest, number)
+
+
+# Length of the FFT of the frames, the window length zero padded to the next fast length if
+# padding is on and the window length itself is slow to transform. Padding interpolates the bins
+def calculateFftLength(windowLength, padding=True):
+   if not padding or getLargestPrimeFactor(windowLength) <= LARGEST_FAST_FACTOR:
+      return windowLength
+   return scipy.fft.next_fast_len(windowLength, real=True)
+
+
+# Every window function at the lengths of both bands, created once per sampling frequency
+# Returns {(window function, window length): window}, the windows are read only
+@functools.lru_cache(maxsize=WINDOW_BANK_RATES)
+def getWindowBank(samplingFrequency):
+
+   bank = {}
+
+   for band in SPECTROGRAM_BANDS:
+      windowLength = calculateWindowParameters(samplingFrequency, band, DEFAULT_WINDOW_OVERLAP_PERCENTAGE)[2]
+      for windowFunction in WINDOW_FUNCTIONS:
+         window = signal.get_window(windowFunction, windowLength)
+         window.flags.writeable = False
+         bank[(windowFunction, windowLength)] = window
+
+   return bank
+
+
+# Window of the given function and length, from the window bank unless the length isn't one of the bands,
+# e.g. of a window shortened to a file shorter than it
+def createWindow(windowFunction, windowLength, samplingFrequency):
+
+   window = getWindowBank(samplingFrequency).get((windowFunction, windowLength))
+
+   if window is None:
+      window = signal.get_window(windowFunction, windowLength)
+      window.flags.writeable = False
+
+   return window
+
+
+# Zero padding requested through the environment, on if none
+def getRequestedFftPadding():
+   return os.environ.get(FFT_PADDING_ENVIRONMENT_VARIABLE, "1") != "0"
+
+
+# Precision requested through the environment, float32 if none or unknown
+def getRequestedPrecision():
+   precision = os.environ.get(PRECISION_ENVIRONMENT_VARIABLE, PRECISIONS[0])
+   return precision if precision in PRECISIONS else PRECISIONS[0]
+
+
+# Converts power into decibels in place and returns it. Bins below the floor are raised to it first, and
+# the ones more than dynamicRange below the loudest bin of the whole array to that level, so silence doesn't stretch the colours
+def convertToDecibels(power, dynamicRange=DEFAULT_DYNAMIC_RANGE):
+
+   np.maximum(power, POWER_FLOOR, out=power)
+   np.log10(power, out=power)
+   power *= 10
+
+   if dynamicRange != None and power.size:
+      np.maximum(power, power.max() - dynamicRange, out=power)
+
+   return power
+
+
+
+# Returns the state with the window lengths and the overlap derived from its other fields
+# and the segment reset to the whole file if it no longer fits the file or the window
+def deriveState(state):
+
+   if state.file.samplingFrequency == None:
+      return state._replace(narrowWindow=None, wideWindow=None, windowLength=None, windowOverlap=None, fftLength=None)
+
+   narrowWindow, wideWindow, windowLength, windowOverlap = calculateWindowParameters(state.file.samplingFrequency, state.spectrogramBand, state.overlapPercentage, state.file.sampleCount)
+
+   first, last = state.firstSample, state.lastSample
+
+   if first == None or last == None or first < 0 or last > state.file.sampleCount or first >= last or (last - first) < windowLength:
+      first, last = 0, state.file.sampleCount
+
+   return state._replace(narrowWindow=narrowWindow, wideWindow=wideWindow, windowLength=windowLength, windowOverlap=windowOverlap, fftLength=calculateFftLength(windowLength, state.fftPadding), firstSample=first, lastSample=last)
+
+
+
+# Frame budget requested through the environment, the default if none
+def getRequestedFrameBudget():
+   try:
+      return int(float(os.environ[FRAME_BUDGET_ENVIRONMENT_VARIABLE]) * 1024 * 1024)
+   except (KeyError, ValueError):
+      return DEFAULT_FRAME_BUDGET_BYTES
+
+
+
+# Raised by a cancellation check to abandon a calculation that became stale
+class CalculationCancelled(Exception):
+   pass
+
+
+
+# Raised before a calculation whose frames wouldn't fit into the frame budget
+class FrameBudgetExceeded(RuntimeError):
+
+   def __init__(self, frames, requiredBytes, budgetBytes):
+      super().__init__(f"The spectrogram would take {frames} frames ({requiredBytes / 2**20:.0f} MB), more than the {budgetBytes / 2**20:.0f} MB budget. Lower the overlap or select a shorter segment")
+
+      self.m_Frames = frames
+      self.m_RequiredBytes = requiredBytes
+      self.m_BudgetBytes = budgetBytes
+
+
+
+#####################################################
+# Engine class, one instance per analysed recording #
+#####################################################
+
+
+class SpectrogramEngine():
+
+   # Initialises the default values. computePool is an optional processPool.ProcessPool calculating the frames in worker processes,
+   # diskCache an optional diskCache.DiskCache keeping the frames and the envelopes of files between the runs of the app
+   def __init__(self, resultCacheBytes=DEFAULT_RESULT_CACHE_BYTES, computePool=None, diskCache=None, frameBudgetBytes=None):
+
+      # The loaded file and the analysis parameters, replaced as a whole by every change.
+      # Calculations take it once at their start, so a change made meanwhile from another thread doesn't affect them
+      self.m_State = AnalysisState(createEmptyFileState(), WINDOW_FUNCTIONS[0], SPECTROGRAM_BANDS[0], DEFAULT_WINDOW_OVERLAP_PERCENTAGE, getRequestedFftPadding(), getRequestedPrecision(), DEFAULT_DYNAMIC_RANGE, None, None, None, None, None, None, None)
+
+      # Stages of the analysis, recalculated only when their inputs change
+      self.m_Pipeline = self.createPipeline()
+
+      # Recently calculated spectrograms of any file and parameters
+      self.m_ResultCache = ResultCache(resultCacheBytes)
+
+      self.m_ComputePool = computePool
+      self.m_DiskCache = diskCache
+
+      # Memory the frames of one calculation may take, in bytes
+      self.m_FrameBudget = getRequestedFrameBudget() if frameBudgetBytes == None else frameBudgetBytes
+
+
+   # Current state, read it once and use the returned record for everything that has to be consistent
+   def getState(self):
+      return self.m_State
+
+
+   # Replaces the state by a copy with the given fields changed and the derived ones recalculated
+   def updateState(self, **changes):
+      self.m_State = deriveState(self.m_State._replace(**changes))
+      return self.m_State
+
+
+   # The stages of the analysis and the inputs each one depends on, a stage reads either fields of
+   # the state or other stages. A changed parameter recalculates the stages downstream of it only,
+   # a new file changes the identity every stage depends on, so it invalidates all of them
+   def createPipeline(self):
+
+      pipeline = PipelineGraph({"file": lambda file: file.identity})
+
+      # Decoded samples as (samples, channels)
+      pipeline.addStage("channelMatrix", ["file"], self.splitChannels)
+      pipeline.addStage("envelopePyramid", ["file"], self.createEnvelopePyramid)
+
+      # Window of the selected function and length, taken from the window bank of the sampling frequency
+      pipeline.addStage("window", ["file", "windowFunction", "windowLength"], lambda inputs, checkCancelled: createWindow(inputs["windowFunction"], inputs["windowLength"], inputs["file"].samplingFrequency))
+
+      # Frame grid of the whole file with the frames calculated so far, then the frames of the segment
+      pipeline.addStage("frameCache", ["file", "windowFunction", "window", "windowLength", "windowOverlap", "fftLength", "precision"], self.createFrameCache)
+      pipeline.addStage("frameRange", ["file", "frameCache", "firstSample", "lastSample"], self.calculateFrameRange)
+
+      # FFT of the frames, [freq, time, power], power being (channels, frequencies, frames)
+      pipeline.addStage("power", ["channelMatrix", "frameCache", "frameRange", "firstSample"], self.calculateFramePower)
+
+      # Spectrogram in dB, and the density of the same frames read chunk by chunk, so it never holds all of them
+      pipeline.addStage("logPower", ["power", "dynamicRange"], self.calculateLogPower)
+      pipeline.addStage("powerSpectralDensity", ["channelMatrix", "frameCache", "frameRange"], self.calculateFrameAverage)
+
+      return pipeline
+
+
+######################################################################################
+
+
+   #################
+   # Data handling #
+   #################
+
+
+   # Reads a wav file and loads its content into the engine. By default the file is memory mapped,
+   # so opening is instant and only the samples touched by the calculations are paged in
+   def loadFile(self, filename=None, memoryMap=True):
+
+      if filename == None:
+         raise SyntaxError("Incorrect parameters")
+      elif type(filename)!=str:
+         raise TypeError("Incorrect parameters")
+
+      data = None
+
+      with TRACER.span("file_io", memoryMap=memoryMap):
+         if memoryMap:
+            try:
+               samplingFrequency, data = wavfile.read(filename, mmap=True)
+            except ValueError:
+               # Formats like 24 bit PCM can't be mapped, those are read into RAM instead
+               data = None
+            except Exception:
+               raise RuntimeError("Could't open the file")
+
+         if data is None:
+            try:
+               samplingFrequency, data = wavfile.read(filename)
+            except Exception:
+               raise RuntimeError("Could't open the file")
+
+      # A rewritten file gets a new identity
+      status = os.stat(filename)
+      identity = (os.path.abspath(filename), status.st_size, status.st_mtime_ns)
+
+      self.loadData(data, samplingFrequency, identity, filename)
+
+
+   # Loads already decoded samples, e.g. recorded ones. Data without an identity gets a new one
+   def loadData(self, data, samplingFrequency, identity=None, filename=None):
+
+      if data is None or len(data) == 0:
+         raise ValueError("No samples passed")
+      elif samplingFrequency == None or samplingFrequency <= 0:
+         raise ValueError("Incorrect sampling frequency")
+
+      if identity == None:
+         identity = ("data", next(DATA_IDENTITIES))
+
+      # Dividing the data into channels, those are views, not copies
+      if np.ndim(data) > 1:
+         channels = tuple(data[:, channel] for channel in range(data.shape[1]))
+      else:
+         channels = (data,)
+
+      file = FileState(identity, filename, data, isinstance(data, np.memmap), int(samplingFrequency), len(data), channels)
+
+      # The segment is reset to the whole file
+      self.updateState(file=file, firstSample=None, lastSample=None)
+
+
+   # Drops the data, which also releases the memory map of the file
+   def closeFile(self):
+      self.updateState(file=createEmptyFileState(), firstSample=None, lastSample=None)
+      self.m_Pipeline.clear()
+
+      if self.m_ComputePool is not None:
+         self.m_ComputePool.releaseSamples()
+
+
+   # Sets the pool calculating the frames, None calculates them in the calling thread
+   def setComputePool(self, computePool):
+
+      if self.m_ComputePool is not None and self.m_ComputePool is not computePool:
+         self.m_ComputePool.close()
+
+      self.m_ComputePool = computePool
+
+      # The frames calculated so far are dropped along with the frame cache using the previous pool
+      self.m_Pipeline.clear()
+
+
+   def isLoaded(self):
+      return isLoaded(self.m_State)
+
+
+   def getChannelCount(self, state=None):
+      return len((state or self.m_State).file.channels)
+
+
+   # Returns the data as (samples, channels), also for mono files
+   def getChannelMatrix(self, state=None):
+      return self.m_Pipeline.evaluate("channelMatrix", state or self.m_State)
+
+
+   # Returns the selected part of a channel
+   def getSegmentData(self, channel=0, state=None):
+      state = state or self.m_State
+      return state.file.channels[channel][state.firstSample:state.lastSample]
+
+
+   # Time of the samples of the file, implied by the sampling frequency instead of stored per sample
+   def getTimeAxis(self, state=None):
+      return createTimeAxis((state or self.m_State).file)
+
+
+   ##############
+   # Parameters #
+   ##############
+
+
+   # Changes the currently set window function
+   def setWindowFunction(self, index=0):
+
+      if type(index) != int:
+         raise TypeError("Incorrect type of the argument argument")
+      elif index < 0 or index >= len(WINDOW_FUNCTIONS):
+         raise ValueError("The index is out of range of the window functions list")
+
+      self.updateState(windowFunction=WINDOW_FUNCTIONS[index])
+
+
+   # Changes the currently set spectrogram band mode
+   def setSpectrogramBand(self, index=0):
+
+      if type(index) != int:
+         raise TypeError("Incorrect type of the argument argument")
+      elif index < 0 or index >= len(SPECTROGRAM_BANDS):
+         raise ValueError("Index out of list range")
+
+      self.updateState(spectrogramBand=SPECTROGRAM_BANDS[index])
+
+
+   # Sets the overlap of the windows, values outside of (0, 100] reset to the default
+   def setWindowOverlapPercentage(self, percent=None):
+
+      if percent == None:
+         raise SyntaxError("No parameters passed")
+      elif type(percent) != int:
+         raise TypeError("Incorrect type")
+      elif percent > 0 and percent <= 100:
+         self.updateState(overlapPercentage=percent)
+      else:
+         self.updateState(overlapPercentage=DEFAULT_WINDOW_OVERLAP_PERCENTAGE)
+
+
+   # Turns the zero padding of the frames to a fast FFT length on or off
+   def setFftPadding(self, enabled=True):
+
+      if type(enabled) != bool:
+         raise TypeError("Incorrect type")
+
+      self.updateState(fftPadding=enabled)
+
+
+   # Selects the floating point type of the frames, one of PRECISIONS
+   def setPrecision(self, precision=PRECISIONS[0]):
+
+      if type(precision) != str:
+         raise TypeError("Incorrect type")
+      elif precision not in PRECISIONS:
+         raise ValueError("Unknown precision")
+
+      self.updateState(precision=precision)
+
+
+   # Sets how many decibels below the loudest bin the spectrogram reaches, None for no limit
+   def setDynamicRange(self, decibels=DEFAULT_DYNAMIC_RANGE):
+
+      if decibels != None and decibels <= 0:
+         raise ValueError("The dynamic range has to be positive")
+
+      self.updateState(dynamicRange=decibels)
+
+
+   # Resets the segment to the whole file
+   def setDefaultFileSegment(self):
+      self.updateState(firstSample=None, lastSample=None)
+
+
+   # Sets the segment, falls back to the whole file when it is empty or shorter than the window
+   def setFileSegment(self, segment):
+
+      if type(segment[0]) != int or type(segment[1]) != int:
+         raise TypeError("Incorrect parameters")
+      elif not self.isLoaded():
+         raise RuntimeError("File hasn't been opened yet")
+
+      state = self.m_State
+      self.updateState(firstSample=max(0, segment[0]), lastSample=min(state.file.sampleCount, segment[1]))
+
+
+   ################
+   # Calculations #
+   ################
+
+
+   def checkReady(self, state):
+      if not isLoaded(state):
+         raise RuntimeError("File not read")
+
+
+   # Sets the frame budget, which also bounds the blocks the frame cache keeps
+   def setFrameBudget(self, maxBytes):
+      self.m_FrameBudget = maxBytes
+
+      frameCache = self.m_Pipeline.getStoredResult("frameCache")
+      if frameCache is not None:
+         frameCache.setMaxBytes(maxBytes)
+
+
+   def getFrameBudget(self):
+      return self.m_FrameBudget
+
+
+   # Memory a single frame of every channel takes in a spectrogram
+   def getFrameBytes(self, state=None):
+      state = state or self.m_State
+      return FRAME_COPIES * self.getChannelCount(state) * (state.fftLength // 2 + 1) * np.dtype(state.precision).itemsize
+
+
+   # Amount of frames of the segment
+   def getSegmentFrameCount(self, state=None):
+      firstFrame, lastFrame = self.m_Pipeline.evaluate("frameRange", state or self.m_State)
+      return lastFrame - firstFrame
+
+
+   # Most frames of a spectrogram that fit into the frame budget
+   def getAllowedFrameCount(self, state=None):
+      return max(1, self.m_FrameBudget // self.getFrameBytes(state))
+
+
+   # Raises FrameBudgetExceeded if the frames of the segment, or the given amount of frames, wouldn't fit into the budget.
+   # Checked before anything is calculated. The blocks of the frame cache share the budget, so the least recently used
+   # ones are dropped until they fit next to the frames of the calculation
+   def checkFrameBudget(self, state=None, frames=None):
+
+      state = state or self.m_State
+      frames = self.getSegmentFrameCount(state) if frames == None else frames
+      requiredBytes = frames * self.getFrameBytes(state)
+
+      if requiredBytes > self.m_FrameBudget:
+         raise FrameBudgetExceeded(frames, requiredBytes, self.m_FrameBudget)
+
+      self.m_Pipeline.evaluate("frameCache", state).setMaxBytes(max(0, self.m_FrameBudget - requiredBytes))
+
+
+   def getWindow(self, state=None):
+      return self.m_Pipeline.evaluate("window", state or self.m_State)
+
+
+   # Short time fourier transform of every channel, returns [[freq, time, power in dB], ...]
+   # The frames come from the frame cache, so moving the segment only calculates the uncovered ones.
+   # checkCancelled is called between the calculated blocks and may raise CalculationCancelled.
+   # Raises FrameBudgetExceeded before calculating if the frames of the segment don't fit into the budget
+   def calculateSpectrogram(self, checkCancelled=None, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      result = [self.m_ResultCache.get(self.getResultKey(state, channel)) for channel in range(self.getChannelCount(state))]
+
+      if any(channelResult is None for channelResult in result):
+
+         self.checkFrameBudget(state)
+
+         # Every channel comes out of the same batched calculation
+         result = self.m_Pipeline.evaluate("logPower", state, checkCancelled)
+
+         # The stored arrays become read only
+         for channel in range(self.getChannelCount(state)):
+            self.m_ResultCache.put(self.getResultKey(state, channel), result[channel])
+
+      return result
+
+
+   # Spectrogram with no more frames than the frame budget allows, spread evenly over the view, for a segment or
+   # a view the budget refuses. Without a size the view has every frequency bin and as many frames as allowed
+   # Returns [[freq, time, power in dB], ...]
+   def calculateReducedSpectrogram(self, width=None, height=None, startTime=None, endTime=None, lowFrequency=None, highFrequency=None, checkCancelled=None, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      allowedFrames = self.getAllowedFrameCount(state)
+
+      return self.calculateViewSpectrogram(width or allowedFrames, height or state.fftLength // 2 + 1, startTime, endTime, lowFrequency, highFrequency, checkCancelled, state, allowedFrames)
+
+
+   # Returns [freq, time, power] of the frames of the segment, power being (channels, frequencies, frames).
+   # Times are relative to the beginning of the segment, as with signal.spectrogram
+   def getSegmentFrames(self, state, checkCancelled=None):
+      return self.m_Pipeline.evaluate("power", state, checkCancelled)
+
+
+   # Key of a channel's spectrogram in the result cache
+   def getResultKey(self, state, channel):
+      return (state.file.identity, channel, state.windowFunction, state.windowLength, state.windowOverlap, state.fftLength, state.precision, state.dynamicRange, state.firstSample, state.lastSample)
+
+
+   # Calculates the spectrogram of the segment directly, without the frame cache
+   def calculateSegmentSpectrogram(self, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      segment = np.asarray(self.getChannelMatrix(state)[state.firstSample:state.lastSample], dtype=state.precision).T
+
+      with TRACER.span("fft", samples=segment.shape[1], nperseg=state.windowLength, noverlap=state.windowOverlap):
+         freq, time, spectrogram = signal.spectrogram(segment, state.file.samplingFrequency, window=self.getWindow(state).astype(state.precision), nperseg=state.windowLength, noverlap=state.windowOverlap, nfft=state.fftLength, axis=-1)
+
+      with TRACER.span("log", frames=spectrogram.shape[2], frequencies=spectrogram.shape[1], channels=spectrogram.shape[0]):
+         spectrogram = convertToDecibels(spectrogram, state.dynamicRange)
+
+      return [[freq, time, spectrogram[channel]] for channel in range(self.getChannelCount(state))]
+
+
+   # Spectrogram of the visible part of the segment with about as many frames and frequency bins as the view has pixels.
+   # Frames are taken from the frame grid of the file every so many hops, the skipped ones aren't calculated, and the bins
+   # of the visible frequencies are merged by their maximum, so narrow peaks stay visible. Times are relative to the
+   # beginning of the segment and the range defaults to the whole segment, as with calculateSpectrogram
+   # maxFrames lowers the resolution further, so that no more frames are calculated
+   # Returns [[freq, time, power in dB], ...], raises FrameBudgetExceeded if the frames shown don't fit into the budget
+   def calculateViewSpectrogram(self, width, height, startTime=None, endTime=None, lowFrequency=None, highFrequency=None, checkCancelled=None, state=None, maxFrames=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      view = (width, height, startTime, endTime, lowFrequency, highFrequency, maxFrames)
+
+      result = [self.m_ResultCache.get(("view",) + self.getResultKey(state, channel) + view) for channel in range(self.getChannelCount(state))]
+
+      if any(channelResult is None for channelResult in result):
+         result = self.calculateViewFrames(state, *view, checkCancelled)
+
+         # The stored arrays become read only
+         for channel in range(self.getChannelCount(state)):
+            self.m_ResultCache.put(("view",) + self.getResultKey(state, channel) + view, result[channel])
+
+      return result
+
+
+   # Calculates the spectrogram of a view, see calculateViewSpectrogram
+   def calculateViewFrames(self, state, width, height, startTime, endTime, lowFrequency, highFrequency, maxFrames, checkCancelled=None):
+
+      file = state.file
+
+      firstSample = state.firstSample if startTime == None else state.firstSample + int(startTime * file.samplingFrequency)
+      lastSample = state.lastSample if endTime == None else state.firstSample + int(np.ceil(endTime * file.samplingFrequency))
+
+      firstSample = min(max(firstSample, state.firstSample), state.lastSample)
+      lastSample = min(max(lastSample, firstSample), state.lastSample)
+
+      frameCache = self.m_Pipeline.evaluate("frameCache", state)
+      firstFrame, lastFrame = frameCache.getFrameRange(file.sampleCount, firstSample, lastSample)
+
+      stride = max(1, (lastFrame - firstFrame) // max(1, int(width * VIEW_FRAMES_PER_PIXEL)))
+      if maxFrames != None:
+         stride = max(stride, -(-(lastFrame - firstFrame) // maxFrames))
+      frames = np.arange(firstFrame, lastFrame, stride)
+
+      self.checkFrameBudget(state, len(frames))
+
+      with TRACER.span("view_frames", frames=len(frames), stride=stride):
+         # Frames already in the cache cost nothing, the others are calculated only if they are shown
+         if stride == 1:
+            power = frameCache.getFrames(self.getChannelMatrix(state), firstFrame, lastFrame, checkCancelled)
+         else:
+            power = frameCache.calculateSelectedFrames(self.getChannelMatrix(state), frames, checkCancelled)
+
+      time = frameCache.getFrameTimes(firstFrame, lastFrame)[::stride] - state.firstSample / file.samplingFrequency
+      freq = frameCache.m_Frequencies
+
+      # Visible bins, merged when there are more of them than pixels
+      lowBin = 0 if lowFrequency == None else int(np.searchsorted(freq, lowFrequency, side="right")) - 1
+      highBin = len(freq) if highFrequency == None else int(np.searchsorted(freq, highFrequency, side="left")) + 1
+      lowBin, highBin = max(lowBin, 0), min(max(highBin, lowBin + 1), len(freq))
+
+      group = max(1, (highBin - lowBin) // max(1, int(height * VIEW_BINS_PER_PIXEL)))
+      starts = np.arange(lowBin, highBin, group)
+
+      if group > 1:
+         power = np.maximum.reduceat(power[:, lowBin:highBin], starts - lowBin, axis=1)
+         freq = (freq[starts] + freq[np.minimum(starts + group, highBin) - 1]) / 2
+      else:
+         # A copy, the frames may be the cached ones
+         power = np.array(power[:, lowBin:highBin])
+         freq = freq[lowBin:highBin]
+
+      with TRACER.span("log", frames=power.shape[2], frequencies=power.shape[1], channels=power.shape[0]):
+         power = convertToDecibels(power, state.dynamicRange)
+
+      return [[freq, time, power[channel]] for channel in range(power.shape[0])]
+
+
+   # Spectrogram of the whole file written chunk by chunk into a memory mapped .npy store.
+   # The memory used depends on chunkFrames only, the power is the same as signal.spectrogram gives
+   # Returns [freq, time, store], store being (channels, frequencies, frames)
+   def calculateStreamingSpectrogram(self, outputPath, chunkFrames=streamingStft.DEFAULT_CHUNK_FRAMES, checkCancelled=None, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      return streamingStft.calculateStreamingSpectrogram(self.getChannelMatrix(state), state.file.samplingFrequency, self.getWindow(state), state.windowLength, state.windowOverlap, outputPath, chunkFrames, checkCancelled, state.fftLength, state.precision)
+
+
+   # Power spectral density of the segment of every channel, returns [[freq, psd], ...]
+   # Welch's method averages the power of the overlapping frames, which are the frames of the spectrogram,
+   # so the density is their mean and costs no FFT for the frames still in the frame cache
+   def calculatePowerSpectralDensity(self, checkCancelled=None, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      result = [self.m_ResultCache.get(("psd",) + self.getResultKey(state, channel)) for channel in range(self.getChannelCount(state))]
+
+      if any(channelResult is None for channelResult in result):
+
+         if self.getSegmentFrameCount(state) * self.getFrameBytes(state) <= self.m_FrameBudget:
+            result = self.m_Pipeline.evaluate("powerSpectralDensity", state, checkCancelled)
+         else:
+            # Too many frames to hold, every so many of them are averaged instead, which is Welch's method with a longer hop
+            frameCache = self.m_Pipeline.evaluate("frameCache", state)
+            firstFrame, lastFrame = self.m_Pipeline.evaluate("frameRange", state)
+
+            stride = -(-(lastFrame - firstFrame) // self.getAllowedFrameCount(state))
+            power = frameCache.calculateSelectedFrames(self.getChannelMatrix(state), np.arange(firstFrame, lastFrame, stride), checkCancelled)
+
+            with TRACER.span("psd_average", frames=power.shape[2], stride=stride):
+               psd = power.mean(axis=2, dtype=np.float64)
+
+            result = [[frameCache.m_Frequencies, psd[channel]] for channel in range(psd.shape[0])]
+
+         for channel in range(self.getChannelCount(state)):
+            self.m_ResultCache.put(("psd",) + self.getResultKey(state, channel), result[channel])
+
+      return result
+
+
+   # Min/max/RMS envelope of every channel with at least the given amount of points,
+   # taken from the envelope pyramid. Covers the segment unless a range of samples is given
+   # Returns [time, [[minimum, maximum, rms], ...]]
+   def calculateWaveformEnvelope(self, bins=2048, firstSample=None, lastSample=None, state=None):
+
+      state = state or self.m_State
+      self.checkReady(state)
+
+      if firstSample == None:
+         firstSample = state.firstSample
+      if lastSample == None:
+         lastSample = state.lastSample
+
+      with TRACER.span("waveform_envelope", samples=lastSample - firstSample, bins=bins):
+         return self.m_Pipeline.evaluate("envelopePyramid", state).getEnvelope(firstSample, lastSample, bins)
+
+
+   ##########
+   # Stages #
+   ##########
+
+
+   # Every stage is called as stage(inputs, checkCancelled) by the pipeline, inputs holding the values named in createPipeline
+
+
+   def splitChannels(self, inputs, checkCancelled=None):
+      data = inputs["file"].data
+      if np.ndim(data) > 1:
+         return data
+      return data[:, np.newaxis]
+
+
+   # Min/max/RMS envelope levels of the whole file, built on the first drawing of the waveform
+   # or read from the disk cache if the file was drawn by an earlier run
+   def createEnvelopePyramid(self, inputs, checkCancelled=None):
+
+      file = inputs["file"]
+      diskCache = self.getDiskCache(file)
+      key = ("envelope", file.identity, BASE_BLOCK, LEVEL_FACTOR)
+
+      if diskCache is not None:
+         stored = diskCache.get(key)
+         if stored is not None:
+            # Stored as [minimum, maximum, sum of squares] of every level, finest first
+            levels = [[BASE_BLOCK * LEVEL_FACTOR ** (index // 3)] + stored[index:index + 3] for index in range(0, len(stored), 3)]
+            return EnvelopePyramid(list(file.channels), file.samplingFrequency, levels=levels)
+
+      with TRACER.span("envelope_pyramid", samples=file.sampleCount, channels=len(file.channels)):
+         envelopePyramid = EnvelopePyramid(list(file.channels), file.samplingFrequency)
+
+      if diskCache is not None:
+         diskCache.put(key, [array for level in envelopePyramid.m_Levels for array in level[1:]])
+
+      return envelopePyramid
+
+
+   # Empty frame cache of the file and the window, the frames are calculated as segments need them.
+   # The blocks it keeps are bounded by the frame budget
+   def createFrameCache(self, inputs, checkCancelled=None):
+      file = inputs["file"]
+      frameCache = FrameCache(maxBytes=self.m_FrameBudget)
+      frameCache.configure((file.identity, inputs["windowFunction"], inputs["windowLength"], inputs["windowOverlap"], inputs["fftLength"], inputs["precision"]), inputs["window"], inputs["windowLength"], inputs["windowOverlap"], file.samplingFrequency, inputs["fftLength"], inputs["precision"])
+
+      if self.m_ComputePool is not None:
+         frameCache.setComputePool(self.m_ComputePool, file.identity)
+
+      frameCache.setDiskCache(self.getDiskCache(file))
+
+      return frameCache
+
+
+   # The disk cache, if there is one and the data came from a file. Other data gets a new identity in every run,
+   # so its entries could never be found again
+   def getDiskCache(self, file):
+      if self.m_DiskCache is None or file.name == None:
+         return None
+      return self.m_DiskCache
+
+
+   # [first frame, last frame) of the segment
+   def calculateFrameRange(self, inputs, checkCancelled=None):
+      return inputs["frameCache"].getFrameRange(inputs["file"].sampleCount, inputs["firstSample"], inputs["lastSample"])
+
+
+   # [freq, time, power] of the frames of the segment, calculating only the frames that aren't cached yet
+   def calculateFramePower(self, inputs, checkCancelled=None):
+
+      frameCache = inputs["frameCache"]
+      firstFrame, lastFrame = inputs["frameRange"]
+
+      # Relative to the beginning of the segment
+      time = frameCache.getFrameTimes(firstFrame, lastFrame) - inputs["firstSample"] / frameCache.m_SamplingFrequency
+
+      return [frameCache.m_Frequencies, time, frameCache.getFrames(inputs["channelMatrix"], firstFrame, lastFrame, checkCancelled)]
+
+
+   # [[freq, time, power in dB], ...] of every channel. The power itself is kept for the density,
+   # so the decibels are one copy of it converted in place, of the same precision
+   def calculateLogPower(self, inputs, checkCancelled=None):
+
+      freq, time, spectrogram = inputs["power"]
+
+      with TRACER.span("log", frames=spectrogram.shape[2], frequencies=spectrogram.shape[1], channels=spectrogram.shape[0]):
+         decibels = convertToDecibels(np.array(spectrogram), inputs["dynamicRange"])
+
+      return [[freq, time, decibels[channel]] for channel in range(decibels.shape[0])]
+
+
+   # [[freq, psd], ...] of every channel, the mean of the frames as in Welch's method.
+   # The frames are summed a few blocks at a time, only the sum is kept
+   def calculateFrameAverage(self, inputs, checkCancelled=None):
+
+      frameCache = inputs["frameCache"]
+      firstFrame, lastFrame = inputs["frameRange"]
+      chunkFrames = DENSITY_CHUNK_BLOCKS * frameCache.m_FramesPerBlock
+
+      total = 0
+
+      with TRACER.span("psd_average", frames=lastFrame - firstFrame):
+         first = firstFrame
+         while first < lastFrame:
+            # Chunks end on the block boundaries, so no block is calculated twice
+            last = min((first // chunkFrames + 1) * chunkFrames, lastFrame)
+
+            # Summed in float64 whatever the precision of the frames
+            total = total + frameCache.getFrames(inputs["channelMatrix"], first, last, checkCancelled).sum(axis=2, dtype=np.float64)
+            first = last
+
+      psd = total / (lastFrame - firstFrame)
+
+      return [[frameCache.m_Frequencies, psd[channel]] for channel in range(psd.shape[0])]
@@ -0,0 +1,142 @@
+
+#############################################################################
+# Timing of the stages of the pipeline. Every stage wraps itself in a span, #
+# which costs a single flag check while the tracing is off. The recorded    #
+# spans can be summarised for the status bar or exported as a Chrome trace  #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+
+# Spans kept for the export, the oldest ones are dropped first
+MAX_EVENTS = 100000
+
+# Turns the tracing on at startup
+TRACE_ENVIRONMENT_VARIABLE = "SPECTROAPP_TRACE"
+
+
+
+# Returned while the tracing is off, entering and leaving it does nothing
+class NullSpan():
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exception):
+      return False
+
+
+NULL_SPAN = NullSpan()
+
+
+
+# Measures the time between entering and leaving it
+class Span():
+
+   __slots__ = ["m_Tracer", "m_Name", "m_Arguments", "m_Start"]
+
+   def __init__(self, tracer, name, arguments):
+      self.m_Tracer = tracer
+      self.m_Name = name
+      self.m_Arguments = arguments
+      self.m_Start = None
+
+   def __enter__(self):
+      self.m_Start = time.perf_counter_ns()
+      return self
+
+   def __exit__(self, *exception):
+      self.m_Tracer.record(self.m_Name, self.m_Start, time.perf_counter_ns(), self.m_Arguments)
+      return False
+
+
+
+class StageTracer():
+
+   # Initialises the default values
+   def __init__(self, maxEvents=MAX_EVENTS, enabled=False):
+
+      self.mb_Enabled = enabled
+
+      # [name, start, end, thread, arguments] of every recorded span, times in ns
+      self.m_Events = collections.deque(maxlen=maxEvents)
+
+      # Duration of the latest span of every stage, in ns, in the order the stages first ran
+      self.m_Latest = {}
+
+      # thread id -> thread name, for the export
+      self.m_ThreadNames = {}
+
+
+   def setEnabled(self, enabled=True):
+      self.mb_Enabled = enabled
+
+
+   def isEnabled(self):
+      return self.mb_Enabled
+
+
+   # Forgets every recorded span
+   def clear(self):
+      self.m_Events.clear()
+      self.m_Latest = {}
+
+
+   # Returns a context manager timing a stage, the arguments are stored with the span (e.g. samples, nperseg)
+   def span(self, name, **arguments):
+      if not self.mb_Enabled:
+         return NULL_SPAN
+      return Span(self, name, arguments)
+
+
+   # Stores a finished span, can be called from any thread
+   def record(self, name, start, end, arguments=None):
+
+      thread = threading.get_ident()
+      if thread not in self.m_ThreadNames:
+         self.m_ThreadNames[thread] = threading.current_thread().name
+
+      self.m_Events.append([name, start, end, thread, arguments or {}])
+      self.m_Latest[name] = end - start
+
+
+   # One line with the latest duration of every stage
+   def getSummary(self):
+      return " | ".join(f"{name} {duration / 1e6:.1f} ms" for name, duration in list(self.m_Latest.items()))
+
+
+   # Returns the recorded spans in the Chrome trace event format, readable by chrome://tracing and Perfetto
+   def getChromeTrace(self):
+
+      events = list(self.m_Events)
+      origin = min((event[1] for event in events), default=0)
+      process = os.getpid()
+
+      trace = [{"name": "thread_name", "ph": "M", "pid": process, "tid": thread, "args": {"name": name}} for thread, name in list(self.m_ThreadNames.items())]
+
+      for name, start, end, thread, arguments in events:
+         trace.append({"name": name, "ph": "X", "ts": (start - origin) / 1000, "dur": (end - start) / 1000, "pid": process, "tid": thread, "args": arguments})
+
+      return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+   # Writes the Chrome trace into a JSON file
+   def exportChromeTrace(self, filename):
+      with open(filename, "w") as file:
+         json.dump(self.getChromeTrace(), file)
+
+
+
+# Shared by the backend and the GUI
+TRACER = StageTracer(enabled=os.environ.get(TRACE_ENVIRONMENT_VARIABLE, "") not in ["", "0"])
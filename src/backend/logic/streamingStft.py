@@ -0,0 +1,110 @@
+
+#############################################################################
+# Out of core short time fourier transform. Samples are read from the       #
+# (memory mapped) data chunk by chunk, the window overlap is carried over   #
+# between the chunks and the frames are written into a memory mapped .npy  #
+# store, so the memory used depends on the chunk size, not the file length #
+#############################################################################
+
+
+###########
+# Imports #
+###########
+
+
+from scipy import signal
+import scipy.fft
+import numpy as np
+
+# FFT threads of the frame calculations
+from . import frameCache
+
+
+
+# Frames calculated per chunk
+DEFAULT_CHUNK_FRAMES = 4096
+
+
+
+# Amount of frames of a whole signal, the same as signal.spectrogram gives
+def getFrameCount(sampleCount, windowLength, windowOverlap):
+   if sampleCount < windowLength:
+      return 0
+   return (sampleCount - windowLength) // (windowLength - windowOverlap) + 1
+
+
+# Yields (first frame, samples) of consecutive chunks of data, which is (samples, channels).
+# Every chunk reads only new samples and reuses the last windowLength - hop samples of the previous one
+def readChunks(data, windowLength, windowOverlap, chunkFrames=DEFAULT_CHUNK_FRAMES):
+
+   hop = windowLength - windowOverlap
+   frameCount = getFrameCount(len(data), windowLength, windowOverlap)
+
+   # Samples that aren't covered by any frame are never read
+   lastSample = (frameCount - 1) * hop + windowLength if frameCount > 0 else 0
+
+   carry = np.asarray(data[0:0])
+   position = 0
+   firstFrame = 0
+
+   while position < lastSample:
+
+      # Enough new samples for chunkFrames more frames
+      newSamples = chunkFrames * hop if firstFrame > 0 else (chunkFrames - 1) * hop + windowLength
+      block = np.asarray(data[position:min(position + newSamples, lastSample)])
+      position += len(block)
+
+      samples = np.concatenate((carry, block)) if len(carry) else block
+      frames = getFrameCount(len(samples), windowLength, windowOverlap)
+
+      if frames == 0:
+         carry = samples
+         continue
+
+      yield firstFrame, samples[:(frames - 1) * hop + windowLength]
+
+      # The overlap of the next chunk starts with the first frame that wasn't calculated yet
+      carry = samples[frames * hop:]
+      firstFrame += frames
+
+
+# Yields (first frame, power) of the chunks, power being (channels, frequencies, frames).
+# checkCancelled is called before every chunk and may raise to abandon the work.
+# The frames are zero padded to fftLength if given and calculated in the floating point type dtype
+def generateFrames(data, samplingFrequency, window, windowLength, windowOverlap, chunkFrames=DEFAULT_CHUNK_FRAMES, checkCancelled=None, fftLength=None, dtype=np.float64):
+   window = np.asarray(window, dtype=dtype)
+
+   for firstFrame, samples in readChunks(data, windowLength, windowOverlap, chunkFrames):
+      if checkCancelled is not None:
+         checkCancelled()
+      with scipy.fft.set_workers(frameCache.FFT_WORKERS):
+         _, _, power = signal.spectrogram(np.asarray(samples, dtype=dtype).T, samplingFrequency, window=window, nperseg=windowLength, noverlap=windowOverlap, nfft=fftLength, axis=-1)
+      yield firstFrame, power
+
+
+# Calculates the spectrogram of the whole data, (samples, channels), into a memory mapped .npy file
+# Returns [freq, time, store], store being the (channels, frequencies, frames) memory map
+def calculateStreamingSpectrogram(data, samplingFrequency, window, windowLength, windowOverlap, outputPath, chunkFrames=DEFAULT_CHUNK_FRAMES, checkCancelled=None, fftLength=None, dtype=np.float64):
+
+   hop = windowLength - windowOverlap
+   frameCount = getFrameCount(len(data), windowLength, windowOverlap)
+
+   if frameCount == 0:
+      raise ValueError("The data is shorter than the window")
+
+   freq = np.fft.rfftfreq(fftLength or windowLength, 1 / samplingFrequency)
+   time = (np.arange(frameCount) * hop + windowLength / 2) / samplingFrequency
+
+   store = np.lib.format.open_memmap(outputPath, mode="w+", dtype=dtype, shape=(data.shape[1], len(freq), frameCount))
+
+   for firstFrame, power in generateFrames(data, samplingFrequency, window, windowLength, windowOverlap, chunkFrames, checkCancelled, fftLength, dtype):
+      store[:, :, firstFrame:firstFrame + power.shape[2]] = power
+
+   store.flush()
+
+   return [freq, time, store]
+
+
+# Opens a store written by calculateStreamingSpectrogram, without reading it into memory
+def openSpectrogramStore(path):
+   return np.load(path, mmap_mode="r")
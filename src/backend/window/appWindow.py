@@ -31,16 +31,36 @@ from matplotlib.widgets import SpanSelector
 # System Imports
 import sys
 import os
-from copy import copy
 
 # Logic module import
 from ..logic.appLogic import appLogic as logic
+from ..logic.computeScheduler import ComputeScheduler
+from ..logic.stageTracer import TRACER
+from ..logic.analysisState import getSampleIndex
 
 
 
 # Base directory global variable
 basedir = os.path.dirname(__file__)
 
+# Colormap of the spectrograms
+SPECTROGRAM_COLORMAP = "plasma"
+
+# How many seconds of a live recording stay visible
+LIVE_VIEW_DURATION = 10
+
+# Power given to silent bins of the spectral distribution, keeps the decibels finite
+SPECTRAL_DISTRIBUTION_FLOOR = 1e-20
+
+# Seconds skipped by fast forward and rewind
+PLAYBACK_SKIP_DURATION = 5
+
+
+
+# Precomputes the RGBA colours of the 256 levels of a colormap
+def createColormapTable(name, levels=256):
+   return (matplotlib.colormaps[name](np.linspace(0, 1, levels)) * 255).astype(np.uint8)
+
 
 
 class PlotCanvas(FigureCanvasQTAgg):
@@ -64,6 +84,9 @@ class PlotCanvas(FigureCanvasQTAgg):
       self.m_Plots = None
       self.m_Figure = Figure(figsize=(width, height), dpi=dpi)
 
+      # Lookup table mapping the 8 bit spectrogram levels to colours
+      self.m_ColormapTable = createColormapTable(SPECTROGRAM_COLORMAP)
+
       #########
       # Setup #
       #########
@@ -80,10 +103,15 @@ class PlotCanvas(FigureCanvasQTAgg):
 
 
    def addTwoHorizontalPlots(self):
-      self.m_GridSpace = self.m_Figure.add_gridspec(2, hspace=0.2)
-      self.m_Plots = self.m_GridSpace.subplots()
-      self.m_Plots[0].set_xticklabels([])
-      self.m_Plots[0].set_xticks([])
+      self.addStackedPlots(2)
+
+
+   # Adds the given amount of plots stacked on top of each other, only the bottom one has time ticks
+   def addStackedPlots(self, count):
+      self.m_GridSpace = self.m_Figure.add_gridspec(count, hspace=0.2)
+      self.m_Plots = self.m_GridSpace.subplots(sharex=True)
+      for plot in self.m_Plots[:-1]:
+         plot.tick_params(labelbottom=False)
       self.m_MultiplePlots = True
       self.m_StackedVerticaly = True
 
@@ -104,14 +132,119 @@ class PlotCanvas(FigureCanvasQTAgg):
 
    def createSpectrogramPlot(self, data):
       if not (self.m_MultiplePlots == True and self.m_StackedVerticaly == True):
-         self.m_Plots.pcolormesh(self.backend.getFirstChannelTimeSegments(), self.backend.getFirstChannelFrequencySamples(), self.backend.getFirstChannelSpectrogramData(), cmap="plasma")
+         self.drawSpectrogramImage(self.m_Plots, data[0])
+      else:
+         for plot, channel in zip(self.m_Plots, data):
+            self.drawSpectrogramImage(plot, channel)
+
+
+   # Draws [freq, time, values] as a single image instead of a mesh of polygons.
+   # The values are scaled to 8 bits and coloured through the lookup table
+   def drawSpectrogramImage(self, axes, data):
+
+      freq, time, values = data
+
+      # Values that aren't finite don't take part in the scaling
+      finite = np.isfinite(values)
+      if finite.any():
+         lowest = values[finite].min()
+         highest = values[finite].max()
+      else:
+         lowest, highest = 0.0, 1.0
+
+      scale = 255 / (highest - lowest) if highest > lowest else 0.0
+
+      levels = np.nan_to_num(values, nan=lowest, posinf=highest, neginf=lowest)
+      levels = np.clip((levels - lowest) * scale, 0, 255).astype(np.uint8)
+
+      # Bins are centred on their time and frequency, as with pcolormesh
+      frequencyStep = freq[1] - freq[0] if len(freq) > 1 else 1.0
+      timeStep = time[1] - time[0] if len(time) > 1 else 1 / frequencyStep
+
+      extent = [time[0] - timeStep / 2, time[-1] + timeStep / 2, freq[0] - frequencyStep / 2, freq[-1] + frequencyStep / 2]
+
+      axes.imshow(self.m_ColormapTable[levels], origin="lower", extent=extent, aspect="auto", interpolation="nearest")
+
+
+   # Creates one scrolling image per channel, showing the last seconds of a live input.
+   # The colours span dynamicRange dB, the range of the spectrogram of a file
+   def startLiveSpectrogram(self, freq, channels, frameRate, dynamicRange, seconds=LIVE_VIEW_DURATION):
+
+      if channels > 1:
+         self.addStackedPlots(channels)
+         plots = self.m_Plots
       else:
-         self.m_Plots[0].pcolormesh(data[0][1], data[0][0], data[0][2], cmap="plasma")
-         self.m_Plots[1].pcolormesh(data[1][1], data[1][0], data[1][2], cmap="plasma")
+         self.addSinglePlot()
+         plots = [self.m_Plots]
+
+      self.m_LiveLevels = np.zeros((channels, len(freq), max(1, int(seconds * frameRate))), dtype=np.uint8)
+      self.m_LiveHighest = None
+      self.m_LiveDynamicRange = dynamicRange
+
+      frequencyStep = freq[1] - freq[0]
+      extent = [-seconds, 0, freq[0] - frequencyStep / 2, freq[-1] + frequencyStep / 2]
+
+      self.m_LiveImages = [plot.imshow(self.m_ColormapTable[self.m_LiveLevels[channel]], origin="lower", extent=extent, aspect="auto", interpolation="nearest") for channel, plot in enumerate(plots)]
+
+
+   # Scrolls the new frames, (channels, frequencies, frames) of power in dB, into the live images.
+   # The colours follow the loudest bin seen so far, as the range of the whole recording isn't known yet
+   def appendLiveSpectrogram(self, decibels):
+
+      highest = decibels.max()
+      self.m_LiveHighest = highest if self.m_LiveHighest is None else max(self.m_LiveHighest, highest)
+      lowest = self.m_LiveHighest - self.m_LiveDynamicRange
+
+      levels = np.clip((decibels - lowest) * (255 / self.m_LiveDynamicRange), 0, 255).astype(np.uint8)
+      count = min(levels.shape[2], self.m_LiveLevels.shape[2])
+
+      self.m_LiveLevels = np.roll(self.m_LiveLevels, -count, axis=2)
+      self.m_LiveLevels[:, :, -count:] = levels[:, :, -count:]
+
+      for channel, image in enumerate(self.m_LiveImages):
+         image.set_data(self.m_ColormapTable[self.m_LiveLevels[channel]])
+
+
+   # Creates the min/max lines of every channel, showing the last seconds of a live input
+   def startLiveWaveform(self, channels, pointRate, seconds=LIVE_VIEW_DURATION):
+
+      self.addSinglePlot()
+
+      # [minimum, maximum] of every channel, (2, channels, points)
+      self.m_LiveEnvelope = np.zeros((2, channels, max(1, int(seconds * pointRate))), dtype=np.float32)
+      time = np.linspace(-seconds, 0, self.m_LiveEnvelope.shape[2])
+
+      self.m_LiveLines = []
+      for channel in range(channels):
+         color = f"C{channel}"
+         self.m_LiveLines.append([self.m_Plots.plot(time, self.m_LiveEnvelope[0, channel], color=color, linewidth=0.8)[0], self.m_Plots.plot(time, self.m_LiveEnvelope[1, channel], color=color, linewidth=0.8)[0]])
+
+      self.m_Plots.set_xlim(-seconds, 0)
+      self.m_Plots.set_ylim(-1, 1)
+
 
+   # Scrolls the [minimum, maximum] envelope of the new samples, (channels, points) each, into the lines
+   def appendLiveWaveform(self, envelope):
 
+      new = np.stack(envelope)
+      count = min(new.shape[2], self.m_LiveEnvelope.shape[2])
+
+      self.m_LiveEnvelope = np.roll(self.m_LiveEnvelope, -count, axis=2)
+      self.m_LiveEnvelope[:, :, -count:] = new[:, :, -count:]
+
+      for channel, (minimum, maximum) in enumerate(self.m_LiveLines):
+         minimum.set_ydata(self.m_LiveEnvelope[0, channel])
+         maximum.set_ydata(self.m_LiveEnvelope[1, channel])
+
+
+   # Draws the power spectral density of every channel in decibels, frequency runs upwards like on the spectrogram
    def createSpectralDistributionPlot(self, data):
-      print('')
+
+      for channel, (freq, psd) in enumerate(data):
+         self.m_Plots.plot(10 * np.log10(np.maximum(psd, SPECTRAL_DISTRIBUTION_FLOOR)), freq, color=f"C{channel}", linewidth=0.8)
+
+      self.m_Plots.set_ylim(freq[0], freq[-1])
+      self.m_Plots.set_xlabel("dB/Hz")
 
 
    def clearCanvas(self):
@@ -167,12 +300,38 @@ class Window(QMainWindow):
       self.m_LowerIndex = None
       self.m_HigherIndex = None
 
+      # Currently drawn part of the waveform, [start, end] in seconds
+      self.m_WaveformView = None
+
+      # Segment selector of the waveform axes and the envelope drawn under it
+      self.span = None
+      self.m_WaveformArtists = []
+
+      # How much a single scroll step zooms the waveform
+      self.m_WaveformZoomFactor = 1.5
+
+      # Visible part of the spectrogram, [start, end] in seconds from the beginning of the segment
+      # and [lowest, highest] frequency, None shows the whole segment
+      self.m_SpectrogramView = None
+
+      # How much a single scroll step zooms the spectrogram
+      self.m_SpectrogramZoomFactor = 1.5
+
       # Some boolean flags
       self.mb_FileOpened = False
       self.mb_FileSaved = False
       self.mb_Mono = False
       self.mb_Stereo = False
 
+      # Amount of channels of the opened file, every one gets its own spectrogram
+      self.m_ChannelCount = 0
+
+      # Generation of the request made right after opening the current file, older results belong to another file
+      self.m_FileGeneration = 0
+
+      # kind -> version of the latest drawn snapshot
+      self.m_DrawnVersions = {}
+
 
       ############################
       # Backend mt functionality #
@@ -185,6 +344,9 @@ class Window(QMainWindow):
       # Moving this object to another thread
       self.backend.moveToThread(self.m_BackendThread)
 
+      # Collapses the parameter changes piling up while the backend is busy
+      self.m_Scheduler = ComputeScheduler(self.backend)
+
       # Setter signals
       self.backend.send_file_name.connect(self.setFileName)
       self.backend.send_window_function_list.connect(self.setWindowFunctionsList)
@@ -195,14 +357,22 @@ class Window(QMainWindow):
       self.backend.send_file_saved_status.connect(self.setFileSavedFlag)
       self.backend.send_mono_status.connect(self.setMonoFlag)
       self.backend.send_stereo_status.connect(self.setStereoFlag)
+      self.backend.send_channel_count.connect(self.setChannelCount)
       self.backend.send_file_data.connect(self.setFileData)
       self.backend.send_time_data.connect(self.setTimeData)
       self.backend.send_channel_data.connect(self.setSpectrogramData)
       self.backend.recording_length_dialog.connect(self.setRecordingLength)
 
+      # Live recording view
+      self.backend.send_live_recording_started.connect(self.startLiveView)
+      self.backend.send_live_data.connect(self.updateLiveView)
+      self.backend.send_recording_finished.connect(self.finishRecording)
+      self.backend.send_status_message.connect(self.showStatusMessage)
+
       # Main plot updating signals
       self.backend.send_freq_response_data.connect(self.updateFrequencyResponse)
       self.backend.send_spectrogram_data.connect(self.updateSpectrogram)
+      self.backend.send_spectral_distribution_data.connect(self.updateSpectralDistribution)
 
       # Getting needed data to start the application
       self.backend.get_window_function_list.emit()
@@ -308,6 +478,23 @@ class Window(QMainWindow):
       recording_action.setStatusTip("Starts the recording")
       recording_action.setCheckable(True)
       recording_action.triggered.connect(self.startOrStopAudioRecording)
+      self.m_RecordingAction = recording_action
+
+      ##################
+      # Timing actions #
+      ##################
+
+      # Records how long every stage of the calculations and the drawing takes
+      record_timings_action = QAction("Record Timings", self)
+      record_timings_action.setStatusTip("Shows the duration of every stage in the status bar")
+      record_timings_action.setCheckable(True)
+      record_timings_action.setChecked(TRACER.isEnabled())
+      record_timings_action.triggered.connect(self.setTimingsRecording)
+
+      # Saves the recorded timings as a Chrome trace
+      export_timings_action = QAction("Export Timings", self)
+      export_timings_action.setStatusTip("Saves the recorded timings for chrome://tracing or Perfetto")
+      export_timings_action.triggered.connect(self.exportTimings)
 
       ##############################
       # Creating Help Actions #
@@ -343,6 +530,11 @@ class Window(QMainWindow):
       recorder_submenu = self.toolsMenu.addMenu("Recorder")
       recorder_submenu.addAction(recording_action)
 
+      # Timings submenu with added actions
+      timings_submenu = self.toolsMenu.addMenu("Timings")
+      timings_submenu.addAction(record_timings_action)
+      timings_submenu.addAction(export_timings_action)
+
       #############################################
       # Connecting created actions to the toolbar #
       #############################################
@@ -403,10 +595,16 @@ class Window(QMainWindow):
 
       super(Window, self).closeEvent(event)
 
-      self.backend.close_file.emit()
+      # A running calculation is abandoned, so the backend thread doesn't finish it first
+      self.m_Scheduler.cancel()
 
       self.m_BackendThread.quit()
 
+      # Once the thread is done with the engine, the file is closed and the worker processes are stopped here
+      self.m_BackendThread.wait()
+      self.backend.closeFile()
+      self.backend.closeComputePool()
+
 
 
 #################################################################################
@@ -474,6 +672,10 @@ class Window(QMainWindow):
       self.mb_Stereo = value
 
 
+   def setChannelCount(self, value):
+      self.m_ChannelCount = value
+
+
    # After opening a new file
    def setBaseLayout(self):
 
@@ -491,6 +693,11 @@ class Window(QMainWindow):
       self.baseLayout.addLayout(self.spectralDistributionLayout, 0, 8, 13, 1, Qt.AlignmentFlag.AlignTop)
 
       self.freqLayout.addWidget(self.freq_resp_widget)
+
+      # Scrolling zooms the waveform and the spectrogram, double clicking the waveform moves the playback
+      self.freq_resp_widget.mpl_connect("scroll_event", self.onWaveformScroll)
+      self.freq_resp_widget.mpl_connect("button_press_event", self.onWaveformClick)
+      self.spectrogram_widget.mpl_connect("scroll_event", self.onSpectrogramScroll)
       self.spectrogramLayout.addWidget(self.spectrogram_widget)
       self.spectralDistributionLayout.addWidget(self.spectral_distribution_widget)
 
@@ -521,6 +728,7 @@ class Window(QMainWindow):
 
          if answer == message.Yes:
             self.backend.save_file.emit()
+            self.m_Scheduler.cancel()
             self.backend.close_file.emit()
 
       # Getting the new file name
@@ -549,6 +757,7 @@ class Window(QMainWindow):
 
          if answer == message.Yes:
             self.backend.save_file.emit()
+            self.m_Scheduler.cancel()
             self.backend.close_file.emit()
       
       if self.mb_FileOpened:
@@ -559,8 +768,12 @@ class Window(QMainWindow):
 
       if not name[0] == '':
 
+         # Parameters pending for the previous file don't apply to this one, a running job is abandoned
+         self.m_Scheduler.cancel()
+
          # Reading the file content
          self.backend.open_file.emit(name[0])
+         self.setSpectrogramView()
       
          # Adding the spectrogram
          self.spectrogram_widget.clearCanvas()
@@ -572,8 +785,8 @@ class Window(QMainWindow):
          self.backend.get_file_saved_status.emit()
          self.backend.get_file_status.emit()
 
-         self.backend.prepare_freq_response_data.emit()
-         self.backend.prepare_spectrogram_data.emit()
+         self.m_Scheduler.requestCalculation("freq_response", "spectrogram", "spectral_distribution")
+         self.startFileGeneration()
 
 
    def saveFileWithCurrentName(self):
@@ -604,18 +817,37 @@ class Window(QMainWindow):
       # Updates the data about the channels
       self.backend.get_mono_status.emit()
       self.backend.get_stereo_status.emit()
+      self.backend.get_channel_count.emit()
 
-      # If the file is mono, creates a mono spectrogram, otherwise does the same for stereo
+      # If the file is mono, creates a mono spectrogram, otherwise stacks one per channel
       if self.mb_Mono:
          self.spectrogram_widget.addSinglePlot()
          self.spectrogram_widget.m_Figure.tight_layout()
 
       elif self.mb_Stereo:
-         self.spectrogram_widget.addTwoHorizontalPlots()
+         self.spectrogram_widget.addStackedPlots(self.m_ChannelCount)
          self.spectrogram_widget.m_Figure.tight_layout()
 
 
-   def updateSpectrogram(self, value):
+   # Whether a snapshot should be drawn, those of a previous file or older than the drawn one are dropped
+   def isCurrentSnapshot(self, snapshot):
+
+      if snapshot.getGeneration() < self.m_FileGeneration or snapshot.getVersion() <= self.m_DrawnVersions.get(snapshot.getKind(), 0):
+         return False
+
+      self.m_DrawnVersions[snapshot.getKind()] = snapshot.getVersion()
+      return True
+
+
+   # Remembers the generation of the requests made for a newly opened file
+   def startFileGeneration(self):
+      self.m_FileGeneration = self.m_Scheduler.m_Generation
+
+
+   def updateSpectrogram(self, snapshot):
+
+      if not self.isCurrentSnapshot(snapshot):
+         return
 
       # Clearing the axes values
       self.spectrogram_widget.clearAxes()
@@ -624,51 +856,178 @@ class Window(QMainWindow):
       self.freq_resp_widget.m_Figure.tight_layout()
       self.freq_resp_widget.m_Plots.set_yticks([])
 
-      # Checking if the mutex can be set
-      if self.backend.mutex.tryLock():
-         self.m_SpectrogramData = copy(value)
-         self.backend.mutex.unlock()
+      # [freq, time, spectrogram] of every channel, read only, kept without copying
+      self.m_SpectrogramData = snapshot.getData()
 
-         if self.mb_Mono:
-            self.spectrogram_widget.m_Plots.pcolormesh(self.backend.getFirstChannelTimeSegments(), self.backend.getFirstChannelFrequencySamples(), self.backend.getFirstChannelSpectrogramData(), cmap="plasma")
-         elif self.mb_Stereo:
-            self.spectrogram_widget.m_Plots[0].pcolormesh(self.m_SpectrogramData[0][1], self.m_SpectrogramData[0][0], self.m_SpectrogramData[0][2], cmap="plasma")
-            self.spectrogram_widget.m_Plots[1].pcolormesh(self.m_SpectrogramData[1][1], self.m_SpectrogramData[1][0], self.m_SpectrogramData[1][2], cmap="plasma")
+      plots = [self.spectrogram_widget.m_Plots] if self.mb_Mono else self.spectrogram_widget.m_Plots
 
-      self.spectrogram_widget.updateAxes()
+      with TRACER.span("spectrogram_image", channels=len(self.m_SpectrogramData)):
+         for plot, channel in zip(plots, self.m_SpectrogramData):
+            self.spectrogram_widget.drawSpectrogramImage(plot, channel)
 
+            # The image of a zoomed view covers the view up to half a frame and bin
+            if self.m_SpectrogramView is not None:
+               plot.set_xlim(self.m_SpectrogramView[0], self.m_SpectrogramView[1])
+               plot.set_ylim(self.m_SpectrogramView[2], self.m_SpectrogramView[3])
 
-   def updateFrequencyResponse(self, value):
+      with TRACER.span("spectrogram_draw"):
+         self.spectrogram_widget.updateAxes()
 
-      if self.mb_FileOpened:
-         # Clearing the axes values
-         self.freq_resp_widget.clearAxes()
-         self.freq_resp_widget.m_Plots.set_yticks([])
+      self.showTimings()
+
+
+   def updateFrequencyResponse(self, snapshot):
+
+      if self.mb_FileOpened and self.isCurrentSnapshot(snapshot):
+         plots = self.freq_resp_widget.m_Plots
+
+         # Envelope of the visible part of the waveform, already reduced to the plot resolution
+         time, envelope, self.m_WaveformView = snapshot.getData()
+
+         # The selector is created once for the axes of the file, so zooming keeps the selected segment.
+         # Its extents are in seconds, they follow the new limits on their own
+         if self.span is None or self.span.ax is not plots:
+            if self.span is not None:
+               self.span.disconnect_events()
+
+            self.span = SpanSelector(
+               plots,
+               self.onselect,
+               "horizontal",
+               useblit=True,
+               props=dict(alpha=0.5, facecolor="tab:blue"),
+               onmove_callback=self.onselect,
+               interactive=True,
+               drag_from_anywhere=True
+            )
+
+            self.m_WaveformArtists = []
+            plots.callbacks.connect("xlim_changed", self.onWaveformViewChanged)
+
+         # Only the envelope is replaced, clearing the axes would remove the selection with it
+         for artist in self.m_WaveformArtists:
+            artist.remove()
+         self.m_WaveformArtists = []
+
+         plots.ignore_existing_data_limits = True
+         plots.set_yticks([])
          self.freq_resp_widget.m_Figure.tight_layout()
 
-         if self.backend.mutex.tryLock():
-            self.m_FileData = copy(value[0])
-            self.m_TimeData = copy(value[1])
-            self.backend.mutex.unlock()
+         with TRACER.span("waveform_plot", points=len(time)):
+            for channel, (minimum, maximum, rms) in enumerate(envelope):
+               color = f"C{channel}"
+
+               # Single samples, the envelope collapses into the waveform itself
+               if minimum is maximum:
+                  self.m_WaveformArtists += plots.plot(time, minimum, color=color, linewidth=0.8)
+               else:
+                  self.m_WaveformArtists.append(plots.fill_between(time, minimum, maximum, color=color, alpha=0.5, linewidth=0))
+                  self.m_WaveformArtists.append(plots.fill_between(time, -rms, rms, color=color, alpha=0.8, linewidth=0))
+
+         # The view was just set from the snapshot, so the callback doesn't request it again
+         plots.set_xlim(self.m_WaveformView[0], self.m_WaveformView[1])
+
+         with TRACER.span("waveform_draw"):
+            self.freq_resp_widget.updateAxes()
+
+         self.showTimings()
+
+
+   # Zooms the waveform around the cursor
+   def onWaveformScroll(self, event):
+
+      if event.inaxes is None or self.m_WaveformView is None:
+         return
+
+      scale = 1 / self.m_WaveformZoomFactor if event.button == "up" else self.m_WaveformZoomFactor
+      xmin, xmax = event.inaxes.get_xlim()
+
+      event.inaxes.set_xlim(max(0, event.xdata - (event.xdata - xmin) * scale), event.xdata + (xmax - event.xdata) * scale)
+      self.freq_resp_widget.updateAxes()
+
+
+   # Moves the playback to the double clicked time, within the played segment
+   def onWaveformClick(self, event):
+
+      if not event.dblclick or event.inaxes is None or event.xdata is None or not self.mb_FileOpened:
+         return
+
+      self.backend.seek_audio.emit(max(0.0, event.xdata))
+
+
+   # Requests the envelope of the new visible part, at the resolution of the plot
+   def onWaveformViewChanged(self, axes):
+
+      xmin, xmax = axes.get_xlim()
+
+      if self.m_WaveformView is not None and np.allclose([xmin, xmax], self.m_WaveformView):
+         return
+
+      self.m_Scheduler.setParameter("waveform_view", [max(0.0, xmin), xmax, self.freq_resp_widget.width()])
+      self.m_Scheduler.requestCalculation("freq_response")
+
+
+   # Pixels of a single spectrogram plot, the spectrogram is calculated at about this resolution
+   def getSpectrogramPixelSize(self):
 
-         self.span = SpanSelector(
-            self.freq_resp_widget.m_Plots,
-            self.onselect,
-            "horizontal",
-            useblit=True,
-            props=dict(alpha=0.5, facecolor="tab:blue"),
-            onmove_callback=self.onselect,
-            interactive=True,
-            drag_from_anywhere=True
-         )
+      axes = self.spectrogram_widget.m_Figure.get_axes()
+      if axes:
+         extent = axes[0].get_window_extent()
+         return [max(1, int(extent.width)), max(1, int(extent.height))]
 
-         self.freq_resp_widget.m_Plots.plot(self.m_TimeData, self.m_FileData)
+      return [self.spectrogram_widget.width(), self.spectrogram_widget.height()]
 
-         self.freq_resp_widget.updateAxes()
 
+   # Sets the visible part of the spectrogram, [start, end, lowest frequency, highest frequency],
+   # None shows the whole segment. The backend calculates only the frames and bins the plot can show
+   def setSpectrogramView(self, view=None):
 
-   def updateSpectralDistribution(self):
-      print()
+      self.m_SpectrogramView = None if view is None else list(view)
+
+      self.m_Scheduler.setParameter("spectrogram_view", (view or [None] * 4) + self.getSpectrogramPixelSize())
+
+
+   # Zooms the spectrogram around the cursor, the time by default and the frequency with control held.
+   # The visible part is then recalculated at the resolution of the plot
+   def onSpectrogramScroll(self, event):
+
+      if event.inaxes is None or not self.mb_FileOpened or not event.inaxes.images:
+         return
+
+      scale = 1 / self.m_SpectrogramZoomFactor if event.button == "up" else self.m_SpectrogramZoomFactor
+      xmin, xmax = event.inaxes.get_xlim()
+      ymin, ymax = event.inaxes.get_ylim()
+
+      if event.key == "control":
+         ymin, ymax = max(0.0, event.ydata - (event.ydata - ymin) * scale), event.ydata + (ymax - event.ydata) * scale
+      else:
+         xmin, xmax = max(0.0, event.xdata - (event.xdata - xmin) * scale), event.xdata + (xmax - event.xdata) * scale
+
+      plots = [self.spectrogram_widget.m_Plots] if self.mb_Mono else self.spectrogram_widget.m_Plots
+      for plot in plots:
+         plot.set_xlim(xmin, xmax)
+         plot.set_ylim(ymin, ymax)
+      self.spectrogram_widget.updateAxes()
+
+      self.setSpectrogramView([xmin, xmax, ymin, ymax])
+      self.m_Scheduler.requestCalculation("spectrogram")
+
+
+   def updateSpectralDistribution(self, snapshot):
+
+      if self.mb_FileOpened and self.isCurrentSnapshot(snapshot):
+         self.spectral_distribution_widget.clearCanvas()
+         self.spectral_distribution_widget.addSinglePlot()
+
+         # [freq, psd] of every channel
+         with TRACER.span("spectral_distribution_plot"):
+            self.spectral_distribution_widget.createSpectralDistributionPlot(snapshot.getData())
+            self.spectral_distribution_widget.m_Figure.tight_layout()
+
+         with TRACER.span("spectral_distribution_draw"):
+            self.spectral_distribution_widget.updateAxes()
+
+         self.showTimings()
 
 
    def overlapSlider(self, value):
@@ -678,10 +1037,10 @@ class Window(QMainWindow):
       if self.mb_FileOpened:
 
          # Sets the percentile value of the overlap
-         self.backend.set_window_overlap_percentage.emit(value)
+         self.m_Scheduler.setParameter("overlap", value)
 
          # Calculating the spectrogram and making the updates visible on the screen
-         self.backend.prepare_spectrogram_data.emit()
+         self.m_Scheduler.requestCalculation("spectrogram", "spectral_distribution")
          
 
    def clearPlotWidgets(self):
@@ -691,13 +1050,20 @@ class Window(QMainWindow):
 
 
    def onselect(self, xmin, xmax):
-      #indmin, indmax = np.searchsorted(self.backend.time, (xmin, xmax))
-      indmin, indmax = self.backend.getFileTimeData().searchsorted((xmin, xmax))
-      indmax = min(len(self.backend.getFileTimeData()) - 1, indmax)
+      # The samples are found from the sampling frequency, no array of their times is searched
+      timeAxis = self.backend.getTimeAxis()
+      if timeAxis == None:
+         return
 
-      self.backend.set_file_segment.emit([int(indmin), int(indmax)])
+      indmin, indmax = getSampleIndex(timeAxis, (xmin, xmax))
+      indmax = min(timeAxis.sampleCount - 1, indmax)
 
-      self.backend.prepare_spectrogram_data.emit()
+      self.m_Scheduler.setParameter("segment", [int(indmin), int(indmax)])
+
+      # A new segment is shown as a whole
+      self.setSpectrogramView()
+
+      self.m_Scheduler.requestCalculation("spectrogram", "spectral_distribution")
 
 
    ################
@@ -733,17 +1099,102 @@ class Window(QMainWindow):
       self.backend.stop_audio.emit()
 
    def trackFastForward(self):
-      print("Fast forward the track")
+      self.backend.skip_audio.emit(PLAYBACK_SKIP_DURATION)
 
    def trackRewind(self):
-      print("Rewinding the track")
+      self.backend.skip_audio.emit(-PLAYBACK_SKIP_DURATION)
 
    ####################
    # Recorder methods #
    ####################
 
    def startOrStopAudioRecording(self, s):
-      self.backend.record_file.emit()
+      if s:
+         self.backend.record_file.emit()
+      else:
+         self.backend.stop_recording.emit()
+
+
+   # Replaces the plots with the scrolling live ones,
+   # value is [freq, channels, frames per second, waveform points per second, dynamic range of the spectrogram in dB]
+   def startLiveView(self, value):
+
+      freq, channels, frameRate, pointRate, dynamicRange = value
+
+      self.spectrogram_widget.clearCanvas()
+      self.freq_resp_widget.clearCanvas()
+
+      self.spectrogram_widget.startLiveSpectrogram(freq, channels, frameRate, dynamicRange)
+      self.freq_resp_widget.startLiveWaveform(channels, pointRate)
+
+      self.spectrogram_widget.updateAxes()
+      self.freq_resp_widget.updateAxes()
+
+
+   # Appends only the new columns, value is [[freq, time, power in dB] or None, [minimum, maximum]]
+   def updateLiveView(self, value):
+
+      frames, envelope = value
+
+      if frames is not None:
+         self.spectrogram_widget.appendLiveSpectrogram(frames[2])
+         self.spectrogram_widget.draw_idle()
+
+      self.freq_resp_widget.appendLiveWaveform(envelope)
+      self.freq_resp_widget.draw_idle()
+
+
+   # Shows the recorded audio like an opened file
+   def finishRecording(self):
+
+      self.m_RecordingAction.setChecked(False)
+
+      self.backend.get_file_status.emit()
+
+      if self.mb_FileOpened:
+         self.spectrogram_widget.clearCanvas()
+         self.freq_resp_widget.clearCanvas()
+
+         self.addFrequencyResponse()
+         self.addSpectrogram()
+
+         self.m_Scheduler.reset()
+         self.setSpectrogramView()
+         self.m_Scheduler.requestCalculation("freq_response", "spectrogram", "spectral_distribution")
+         self.startFileGeneration()
+
+
+   ##################
+   # Timing methods #
+   ##################
+
+   def setTimingsRecording(self, enabled):
+      TRACER.setEnabled(enabled)
+
+      if enabled:
+         TRACER.clear()
+         self.statusbar.showMessage("Recording timings")
+      else:
+         self.statusbar.clearMessage()
+
+
+   # Shows the latest duration of every stage
+   def showTimings(self):
+      if TRACER.isEnabled():
+         self.statusbar.showMessage(TRACER.getSummary())
+
+
+   # Messages of the backend, e.g. a spectrogram reduced to the frame budget
+   def showStatusMessage(self, message):
+      self.statusbar.showMessage(message)
+
+
+   def exportTimings(self):
+
+      name = QFileDialog.getSaveFileName(self, 'Export Timings', 'trace.json', 'Chrome trace (*.json)')
+
+      if not name[0] == '':
+         TRACER.exportChromeTrace(name[0])
 
 
    #######################################
@@ -768,17 +1219,17 @@ class Window(QMainWindow):
    def setWindowFunction(self, index):
 
       # Passing in the index argument
-      self.backend.set_window_function.emit(index)
+      self.m_Scheduler.setParameter("window_function", index)
 
-      self.backend.prepare_spectrogram_data.emit()
+      self.m_Scheduler.requestCalculation("spectrogram", "spectral_distribution")
 
 
    def setSpectrogramBand(self, index):
 
       # Passing in the index argument
-      self.backend.set_spectrogram_band.emit(index)
+      self.m_Scheduler.setParameter("spectrogram_band", index)
 
-      self.backend.prepare_spectrogram_data.emit()
+      self.m_Scheduler.requestCalculation("spectrogram", "spectral_distribution")
 
 
    def toolbarWindowFnSelector(self, index):
@@ -786,9 +1237,6 @@ class Window(QMainWindow):
 
 
 def main():
-   # A quick print environment test
-   print("Does anything even work?")
-
    # Defining the key Qt elements
    app = QApplication(sys.argv)
    window = Window()
@@ -0,0 +1,363 @@
+
+# Benchmarks of the hot paths of the app,
+# run headless on synthetic audio files
+
+
+
+###########
+# Imports #
+###########
+
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+
+
+#############
+# Constants #
+#############
+
+
+# The base case, every sweep changes one of its parameters at a time
+BASE_CASE = {"duration": 10, "sampling_frequency": 44100, "channels": 2, "band": 0, "window_function": 0, "overlap": 10}
+
+# Values swept for every parameter
+PRESETS = {
+   "quick": {
+      "duration": [1, 10, 60],
+      "sampling_frequency": [8000, 44100, 96000],
+      "channels": [1, 2],
+      "band": [0, 1],
+      "window_function": [0, 1, 2, 3],
+      "overlap": [10, 50, 90]
+   },
+   "full": {
+      "duration": [1, 10, 60, 600, 3600],
+      "sampling_frequency": [8000, 16000, 37800, 44100, 48000, 50400, 96000, 192000],
+      "channels": [1, 2, 4, 8],
+      "band": [0, 1],
+      "window_function": [0, 1, 2, 3],
+      "overlap": [10, 25, 50, 75, 90]
+   }
+}
+
+# Samples written to a synthetic file at once, bounds the memory used for hour long files
+WRITE_CHUNK = 1 << 20
+
+# Stages timed by every case, in the order they run. The view spectrogram is the one the GUI calculates,
+# at the resolution of the plot, the spectrogram before it has every frame and bin
+STAGES = ["open", "spectrogram", "render_spectrogram", "freq_response", "render_freq_response", "view_spectrogram", "render_view_spectrogram"]
+
+# Relative slowdown of a stage's median reported as a regression
+DEFAULT_THRESHOLD = 0.1
+
+
+
+###################
+# Synthetic audio #
+###################
+
+
+# Writes a 16 bit file with a chirp and some noise in every channel, the same parameters give the same file
+def writeSyntheticFile(path, duration, samplingFrequency, channels):
+
+   generator = np.random.default_rng(0)
+   sampleCount = int(duration * samplingFrequency)
+
+   with wave.open(path, "wb") as file:
+      file.setnchannels(channels)
+      file.setsampwidth(2)
+      file.setframerate(samplingFrequency)
+
+      for first in range(0, sampleCount, WRITE_CHUNK):
+         time = np.arange(first, min(first + WRITE_CHUNK, sampleCount)) / samplingFrequency
+
+         # Sweeps up to the Nyquist frequency and back every 10 s
+         phase = 2 * np.pi * samplingFrequency / 4 * (time - np.sin(2 * np.pi * time / 10) * 10 / (2 * np.pi))
+         chunk = np.empty((len(time), channels), dtype=np.int16)
+
+         for channel in range(channels):
+            samples = 0.5 * np.sin(phase * (channel + 1) / channels) + 0.05 * generator.standard_normal(len(time))
+            chunk[:, channel] = np.clip(samples * 32767, -32768, 32767)
+
+         file.writeframes(chunk.tobytes())
+
+
+# Returns the path of the synthetic file of the case, writing it if it doesn't exist yet
+def getSyntheticFile(directory, case):
+
+   path = os.path.join(directory, f"synthetic_{case['duration']}s_{case['sampling_frequency']}hz_{case['channels']}ch.wav")
+
+   if not os.path.exists(path):
+      writeSyntheticFile(path + ".tmp", case["duration"], case["sampling_frequency"], case["channels"])
+      os.replace(path + ".tmp", path)
+
+   return path
+
+
+##########
+# Sweeps #
+##########
+
+
+# Cases of a preset, one parameter differs from the base case at a time
+def createCases(preset):
+
+   cases = [dict(BASE_CASE)]
+
+   for name, values in PRESETS[preset].items():
+      for value in values:
+         case = dict(BASE_CASE, **{name: value})
+         if case not in cases:
+            cases.append(case)
+
+   return cases
+
+
+# Name identifying a case in the results of different runs
+def getCaseName(case):
+   return ",".join(f"{name}={case[name]}" for name in BASE_CASE)
+
+
+# Peak resident set size of this process, in bytes
+def getPeakMemory():
+   peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   return peak if sys.platform == "darwin" else peak * 1024
+
+
+########################
+# A case, in a process #
+########################
+
+
+# Times the stages of one case, the window is drawn by the offscreen platform.
+# Runs in its own process, so the peak memory belongs to this case only
+def runCase(case, path, repeat, render):
+
+   os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+   # Every repetition has to calculate, not read the results of the previous one from the disk
+   os.environ["SPECTROAPP_CACHE_MB"] = "0"
+
+   # Created before matplotlib selects its Qt backend, which refuses to load without a display otherwise
+   from PyQt5.QtWidgets import QApplication
+   app = QApplication(sys.argv[:1])
+
+   from backend import appWindow as gui
+
+   window = gui.Window()
+   window.setFixedSize(1280, 720)
+   backend = window.backend
+
+   # The stages are called one by one, the signals only hand over their results
+   for signal, slot in [[backend.send_spectrogram_data, window.updateSpectrogram], [backend.send_freq_response_data, window.updateFrequencyResponse]]:
+      signal.disconnect(slot)
+
+   results = {}
+   backend.send_spectrogram_data.connect(lambda value: results.__setitem__("spectrogram", value))
+   backend.send_freq_response_data.connect(lambda value: results.__setitem__("freq_response", value))
+
+   timings = {stage: [] for stage in STAGES}
+
+   # [frequencies, frames] of the calculated spectrograms
+   sizes = {}
+
+   def measure(stage, function, *args):
+      start = time.perf_counter()
+      function(*args)
+      timings[stage].append(time.perf_counter() - start)
+
+   for _ in range(repeat):
+
+      # Every repetition starts from a closed file, nothing is reused from the previous one
+      backend.closeFile()
+      backend.m_Engine.m_ResultCache.clear()
+      window.clearPlotWidgets()
+
+      measure("open", backend.openFile, path)
+      backend.setSpectrogramView(None)
+
+      backend.setSpectrogramBand(case["band"])
+      backend.setWindowFunction(case["window_function"])
+      backend.setWindowOverlapPercentage(case["overlap"])
+
+      window.mb_FileOpened = True
+      window.addFrequencyResponse()
+      window.addSpectrogram()
+
+      measure("spectrogram", backend.calculateSpectrogram)
+      sizes["spectrogram"] = list(results["spectrogram"].m_Data[0][2].shape)
+      if render:
+         measure("render_spectrogram", window.updateSpectrogram, results["spectrogram"])
+
+      measure("freq_response", backend.calculateFrequencyResponse)
+      if render:
+         measure("render_freq_response", window.updateFrequencyResponse, results["freq_response"])
+
+      # The view is calculated from nothing, as right after opening the file, not from the frames above
+      backend.m_Engine.m_Pipeline.clear()
+      backend.m_Engine.m_ResultCache.clear()
+
+      pixels = window.getSpectrogramPixelSize()
+      backend.setSpectrogramView([None] * 4 + pixels)
+
+      measure("view_spectrogram", backend.calculateSpectrogram)
+      sizes["view_pixels"] = pixels
+      sizes["view_spectrogram"] = list(results["spectrogram"].m_Data[0][2].shape)
+      if render:
+         measure("render_view_spectrogram", window.updateSpectrogram, results["spectrogram"])
+
+   state = backend.getState()
+   samples = state.file.sampleCount * len(state.file.channels)
+
+   window.close()
+   window.m_BackendThread.wait()
+   app.quit()
+
+   stages = {}
+   for stage, wallTimes in timings.items():
+      if wallTimes:
+         median = statistics.median(wallTimes)
+         stages[stage] = {"wall_times": wallTimes, "median": median, "minimum": min(wallTimes), "samples_per_second": samples / median if median > 0 else None}
+
+   return {"name": getCaseName(case), "case": case, "samples": samples, "stages": stages, "sizes": sizes, "peak_rss_bytes": getPeakMemory()}
+
+
+##################
+# Benchmark runs #
+##################
+
+
+# Runs every case of the preset in a child process and writes the results as JSON
+def runBenchmarks(arguments):
+
+   directory = arguments.data_dir or os.path.join(tempfile.gettempdir(), "spectroapp_benchmark")
+   os.makedirs(directory, exist_ok=True)
+
+   cases = createCases(arguments.preset)
+   results = []
+
+   for index, case in enumerate(cases):
+      path = getSyntheticFile(directory, case)
+
+      command = [sys.executable, os.path.abspath(__file__), "case", "--file", path, "--case", json.dumps(case), "--repeat", str(arguments.repeat)]
+      if arguments.no_render:
+         command.append("--no-render")
+
+      process = subprocess.run(command, capture_output=True, text=True)
+
+      if process.returncode != 0:
+         print(f"[{index + 1}/{len(cases)}] {getCaseName(case)} failed:\n{process.stderr}", file=sys.stderr)
+         results.append({"name": getCaseName(case), "case": case, "error": process.stderr.strip().splitlines()[-1:]})
+         continue
+
+      # The result is the last line, Qt may print warnings before it
+      result = json.loads(process.stdout.strip().splitlines()[-1])
+      results.append(result)
+
+      print(f"[{index + 1}/{len(cases)}] {result['name']}: " + ", ".join(f"{stage} {values['median'] * 1000:.1f} ms" for stage, values in result["stages"].items()), file=sys.stderr)
+
+   report = {
+      "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "preset": arguments.preset,
+      "repeat": arguments.repeat,
+      "machine": {"platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__, "cpus": os.cpu_count()},
+      "results": results
+   }
+
+   output = json.dumps(report, indent=2)
+
+   if arguments.output:
+      with open(arguments.output, "w") as file:
+         file.write(output)
+   else:
+      print(output)
+
+
+# Compares the medians of the stages of two runs, returns the amount of regressions
+def compareRuns(arguments):
+
+   with open(arguments.baseline) as file:
+      baseline = {result["name"]: result for result in json.load(file)["results"]}
+   with open(arguments.current) as file:
+      current = {result["name"]: result for result in json.load(file)["results"]}
+
+   regressions = 0
+
+   for name in itertools.chain(baseline, [name for name in current if name not in baseline]):
+      if name not in baseline or name not in current or "stages" not in baseline[name] or "stages" not in current[name]:
+         print(f"{name}: not in both runs")
+         continue
+
+      for stage in STAGES:
+         if stage not in baseline[name]["stages"] or stage not in current[name]["stages"]:
+            continue
+
+         before = baseline[name]["stages"][stage]["median"]
+         after = current[name]["stages"][stage]["median"]
+         change = after / before - 1 if before > 0 else 0.0
+
+         regression = change > arguments.threshold
+         regressions += regression
+
+         if regression or arguments.verbose:
+            print(f"{'REGRESSION' if regression else 'ok':10} {name} {stage}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms ({change:+.0%})")
+
+      memoryChange = current[name]["peak_rss_bytes"] / baseline[name]["peak_rss_bytes"] - 1
+      if memoryChange > arguments.threshold:
+         regressions += 1
+         print(f"{'REGRESSION':10} {name} peak rss: {baseline[name]['peak_rss_bytes'] >> 20} MB -> {current[name]['peak_rss_bytes'] >> 20} MB ({memoryChange:+.0%})")
+
+   print(f"{regressions} regression(s) above {arguments.threshold:.0%}")
+
+   return regressions
+
+
+def main():
+
+   parser = argparse.ArgumentParser(description="Benchmarks of loading, spectrogram calculation and plot rendering")
+   commands = parser.add_subparsers(dest="command", required=True)
+
+   run = commands.add_parser("run", help="runs the benchmarks and writes the results as JSON")
+   run.add_argument("--preset", choices=list(PRESETS), default="quick")
+   run.add_argument("--repeat", type=int, default=3)
+   run.add_argument("--output", help="JSON file of the results, printed if not given")
+   run.add_argument("--data-dir", help="directory of the synthetic files, kept between the runs")
+   run.add_argument("--no-render", action="store_true", help="skips drawing the plots")
+
+   compare = commands.add_parser("compare", help="compares two runs, fails if a stage became slower")
+   compare.add_argument("baseline")
+   compare.add_argument("current")
+   compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+   compare.add_argument("--verbose", action="store_true", help="prints the stages that didn't regress too")
+
+   case = commands.add_parser("case", help=argparse.SUPPRESS)
+   case.add_argument("--file", required=True)
+   case.add_argument("--case", required=True)
+   case.add_argument("--repeat", type=int, default=3)
+   case.add_argument("--no-render", action="store_true")
+
+   arguments = parser.parse_args()
+
+   if arguments.command == "run":
+      runBenchmarks(arguments)
+   elif arguments.command == "compare":
+      sys.exit(1 if compareRuns(arguments) else 0)
+   elif arguments.command == "case":
+      print(json.dumps(runCase(json.loads(arguments.case), arguments.file, arguments.repeat, not arguments.no_render)))
+
+if __name__ == "__main__":
+   main()
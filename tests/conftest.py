@@ -0,0 +1,10 @@
+
+#############################################################################
+# Makes the backend importable by the tests, the app runs from src/         #
+#############################################################################
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
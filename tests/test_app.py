@@ -0,0 +1,41 @@
+#############################################################################
+# The batch command rejects options out of their range before analysing    #
+# anything, and analyses the files with the ones in range                   #
+#############################################################################
+
+
+from scipy.io import wavfile
+import numpy as np
+import pytest
+
+import app
+
+
+
+def createRecording(directory):
+   samples = (np.random.default_rng(0).standard_normal(8000) * 8000).astype(np.int16)
+   wavfile.write(str(directory / "recording.wav"), 8000, samples)
+   return str(directory / "recording.wav")
+
+
+@pytest.mark.parametrize("overlap", ["0", "-5", "101", "1000"])
+def test_batch_rejects_overlap_out_of_range(tmp_path, capsys, overlap):
+
+   recording = createRecording(tmp_path)
+
+   with pytest.raises(SystemExit) as exit:
+      app.batch([recording, "--output", str(tmp_path / "results"), "--overlap", overlap])
+
+   assert exit.value.code == 2
+   assert "overlap" in capsys.readouterr().err
+   assert not (tmp_path / "results").exists()
+
+
+@pytest.mark.parametrize("overlap", ["1", "50", "100"])
+def test_batch_takes_overlap_in_range(tmp_path, overlap):
+
+   recording = createRecording(tmp_path)
+
+   assert app.batch([recording, "--output", str(tmp_path / "results"), "--format", "npz", "--overlap", overlap, "--workers", "1"]) == 0
+
+   assert int(np.load(str(tmp_path / "results" / "recording.npz"))["overlap_percentage"]) == int(overlap)
@@ -0,0 +1,157 @@
+#############################################################################
+# The scheduler collapses the requests made while the backend is busy into  #
+# one job of the newest parameters, and a newer request makes the running   #
+# job stale, so it is abandoned and its calculations run in the next job    #
+#############################################################################
+
+
+from PyQt5.QtCore import QObject, pyqtSignal
+import pytest
+
+from backend.logic.computeScheduler import ComputeScheduler
+from backend.logic.spectrogramEngine import CalculationCancelled
+
+
+
+# Stands in for appLogic, the jobs are held until the test runs them.
+# Connected directly, as both live in the thread of the test
+class Backend(QObject):
+
+   run_job = pyqtSignal(dict)
+   job_finished = pyqtSignal(list)
+
+   def __init__(self):
+      super().__init__()
+
+      self.m_RequestedGeneration = 0
+      self.m_RunningGeneration = None
+
+      # Jobs received and the calculations that ran to the end
+      self.m_Jobs = []
+      self.m_Finished = []
+
+      self.run_job.connect(self.m_Jobs.append)
+
+
+   def setRequestedGeneration(self, generation):
+      self.m_RequestedGeneration = generation
+
+
+   # The same rule as appLogic.checkCancelled
+   def checkCancelled(self):
+      if self.m_RunningGeneration is not None and self.m_RunningGeneration != self.m_RequestedGeneration:
+         raise CalculationCancelled()
+
+
+   # Runs the calculations of the latest job as appLogic.runJob does, calling interrupt before each of them
+   def runLatestJob(self, interrupt=None):
+
+      job = self.m_Jobs[-1]
+      self.m_RunningGeneration = job["generation"]
+      abandoned = []
+
+      for index, calculation in enumerate(job["calculations"]):
+         try:
+            if interrupt != None:
+               interrupt(calculation)
+            self.checkCancelled()
+            self.m_Finished.append([job["generation"], calculation])
+         except CalculationCancelled:
+            abandoned = job["calculations"][index:]
+            break
+
+      self.m_RunningGeneration = None
+      self.job_finished.emit(abandoned)
+
+
+def test_requests_while_busy_coalesce_into_the_newest():
+
+   backend = Backend()
+   scheduler = ComputeScheduler(backend)
+
+   scheduler.setParameter("overlap", 10)
+   scheduler.requestCalculation("spectrogram")
+   assert len(backend.m_Jobs) == 1
+
+   # The slider moving while the first job runs
+   for overlap in range(20, 60, 10):
+      scheduler.setParameter("overlap", overlap)
+      scheduler.requestCalculation("spectrogram", "spectral_distribution")
+   scheduler.setParameter("segment", [0, 1000])
+   scheduler.requestCalculation("freq_response")
+
+   assert len(backend.m_Jobs) == 1
+
+   backend.runLatestJob()
+
+   # The first one was superseded by the later requests and only the newest one runs afterwards
+   assert len(backend.m_Jobs) == 2
+   job = backend.m_Jobs[1]
+   assert job["generation"] == scheduler.m_Generation
+   assert job["parameters"] == [["overlap", 50], ["segment", [0, 1000]]]
+   assert job["calculations"] == ["freq_response", "spectrogram", "spectral_distribution"]
+
+   backend.runLatestJob()
+   assert not scheduler.mb_Busy
+   assert len(backend.m_Jobs) == 2
+
+
+def test_superseded_job_is_abandoned_and_requested_again():
+
+   backend = Backend()
+   scheduler = ComputeScheduler(backend)
+
+   scheduler.requestCalculation("freq_response", "spectrogram", "spectral_distribution")
+
+   # A newer request arrives while the job is calculating the spectrogram
+   def interrupt(calculation):
+      if calculation == "spectrogram" and len(backend.m_Jobs) == 1:
+         scheduler.setParameter("overlap", 75)
+         scheduler.requestCalculation("freq_response")
+
+   backend.runLatestJob(interrupt)
+
+   # Nothing after the frequency response ran for the stale generation
+   assert backend.m_Finished == [[1, "freq_response"]]
+
+   # The abandoned calculations run in the next job together with the new one
+   job = backend.m_Jobs[1]
+   assert job["generation"] == 2
+   assert job["parameters"] == [["overlap", 75]]
+   assert job["calculations"] == ["freq_response", "spectrogram", "spectral_distribution"]
+
+   backend.runLatestJob()
+   assert [generation for generation, _ in backend.m_Finished[1:]] == [2, 2, 2]
+
+
+def test_cancel_drops_the_pending_requests():
+
+   backend = Backend()
+   scheduler = ComputeScheduler(backend)
+
+   scheduler.requestCalculation("spectrogram")
+   scheduler.setParameter("overlap", 75)
+   scheduler.requestCalculation("spectral_distribution")
+
+   # E.g. another file is opened while the job runs
+   scheduler.cancel()
+
+   backend.m_RunningGeneration = backend.m_Jobs[0]["generation"]
+   with pytest.raises(CalculationCancelled):
+      backend.checkCancelled()
+   backend.m_RunningGeneration = None
+
+   backend.job_finished.emit([])
+
+   assert len(backend.m_Jobs) == 1
+   assert not scheduler.mb_Busy
+
+
+def test_unknown_requests_are_rejected():
+
+   scheduler = ComputeScheduler(Backend())
+
+   with pytest.raises(ValueError):
+      scheduler.setParameter("colour", 1)
+   with pytest.raises(ValueError):
+      scheduler.requestCalculation("waveform")
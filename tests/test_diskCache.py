@@ -0,0 +1,128 @@
+#############################################################################
+# The disk cache finds entries by the hash of their key, evicts the least   #
+# recently used ones over its size and takes damaged entries as missing     #
+#############################################################################
+
+
+import os
+import time
+
+import numpy as np
+
+from backend.logic import diskCache
+from backend.logic.diskCache import DiskCache
+
+
+
+def createArrays(seed=0, values=1000):
+   return [np.random.default_rng(seed).standard_normal(values), np.arange(seed, seed + 10)]
+
+
+def test_entries_are_found_by_the_hash_of_the_key(tmp_path):
+
+   cache = DiskCache(str(tmp_path), maxBytes=1024 * 1024)
+   arrays = createArrays()
+
+   cache.put(("file", 1, "hann", 256), arrays)
+
+   # The same key from another instance, e.g. the next run of the app
+   stored = DiskCache(str(tmp_path), maxBytes=1024 * 1024).get(("file", 1, "hann", 256))
+
+   assert len(stored) == len(arrays)
+   for storedArray, array in zip(stored, arrays):
+      assert np.array_equal(storedArray, array)
+      assert not storedArray.flags.writeable
+
+   assert cache.get(("file", 1, "hann", 512)) == None
+   assert cache.getEntryName(("file", 1)) == cache.getEntryName(["file", 1])
+   assert cache.getEntryName(("file", 1)) != cache.getEntryName(("file", "1"))
+   assert os.path.isdir(cache.getEntryPath(cache.getEntryName(("file", 1, "hann", 256))))
+
+
+def test_format_change_makes_entries_unreachable(tmp_path, monkeypatch):
+
+   cache = DiskCache(str(tmp_path), maxBytes=1024 * 1024)
+   cache.put(("file",), createArrays())
+
+   monkeypatch.setattr(diskCache, "DISK_CACHE_FORMAT", diskCache.DISK_CACHE_FORMAT + 1)
+
+   assert cache.get(("file",)) == None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+
+   entryBytes = sum(array.nbytes for array in createArrays())
+   cache = DiskCache(str(tmp_path), maxBytes=int(3.5 * entryBytes))
+
+   for entry in range(3):
+      cache.put(("entry", entry), createArrays(entry))
+      # Distinct times of use, the file system may round them
+      os.utime(cache.getEntryPath(cache.getEntryName(("entry", entry))), (time.time() - 100 + entry, time.time() - 100 + entry))
+
+   # The oldest entry is used again, so the second one is the least recently used
+   assert cache.get(("entry", 0)) != None
+
+   cache.put(("entry", 3), createArrays(3))
+
+   assert cache.contains(("entry", 0))
+   assert not cache.contains(("entry", 1))
+   assert cache.contains(("entry", 2))
+   assert cache.contains(("entry", 3))
+   assert cache.countUsedBytes() <= cache.m_MaxBytes
+
+   # A smaller size evicts down to it at once, the most recently used entry is kept
+   cache.setMaxBytes(2 * entryBytes)
+   assert [cache.contains(("entry", entry)) for entry in range(4)] == [False, False, False, True]
+
+
+def test_arrays_bigger_than_the_cache_are_not_stored(tmp_path):
+
+   cache = DiskCache(str(tmp_path), maxBytes=1000)
+   cache.put(("big",), createArrays())
+
+   assert not cache.contains(("big",))
+
+
+def test_damaged_entries_are_missing_and_rewritten(tmp_path):
+
+   cache = DiskCache(str(tmp_path), maxBytes=1024 * 1024)
+   arrays = createArrays()
+
+   cache.put(("truncated",), arrays)
+   cache.put(("corrupt",), arrays)
+
+   # A write cut off in the middle of the data, and one whose header is garbage
+   truncatedFile = os.path.join(cache.getEntryPath(cache.getEntryName(("truncated",))), "0.npy")
+   with open(truncatedFile, "r+b") as file:
+      file.truncate(os.path.getsize(truncatedFile) // 2)
+
+   with open(os.path.join(cache.getEntryPath(cache.getEntryName(("corrupt",))), "0.npy"), "wb") as file:
+      file.write(b"not an array")
+
+   assert cache.get(("truncated",)) == None
+   assert cache.get(("corrupt",)) == None
+   assert cache.m_Misses == 2
+
+   cache.put(("truncated",), arrays)
+   assert np.array_equal(cache.get(("truncated",))[0], arrays[0])
+
+
+def test_interrupted_writes_are_not_read_and_removed_once_stale(tmp_path):
+
+   cache = DiskCache(str(tmp_path), maxBytes=1024 * 1024)
+   path = cache.getEntryPath(cache.getEntryName(("interrupted",)))
+
+   # What a write killed before the rename leaves behind
+   temporary = path + ".1234" + diskCache.TEMPORARY_SUFFIX
+   os.makedirs(temporary)
+   np.save(os.path.join(temporary, "0.npy"), createArrays()[0])
+
+   assert cache.get(("interrupted",)) == None
+   assert cache.listEntries() == []
+   assert os.path.isdir(temporary)
+
+   staleTime = time.time() - diskCache.STALE_TEMPORARY_SECONDS - 1
+   os.utime(temporary, (staleTime, staleTime))
+
+   cache.listEntries()
+   assert not os.path.exists(temporary)
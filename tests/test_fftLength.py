@@ -0,0 +1,51 @@
+#############################################################################
+# Window lengths with a large prime factor are zero padded to a fast FFT    #
+# length, the ones made of small primes are transformed as they are         #
+#############################################################################
+
+
+from scipy import signal
+import numpy as np
+
+from backend.logic.spectrogramEngine import SpectrogramEngine, calculateFftLength, calculateWindowParameters, getLargestPrimeFactor, SPECTROGRAM_BANDS, DEFAULT_WINDOW_OVERLAP_PERCENTAGE, LARGEST_FAST_FACTOR
+
+
+
+def test_wide_band_at_37800_hz_is_padded_to_480():
+
+   windowLength = calculateWindowParameters(37800, SPECTROGRAM_BANDS[1], DEFAULT_WINDOW_OVERLAP_PERCENTAGE)[2]
+
+   assert windowLength == 453
+   assert getLargestPrimeFactor(453) == 151
+   assert calculateFftLength(453) == 480
+   assert calculateFftLength(453, padding=False) == 453
+
+
+def test_lengths_of_small_primes_are_not_padded():
+
+   for windowLength in [256, 441, 480, 882, 1000, 2 * 3 * 5 * 7 * 11, 23 * 23]:
+      assert getLargestPrimeFactor(windowLength) <= LARGEST_FAST_FACTOR
+      assert calculateFftLength(windowLength) == windowLength
+
+   # Just over the largest fast factor
+   assert calculateFftLength(29 * 16) > 29 * 16
+
+
+def test_padded_frames_are_the_spectrogram_of_the_padded_fft():
+
+   engine = SpectrogramEngine()
+   engine.setPrecision("float64")
+   engine.setSpectrogramBand(1)
+
+   data = np.random.default_rng(0).standard_normal((37800, 1))
+   engine.loadData(data, 37800)
+   state = engine.getState()
+
+   assert state.windowLength == 453
+   assert state.fftLength == 480
+
+   freq, _, expected = signal.spectrogram(data.T, 37800, window=engine.getWindow(), nperseg=453, noverlap=state.windowOverlap, nfft=480, axis=-1)
+   power = engine.getSegmentFrames(state)[2]
+
+   assert power.shape[1] == 241
+   assert np.allclose(power, expected, rtol=1e-12, atol=0)
@@ -0,0 +1,94 @@
+
+#############################################################################
+# The frame cache keeps the memory of its blocks under the cap while the    #
+# segment moves, and the frames stay the same as signal.spectrogram gives   #
+#############################################################################
+
+
+from scipy import signal
+import numpy as np
+
+from backend.logic.frameCache import FrameCache
+from backend.logic.spectrogramEngine import SpectrogramEngine
+
+
+
+SAMPLING_FREQUENCY = 8000
+WINDOW_LENGTH = 256
+WINDOW_OVERLAP = 128
+
+
+def createData(seconds=60, channels=2):
+   return np.random.default_rng(0).standard_normal((seconds * SAMPLING_FREQUENCY, channels)).astype(np.float32)
+
+
+def createFrameCache(maxBytes):
+   frameCache = FrameCache(framesPerBlock=64, maxBytes=maxBytes)
+   frameCache.configure("key", signal.get_window("tukey", WINDOW_LENGTH), WINDOW_LENGTH, WINDOW_OVERLAP, SAMPLING_FREQUENCY)
+   return frameCache
+
+
+def test_blocks_stay_under_the_cap():
+
+   data = createData()
+   frameCache = createFrameCache(maxBytes=1024 * 1024)
+   blockBytes = data.shape[1] * (WINDOW_LENGTH // 2 + 1) * 64 * 8
+
+   frameCount = frameCache.getFrameCount(len(data))
+
+   for firstFrame in range(0, frameCount - 400, 250):
+      frameCache.getFrames(data, firstFrame, firstFrame + 400)
+      assert frameCache.getUsedBytes() <= 1024 * 1024
+
+   # The cache filled up, so blocks were evicted rather than never kept
+   assert frameCache.getUsedBytes() > 1024 * 1024 - blockBytes
+
+
+def test_frames_survive_eviction():
+
+   data = createData(seconds=10)
+   frameCache = createFrameCache(maxBytes=64 * 1024)
+
+   _, _, expected = signal.spectrogram(data.T, SAMPLING_FREQUENCY, window=frameCache.m_Window, nperseg=WINDOW_LENGTH, noverlap=WINDOW_OVERLAP, axis=-1)
+
+   # More frames than the cache holds, and again after the first ones were evicted
+   for _ in range(2):
+      frames = frameCache.getFrames(data, 0, expected.shape[2])
+      assert np.allclose(frames, expected)
+
+
+def test_engine_bounds_the_frame_cache_by_the_frame_budget():
+
+   budget = 4 * 1024 * 1024
+
+   engine = SpectrogramEngine(frameBudgetBytes=budget)
+   engine.loadData(createData(seconds=300), SAMPLING_FREQUENCY)
+
+   sampleCount = engine.getState().file.sampleCount
+   segmentLength = sampleCount // 8
+
+   for segment in range(8):
+      engine.setFileSegment([segment * segmentLength, (segment + 1) * segmentLength])
+      engine.calculateSpectrogram()
+      assert engine.m_Pipeline.getStoredResult("frameCache").getUsedBytes() <= budget
+
+   engine.setFrameBudget(budget // 4)
+   assert engine.m_Pipeline.getStoredResult("frameCache").getUsedBytes() <= budget // 4
+
+
+def test_cached_blocks_count_into_the_frame_budget():
+
+   budget = 4 * 1024 * 1024
+
+   engine = SpectrogramEngine(frameBudgetBytes=budget)
+   engine.loadData(createData(seconds=300), SAMPLING_FREQUENCY)
+
+   # Fills the frame cache, then a view needs room next to it
+   sampleCount = engine.getState().file.sampleCount
+   engine.setFileSegment([0, sampleCount // 8])
+   engine.calculateSpectrogram()
+
+   engine.setFileSegment([0, sampleCount])
+   frames = engine.calculateViewSpectrogram(1000, 100)[0][2].shape[1]
+
+   assert engine.m_Pipeline.getStoredResult("frameCache").getUsedBytes() + frames * engine.getFrameBytes() <= budget
@@ -0,0 +1,93 @@
+#############################################################################
+# Recorded samples pass the ring buffer unchanged across its wrap around,   #
+# and the live spectrogram fed in uneven pieces gives the frames of one     #
+# signal.spectrogram over the whole recording                               #
+#############################################################################
+
+
+from scipy import signal
+import numpy as np
+
+from backend.logic.ringBuffer import RingBuffer
+from backend.logic.liveSpectrogram import LiveSpectrogram
+
+
+
+SAMPLING_FREQUENCY = 8000
+WINDOW_LENGTH = 256
+WINDOW_OVERLAP = 128
+
+
+def createSamples(count=20000, channels=2):
+   return np.random.default_rng(0).standard_normal((count, channels)).astype(np.float32)
+
+
+# Splits the samples into pieces of uneven lengths, as the audio callback delivers them
+def splitUnevenly(samples, lengths=(1, 37, 100, 255, 513, 1000)):
+   pieces = []
+   position = 0
+   while position < len(samples):
+      length = lengths[len(pieces) % len(lengths)]
+      pieces.append(samples[position:position + length])
+      position += length
+   return pieces
+
+
+def test_ring_buffer_wraps_around():
+
+   samples = createSamples()
+   ringBuffer = RingBuffer(1000, 2)
+
+   received = []
+   for piece in splitUnevenly(samples):
+      ringBuffer.write(piece)
+      # Partial reads, the consumer reads after some of the writes only
+      if ringBuffer.available() > 300:
+         received.append(ringBuffer.read())
+   received.append(ringBuffer.read())
+
+   assert ringBuffer.m_WritePosition > 10 * ringBuffer.m_Capacity
+   assert ringBuffer.m_Overruns == 0
+   assert np.array_equal(np.concatenate(received), samples)
+   assert len(ringBuffer.read()) == 0
+
+
+def test_ring_buffer_overrun_keeps_the_newest_samples():
+
+   samples = createSamples(count=2500)
+   ringBuffer = RingBuffer(1000, 2)
+
+   ringBuffer.write(samples[:700])
+   ringBuffer.write(samples[700:])
+
+   assert np.array_equal(ringBuffer.read(), samples[-1000:])
+   assert ringBuffer.m_Overruns == 1500
+
+   # A single write longer than the capacity
+   ringBuffer.write(samples)
+   assert np.array_equal(ringBuffer.read(), samples[-1000:])
+
+
+def test_live_frames_equal_the_spectrogram():
+
+   samples = createSamples()
+   window = signal.get_window("hann", WINDOW_LENGTH)
+
+   liveSpectrogram = LiveSpectrogram(SAMPLING_FREQUENCY, window, WINDOW_LENGTH, WINDOW_OVERLAP, 2)
+   ringBuffer = RingBuffer(1000, 2)
+
+   times = []
+   frames = []
+   for piece in splitUnevenly(samples):
+      ringBuffer.write(piece)
+      result = liveSpectrogram.process(ringBuffer.read())
+      # Pieces shorter than the hop complete no frame
+      if result != None:
+         times.append(result[1])
+         frames.append(result[2])
+
+   _, expectedTime, expected = signal.spectrogram(samples.T, SAMPLING_FREQUENCY, window=window, nperseg=WINDOW_LENGTH, noverlap=WINDOW_OVERLAP, axis=-1)
+
+   assert liveSpectrogram.m_FrameCount == expected.shape[2]
+   assert np.allclose(np.concatenate(times), expectedTime)
+   assert np.allclose(np.concatenate(frames, axis=2), expected, rtol=1e-5)
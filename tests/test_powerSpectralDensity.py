@@ -0,0 +1,82 @@
+#############################################################################
+# The spectral distribution averaged from the cached frames is Welch's      #
+# method, and over the frame budget it averages every so many frames        #
+#############################################################################
+
+
+from scipy import signal
+import numpy as np
+
+from backend.logic.spectrogramEngine import SpectrogramEngine, DENSITY_CHUNK_BLOCKS
+from backend.logic.frameCache import FRAMES_PER_BLOCK
+
+
+
+SAMPLING_FREQUENCY = 8000
+
+# More frames than one chunk of the average, so several chunks are summed
+SEGMENT_FRAMES = DENSITY_CHUNK_BLOCKS * FRAMES_PER_BLOCK + 1000
+
+
+def createEngine(frameBudgetBytes=None):
+
+   engine = SpectrogramEngine(frameBudgetBytes=frameBudgetBytes)
+   engine.setPrecision("float64")
+
+   # The window follows the sampling frequency, a second of silence gives its hop
+   engine.loadData(np.zeros((SAMPLING_FREQUENCY, 2)), SAMPLING_FREQUENCY)
+   state = engine.getState()
+   hop = state.windowLength - state.windowOverlap
+
+   data = np.random.default_rng(0).standard_normal(((SEGMENT_FRAMES + 200) * hop, 2))
+   engine.loadData(data, SAMPLING_FREQUENCY)
+
+   return engine, data
+
+
+# Segment starting on a frame and ending with one, so its frames are the ones of the file
+def setAlignedSegment(engine):
+
+   state = engine.getState()
+   hop = state.windowLength - state.windowOverlap
+
+   firstSample = 37 * hop
+   engine.setFileSegment([firstSample, firstSample + (SEGMENT_FRAMES - 1) * hop + state.windowLength])
+
+   return engine.getState()
+
+
+def test_density_equals_welch():
+
+   engine, data = createEngine()
+   state = setAlignedSegment(engine)
+
+   freq, expected = signal.welch(data[state.firstSample:state.lastSample].T, SAMPLING_FREQUENCY, window=engine.getWindow(), nperseg=state.windowLength, noverlap=state.windowOverlap, nfft=state.fftLength, axis=-1)
+
+   result = engine.calculatePowerSpectralDensity()
+
+   for channel in range(data.shape[1]):
+      assert np.array_equal(result[channel][0], freq)
+      assert np.allclose(result[channel][1], expected[channel], rtol=1e-12, atol=0)
+
+
+def test_density_over_the_budget_averages_strided_frames():
+
+   engine, data = createEngine(frameBudgetBytes=1024 * 1024)
+   state = setAlignedSegment(engine)
+
+   allowedFrames = engine.getAllowedFrameCount()
+   assert engine.getSegmentFrameCount() > allowedFrames
+
+   _, _, frames = signal.spectrogram(data[state.firstSample:state.lastSample].T, SAMPLING_FREQUENCY, window=engine.getWindow(), nperseg=state.windowLength, noverlap=state.windowOverlap, nfft=state.fftLength, axis=-1)
+
+   stride = -(-SEGMENT_FRAMES // allowedFrames)
+   expected = frames[:, :, ::stride].mean(axis=2)
+
+   result = engine.calculatePowerSpectralDensity()
+
+   for channel in range(data.shape[1]):
+      assert np.allclose(result[channel][1], expected[channel], rtol=1e-12, atol=0)
+
+   # Strided, not the mean of every frame
+   assert not np.allclose(result[0][1], frames[0].mean(axis=1), rtol=1e-12, atol=0)
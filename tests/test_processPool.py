@@ -0,0 +1,88 @@
+#############################################################################
+# The worker processes give the same frames as the frame cache calculates  #
+# in the backend thread, and the pool closes while a calculation is running #
+#############################################################################
+
+
+import concurrent.futures
+import os
+import threading
+
+from scipy import signal
+import numpy as np
+
+from backend.logic import processPool
+from backend.logic.frameCache import FrameCache
+from backend.logic.processPool import ProcessPool
+
+
+
+SAMPLING_FREQUENCY = 8000
+WINDOW_LENGTH = 256
+WINDOW_OVERLAP = 128
+FRAMES_PER_BLOCK = 64
+
+
+def createData(seconds=10, channels=2):
+   return np.random.default_rng(0).standard_normal((seconds * SAMPLING_FREQUENCY, channels)).astype(np.float32)
+
+
+def createFrameCache():
+   frameCache = FrameCache(framesPerBlock=FRAMES_PER_BLOCK)
+   frameCache.configure("key", signal.get_window("tukey", WINDOW_LENGTH), WINDOW_LENGTH, WINDOW_OVERLAP, SAMPLING_FREQUENCY)
+   return frameCache
+
+
+def getSharedBlocks():
+   return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_pooled_frames_equal_the_blocks(monkeypatch):
+
+   data = createData(seconds=20)
+   frameCache = createFrameCache()
+
+   # Small shared parts, so the range is shared and calculated in several of them
+   monkeypatch.setattr(processPool, "MAX_SHARED_SAMPLE_BYTES", 64 * 1024)
+
+   pool = ProcessPool(workers=2)
+   try:
+      firstBlock, lastBlock = 3, 11
+      power = pool.calculateFrames("file", data, frameCache.m_Window, WINDOW_LENGTH, WINDOW_OVERLAP, SAMPLING_FREQUENCY, firstBlock * FRAMES_PER_BLOCK, lastBlock * FRAMES_PER_BLOCK)
+
+      expected = np.concatenate([frameCache.calculateBlock(data, block) for block in range(firstBlock, lastBlock)], axis=-1)
+
+      assert power.shape == expected.shape
+      assert np.array_equal(power, expected)
+   finally:
+      pool.close()
+
+
+def test_pool_closes_while_calculating():
+
+   data = createData(seconds=120)
+   frameCache = createFrameCache()
+   before = getSharedBlocks()
+
+   pool = ProcessPool(workers=2)
+   started = threading.Event()
+   errors = []
+
+   def calculate():
+      try:
+         pool.calculateFrames("file", data, frameCache.m_Window, WINDOW_LENGTH, WINDOW_OVERLAP, SAMPLING_FREQUENCY, 0, frameCache.getFrameCount(len(data)), started.set)
+      except Exception as error:
+         errors.append(error)
+
+   thread = threading.Thread(target=calculate)
+   thread.start()
+
+   assert started.wait(60)
+   pool.close()
+
+   thread.join(60)
+   assert not thread.is_alive()
+
+   # Abandoned or finished, either way no shared block is left behind
+   assert getSharedBlocks() <= before
+   assert all(isinstance(error, (concurrent.futures.CancelledError, RuntimeError)) for error in errors)
@@ -0,0 +1,79 @@
+#############################################################################
+# The result cache keeps the most recently used results within its byte     #
+# budget and hands out read only arrays                                     #
+#############################################################################
+
+
+import numpy as np
+import pytest
+
+from backend.logic.resultCache import ResultCache
+
+
+
+# A result of the given size, shaped like a spectrogram of one channel, [freq, time, power]
+def createResult(kilobytes):
+   return [np.zeros(16), np.zeros(16), np.zeros(kilobytes * 128 - 32)]
+
+
+def test_least_recently_used_results_are_evicted():
+
+   cache = ResultCache(maxBytes=3 * 1024)
+
+   for key in "abc":
+      cache.put(key, createResult(1))
+
+   # Using the oldest result makes the second one the least recently used
+   assert cache.get("a") != None
+
+   cache.put("d", createResult(1))
+
+   assert "a" in cache and "c" in cache and "d" in cache
+   assert "b" not in cache
+   assert cache.m_UsedBytes == 3 * 1024
+
+   # Replacing a result counts its size once
+   cache.put("d", createResult(2))
+   assert cache.m_UsedBytes <= 3 * 1024
+   assert "d" in cache and "b" not in cache
+
+
+def test_results_bigger_than_the_budget_are_not_stored():
+
+   cache = ResultCache(maxBytes=1024)
+   cache.put("a", createResult(1))
+   cache.put("big", createResult(2))
+
+   assert "big" not in cache
+   assert "a" in cache
+   assert cache.get("big") == None
+   assert cache.m_Misses == 1
+
+
+def test_smaller_budget_evicts_at_once():
+
+   cache = ResultCache(maxBytes=4 * 1024)
+
+   for key in "abcd":
+      cache.put(key, createResult(1))
+
+   cache.setMaxBytes(2 * 1024)
+
+   assert len(cache) == 2
+   assert "c" in cache and "d" in cache
+   assert cache.m_UsedBytes == 2 * 1024
+
+   cache.setMaxBytes(0)
+   assert len(cache) == 0
+   assert cache.m_UsedBytes == 0
+
+
+def test_stored_arrays_are_read_only():
+
+   cache = ResultCache()
+   result = createResult(1)
+   cache.put("a", result)
+
+   for array in cache.get("a"):
+      with pytest.raises(ValueError):
+         array[0] = 1
@@ -0,0 +1,55 @@
+#############################################################################
+# The spectrogram streamed chunk by chunk into the store is the same, bit   #
+# for bit, as one signal.spectrogram over the whole signal                  #
+#############################################################################
+
+
+from scipy import signal
+from scipy.io import wavfile
+import numpy as np
+
+from backend.logic import batchAnalysis, streamingStft
+
+
+
+SAMPLING_FREQUENCY = 8000
+WINDOW_LENGTH = 256
+WINDOW_OVERLAP = 192
+
+
+def createData(samples=100000, channels=2):
+   return np.random.default_rng(0).standard_normal((samples, channels))
+
+
+def test_streamed_frames_equal_the_spectrogram(tmp_path):
+
+   data = createData()
+   window = signal.get_window("hann", WINDOW_LENGTH)
+
+   expectedFreq, expectedTime, expected = signal.spectrogram(data.T, SAMPLING_FREQUENCY, window=window, nperseg=WINDOW_LENGTH, noverlap=WINDOW_OVERLAP, axis=-1)
+
+   # Chunks that don't divide the frames, so the overlap is carried over and the last chunk is shorter
+   freq, time, store = streamingStft.calculateStreamingSpectrogram(data, SAMPLING_FREQUENCY, window, WINDOW_LENGTH, WINDOW_OVERLAP, str(tmp_path / "frames.npy"), chunkFrames=100)
+
+   assert np.array_equal(freq, expectedFreq)
+   assert np.allclose(time, expectedTime)
+   assert np.array_equal(store, expected)
+
+   assert np.array_equal(streamingStft.openSpectrogramStore(str(tmp_path / "frames.npy")), expected)
+
+
+def test_batch_writes_the_frames_of_the_whole_file(tmp_path):
+
+   data = (createData(channels=1)[:, 0] * 8000).astype(np.int16)
+   wavfile.write(str(tmp_path / "long.wav"), SAMPLING_FREQUENCY, data)
+
+   # A frame budget far below the frames of the file, the picture and the arrays get a reduced spectrogram
+   parameters = batchAnalysis.createParameters(precision="float64", frameBudget=0.1)
+   result = batchAnalysis.analyseFile(str(tmp_path / "long.wav"), str(tmp_path / "long"), parameters, ["npz", "npy"])
+
+   frames = np.load(str(tmp_path / "long.npy"))
+   arrays = np.load(str(tmp_path / "long.npz"))
+
+   assert "reduced_from_frames" in result
+   assert frames.shape == (1, arrays["freq"].size, result["reduced_from_frames"])
+   assert not (tmp_path / "long.npy.tmp").exists()
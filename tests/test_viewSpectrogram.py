@@ -0,0 +1,73 @@
+#############################################################################
+# The view spectrogram has about one frame and one bin per pixel, and the   #
+# merged bins take their maximum, so a narrow peak keeps its level          #
+#############################################################################
+
+
+import numpy as np
+
+from backend.logic.spectrogramEngine import SpectrogramEngine
+
+
+
+SAMPLING_FREQUENCY = 8000
+
+# Tone between two bins, its power falls into a few of them only
+TONE_FREQUENCY = 1234.5
+
+
+def createEngine(seconds=60):
+
+   time = np.arange(seconds * SAMPLING_FREQUENCY) / SAMPLING_FREQUENCY
+   noise = 0.01 * np.random.default_rng(0).standard_normal(len(time))
+
+   engine = SpectrogramEngine()
+   engine.setPrecision("float64")
+   engine.loadData(np.stack((np.sin(2 * np.pi * TONE_FREQUENCY * time) + noise, noise), axis=1), SAMPLING_FREQUENCY)
+
+   return engine
+
+
+def test_view_has_a_frame_and_a_bin_per_pixel():
+
+   engine = createEngine()
+   frames = engine.getSegmentFrameCount()
+   bins = engine.getState().fftLength // 2 + 1
+
+   width, height = 500, 100
+   result = engine.calculateViewSpectrogram(width, height)
+
+   stride = frames // width
+   group = bins // height
+
+   assert len(result) == 2
+   for freq, time, power in result:
+      assert power.shape == (len(freq), len(time))
+      assert len(time) == -(-frames // stride)
+      assert len(freq) == -(-bins // group)
+      assert width <= len(time) < 2 * width
+      assert height <= len(freq) < 2 * height
+
+   # A view smaller than the segment is the full resolution, nothing to merge
+   assert engine.calculateViewSpectrogram(frames * 2, bins * 2)[0][2].shape == (bins, frames)
+
+
+def test_merged_bins_keep_the_peaks():
+
+   engine = createEngine()
+   freq, time, full = engine.calculateSpectrogram()[0]
+
+   width, height = 500, 60
+   viewFreq, viewTime, view = engine.calculateViewSpectrogram(width, height)[0]
+
+   stride = len(time) // width
+   group = len(freq) // height
+   expected = np.maximum.reduceat(full[:, ::stride], np.arange(0, len(freq), group), axis=0)
+
+   assert np.allclose(view, expected)
+
+   # The tone stays as loud as at the full resolution, an average of the bins would lower it
+   toneBin = np.argmin(np.abs(viewFreq - TONE_FREQUENCY))
+   assert abs(viewFreq[toneBin] - TONE_FREQUENCY) <= group * (freq[1] - freq[0])
+   assert np.allclose(view[toneBin], full[:, ::stride].max(axis=0))
+   assert view[toneBin].min() > full[:, ::stride].mean(axis=0).max()